@@ -0,0 +1,196 @@
+"""Time every entry point on a generated repository
+
+Usage:
+    benchmark.py [--commits=<n>] [--deploy-every=<n>] [--patch-every=<n>] [--branches=<n>] [--merge-every=<n>] [--repeat=<n>] [--output=<file>] [--compare=<file>] [<path_to_git_repo>]
+    benchmark.py (-h | --help)
+
+Options:
+    --commits=<n>       commits on master [default: 5000]
+    --deploy-every=<n>  commits between deploy tags [default: 20]
+    --patch-every=<n>   deploys between patch tags [default: 10]
+    --branches=<n>      unmerged remote branches [default: 50]
+    --merge-every=<n>   commits between merges of a two commit side branch, 0 for linear history [default: 10]
+    --repeat=<n>        runs of each entry point, the fastest one is reported [default: 3]
+    --output=<file>     where to save the results as json [default: benchmark.json]
+    --compare=<file>    results of an earlier run to compare with
+
+The repository is generated in <path_to_git_repo>, or a temporary directory.
+"""
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from functools import partial
+
+import docopt
+
+from calculate_four_metrics import calculate_lead_time, calculate_deploy_interval, calculate_change_fail_rate, \
+    calculate_MTTR
+from git_metrics import fetch_rows_from_repos, release_lead_time_rows, open_branches_rows
+from git_metrics_open_branches import commit_author_time_and_branch_ref
+from git_metrics_release_lead_time import commit_author_time_tag_author_time_and_from_to_tag_name
+import process
+
+START_TIME = 1500000000
+
+
+def fast_import_stream(commits, deploy_every, patch_every, branches, merge_every):
+    """A `git fast-import` stream of a master branch with side branch merges, deploy and patch tags,
+    and unmerged remote branches, one minute between commits."""
+    mark = 0
+    deploys = 0
+
+    def commit(ref, message, parents, file_name, t):
+        nonlocal mark
+        mark += 1
+        content = f"{message}\n"
+        lines = [
+            f"commit {ref}",
+            f"mark :{mark}",
+            f"author Benchmark <benchmark@example.com> {t} +0000",
+            f"committer Benchmark <benchmark@example.com> {t} +0000",
+            f"data {len(message)}",
+            message,
+        ]
+        lines.extend(f"{'from' if i == 0 else 'merge'} :{parent}" for i, parent in enumerate(parents))
+        lines.extend([f"M 644 inline {file_name}", f"data {len(content)}", content])
+        return mark, lines
+
+    def tag(name, parent, t):
+        return [f"tag {name}", f"from :{parent}", f"tagger Benchmark <benchmark@example.com> {t} +0000",
+                f"data {len(name)}", name]
+
+    head = None
+    for i in range(1, commits + 1):
+        t = START_TIME + i * 60
+        if merge_every and head is not None and i % merge_every == 0:
+            side = head
+            for j in range(2):
+                side, lines = commit("refs/heads/side", f"side {i}.{j}", [side], f"side-{i % 17}", t - 30 + j)
+                yield from lines
+            head, lines = commit("refs/heads/master", f"merge {i}", [head, side], f"file-{i % 13}", t)
+        else:
+            head, lines = commit("refs/heads/master", f"commit {i}", [] if head is None else [head], f"file-{i % 13}", t)
+        yield from lines
+        if i % deploy_every == 0:
+            deploys += 1
+            yield from tag(f"D-{deploys}", head, t + 3600)
+            if patch_every and deploys % patch_every == 0:
+                yield from tag(f"P-{deploys}", head, t + 3600)
+    yield from ["reset refs/remotes/origin/master", f"from :{head}"]
+    for b in range(branches):
+        branch_head = max(1, head - (b * 7) % head)
+        for j in range(3):
+            branch_head, lines = commit(f"refs/remotes/origin/feature-{b}", f"feature {b}.{j}", [branch_head],
+                                        f"feature-{b}", START_TIME + (commits + b + j) * 60)
+            yield from lines
+
+
+def generate_repository(path, commits, deploy_every, patch_every, branches, merge_every):
+    subprocess.run(["git", "init", "-q", path], check=True)
+    stream = "\n".join(fast_import_stream(commits, deploy_every, patch_every, branches, merge_every)) + "\n"
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=path, input=stream.encode(), check=True)
+    subprocess.run(["git", "checkout", "-q", "master"], cwd=path, check=True)
+
+
+@contextmanager
+def count_processes():
+    """Count the processes started through subprocess.Popen while inside the block."""
+    counter = {"processes": 0}
+    original_init = subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        counter["processes"] += 1
+        original_init(self, *args, **kwargs)
+
+    subprocess.Popen.__init__ = counting_init
+    try:
+        yield counter
+    finally:
+        subprocess.Popen.__init__ = original_init
+
+
+def measure(entry_point, repeat):
+    """Fastest wall time, peak Python memory and git processes of `entry_point`, each run from cold caches."""
+    wall_times = []
+    for _ in range(repeat):
+        process.close_object_lookups()
+        process._mk_run.cache_clear()
+        tracemalloc.start()
+        with count_processes() as counter:
+            start = time.perf_counter()
+            entry_point()
+            wall_times.append(time.perf_counter() - start)
+        _current, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"wall_time": min(wall_times), "peak_memory": peak_memory, "git_processes": counter["processes"]}
+
+
+def entry_points(path_to_git_repo):
+    now = START_TIME + 10 ** 8
+    match_all = partial(fnmatch, pat='*')
+    return {
+        "release-lead-time": lambda: list(commit_author_time_tag_author_time_and_from_to_tag_name(
+            process.mk_run(path_to_git_repo), match_all)),
+        "open-branches": lambda: list(commit_author_time_and_branch_ref(
+            process.mk_run(path_to_git_repo), 'origin/master')),
+        "batch --release-lead-time": lambda: list(fetch_rows_from_repos(
+            partial(release_lead_time_rows, 0), [path_to_git_repo] * 2, 1, [])),
+        "batch --open-branches": lambda: list(fetch_rows_from_repos(
+            partial(open_branches_rows, now, 'origin/master'), [path_to_git_repo] * 2, 1, [])),
+        "calculate_lead_time": lambda: calculate_lead_time(path_to_git_repo, "D-*", 0),
+        "calculate_deploy_interval": lambda: calculate_deploy_interval(path_to_git_repo, "D-*", 0, now),
+        "calculate_change_fail_rate": lambda: calculate_change_fail_rate(path_to_git_repo, "D-*", "P-*", 0),
+        "calculate_MTTR": lambda: calculate_MTTR(path_to_git_repo, "D-*", "P-*", 0),
+    }
+
+
+def run_benchmarks(path_to_git_repo, repeat):
+    return {name: measure(entry_point, repeat) for name, entry_point in entry_points(path_to_git_repo).items()}
+
+
+def print_results(results, previous=None):
+    print(f"{'entry point':<30} {'wall time':>10} {'peak memory':>12} {'git processes':>14}")
+    for name, result in results.items():
+        line = f"{name:<30} {result['wall_time']:>9.3f}s {result['peak_memory'] / 2 ** 20:>10.1f}MB " \
+               f"{result['git_processes']:>14}"
+        if previous and name in previous:
+            line += f"  {result['wall_time'] / previous[name]['wall_time']:>6.2f}x time"
+        print(line)
+
+
+def main():
+    flags = docopt.docopt(__doc__)
+    parameters = {
+        "commits": int(flags["--commits"]),
+        "deploy_every": int(flags["--deploy-every"]),
+        "patch_every": int(flags["--patch-every"]),
+        "branches": int(flags["--branches"]),
+        "merge_every": int(flags["--merge-every"]),
+    }
+    path_to_git_repo = flags["<path_to_git_repo>"] or tempfile.mkdtemp()
+    print("generating repository in:", path_to_git_repo, file=sys.stderr)
+    generate_repository(path_to_git_repo, **parameters)
+    results = run_benchmarks(path_to_git_repo, int(flags["--repeat"]))
+    previous = None
+    if flags["--compare"]:
+        with open(flags["--compare"]) as f:
+            previous = json.load(f)["results"]
+    print_results(results, previous)
+    git_version = subprocess.run(["git", "--version"], stdout=subprocess.PIPE, universal_newlines=True).stdout
+    with open(flags["--output"], "w") as f:
+        json.dump({
+            "parameters": parameters,
+            "python": platform.python_version(),
+            "git": git_version.strip(),
+            "results": results,
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,29 +5,50 @@
     * Mean time to recover
 
 Usage:
-    calculate_four_metrics.py lead-time [--deploy-tag-pattern=<fn_match>] [--start-date=<timestamp>] <path_to_git_repo>
-    calculate_four_metrics.py deploy-interval [--deploy-tag-pattern=<fn_match>] [--start-date=<timestamp>] <path_to_git_repo>
-    calculate_four_metrics.py change-fail-rate [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] <path_to_git_repo>
-    calculate_four_metrics.py recovery-time [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] <path_to_git_repo>
-    calculate_four_metrics.py metrics-all [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] <path_to_git_repo>
+    calculate_four_metrics.py lead-time [--deploy-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py lead-time (--sample=<n> [--time-budget=<seconds>] | --time-budget=<seconds>) [--deploy-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    calculate_four_metrics.py deploy-interval [--deploy-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py change-fail-rate [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py recovery-time [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py metrics-all [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py timeseries [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--end-date=<timestamp>] [--window=<seconds>] [--step=<seconds>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py percentiles [--deploy-tag-pattern=<fn_match>] [--patch-tag-pattern=<fn_match>] [--start-date=<timestamp>] [--sketch=<file>] [--profile=<file>] ([--backend=<name>] [--trace=<file>] <path_to_git_repo> | --snapshot=<file> [--repo-name=<name>])
+    calculate_four_metrics.py merge-sketches [--sketch=<file>] [--profile=<file>] <sketch_files>...
     calculate_four_metrics.py (-h | --help)
 
+Options:
+    --backend=<name>    how to read the repository: subprocess, in-process or compare [default: subprocess]
+    --snapshot=<file>   read a release lead time snapshot written by git_metrics.py instead of a repository
+    --repo-name=<name>  repository to read from a snapshot of several repositories
+    --end-date=<timestamp>  end of the last timeseries window, now if not given
+    --window=<seconds>  width of each timeseries window [default: 604800]
+    --step=<seconds>    time between the starts of timeseries windows, the window width if not given
+    --trace=<file>      write the git commands run, with their timings and output sizes, as json to <file>
+    --profile=<file>    write a cProfile dump of the run to <file>, and wall time and peak memory per stage to stderr
+    --sample=<n>        estimate lead time from releases read in random order until <n> commits are read
+    --time-budget=<seconds>  estimate lead time from releases read in random order until <seconds> have passed
+    --sketch=<file>     save the quantile sketches of lead time, recovery time and deploy interval as json to <file>,
+                        merge-sketches combines the sketches of several repositories
 """
 import csv
+import json
 import sys
 from fnmatch import fnmatch
 import os
-import statistics
 import time
 from functools import partial
 import logging
 
 import docopt
 
-from git_metrics_release_lead_time import commit_author_time_tag_author_time_and_from_to_tag_name, \
-    fetch_tags_and_author_dates, fetch_tags_and_sha
-from process import mk_run
-from recovery_time import Deployment, find_is_patch, find_outages
+from columnar_snapshot import ColumnarSnapshot
+from data import PrefixSums, windows
+from git_metrics_release_lead_time import RepositorySnapshot
+from process import mk_run, trace_to
+from profiling import profile_to, staged
+from recovery_time import Deployment, find_is_patch, iter_outages
+from sampling import estimate_lead_time
+from sketch import PERCENTILES, QuantileSketch, exact_mean
 
 
 def configure_logging():
@@ -38,113 +59,255 @@ def configure_logging():
                     filename='metrics.log',
                     filemode='w')
 
-configure_logging()
+
 log = logging.getLogger("metrics")
 
 
 def main():
     flags = docopt.docopt(__doc__)
+    configure_logging()
+    with profile_to(flags['--profile']), trace_to(flags['--trace']):
+        run_command(flags)
+
+
+def run_command(flags):
     now = int(time.time())
-    if flags['<path_to_git_repo>']:
+    if flags['<path_to_git_repo>'] or flags['--snapshot']:
         path_to_git_repo = flags['<path_to_git_repo>']
-        repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
+        if flags['--snapshot']:
+            try:
+                snapshot = ColumnarSnapshot(flags['--snapshot']).repository(flags['--repo-name'])
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                exit(1)
+            repo_name = snapshot.repo_name
+        else:
+            snapshot = RepositorySnapshot(mk_run(path_to_git_repo, flags['--backend']))
+            repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
         start_date = int(flags["--start-date"] or 0)
         deploy_pattern = flags['--deploy-tag-pattern'] or '*'
         patch_pattern = flags['--patch-tag-pattern'] or '*'
-        if flags["lead-time"]:
-            mean_seconds = calculate_lead_time(path_to_git_repo, deploy_pattern, start_date)
+        if flags["lead-time"] and (flags["--sample"] or flags["--time-budget"]):
+            estimate = estimate_lead_time(
+                snapshot.run,
+                partial(fnmatch, pat=deploy_pattern),
+                start_date,
+                int(flags["--sample"]) if flags["--sample"] else None,
+                float(flags["--time-budget"]) if flags["--time-budget"] else None,
+                snapshot,
+            )
+            print_lead_time_estimate(estimate)
+        elif flags["lead-time"]:
+            mean_seconds = calculate_lead_time(path_to_git_repo, deploy_pattern, start_date, snapshot)
             print(f"Avarage lead time: {mean_seconds:.0f} seconds")
             print(f"Avarage lead time: {(mean_seconds / 3600):.0f} hours")
             print(f"Avarage lead time: {(mean_seconds / 86400):.0f} days")
         if flags["deploy-interval"]:
-            interval_seconds = calculate_deploy_interval(path_to_git_repo, deploy_pattern, start_date, now)
+            interval_seconds = calculate_deploy_interval(path_to_git_repo, deploy_pattern, start_date, now, snapshot)
             print(f"Deploy interval: {interval_seconds:.0f} seconds")
             print(f"Deploy interval: {(interval_seconds / 3600):.0f} hours")
             print(f"Deploy interval: {(interval_seconds / 86400):.0f} days")
         if flags["change-fail-rate"]:
-            change_fail_rate = calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date)
+            change_fail_rate = calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)
             print(f"Change failure rate: {change_fail_rate:.1f}%")
         if flags["recovery-time"]:
-            MTTR = calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date)
+            MTTR = calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)
             print(f"Recovery time: {MTTR} seconds")
             print(f"Recovery time: {(MTTR / 3600):.0f} hours")
             print(f"Recovery time: {(MTTR / 86400):.0f} days")
         if flags["metrics-all"]:
-            lead_time = calculate_lead_time(path_to_git_repo, deploy_pattern, start_date)
-            interval = calculate_deploy_interval(path_to_git_repo, deploy_pattern, start_date, now)
-            change_fail_rate = calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date)
-            MTTR = calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date)
+            lead_time = calculate_lead_time(path_to_git_repo, deploy_pattern, start_date, snapshot)
+            interval = calculate_deploy_interval(path_to_git_repo, deploy_pattern, start_date, now, snapshot)
+            change_fail_rate = calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)
+            MTTR = calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)
             data = [lead_time, interval, change_fail_rate, MTTR, repo_name]
             write_four_metrics_csv_file(map(lambda d: str(d), data))
+        if flags["timeseries"]:
+            end_date = int(flags["--end-date"] or now)
+            window = int(flags["--window"])
+            step = int(flags["--step"] or window)
+            if window <= 0 or step <= 0:
+                print("--window and --step must be positive", file=sys.stderr)
+                exit(1)
+            rows = calculate_timeseries(snapshot, deploy_pattern, patch_pattern, start_date, end_date, window, step)
+            write_timeseries_csv_file((start, end, *metrics, repo_name) for start, end, *metrics in rows)
+        if flags["percentiles"]:
+            sketches = metric_sketches(snapshot, deploy_pattern, patch_pattern, start_date)
+            if flags["--sketch"]:
+                write_sketch_file(flags["--sketch"], repo_name, sketches)
+            write_percentiles_csv_file(sketches, repo_name)
+    if flags["merge-sketches"]:
+        repo_names, sketches = merge_sketch_files(flags["<sketch_files>"])
+        if flags["--sketch"]:
+            write_sketch_file(flags["--sketch"], ",".join(repo_names), sketches)
+        write_percentiles_csv_file(sketches, ",".join(repo_names))
+
+
+@staged("output")
+def print_lead_time_estimate(estimate):
+    if not estimate.estimates:
+        print("Avarage lead time: N/A")
+    for e in estimate.estimates:
+        name = "Avarage lead time" if e.statistic == "mean" else f"Lead time {e.statistic}"
+        units = (("seconds", 1), ("hours", 3600), ("days", 86400)) if e.statistic == "mean" else (("seconds", 1),)
+        for unit, seconds in units:
+            if e.low == "N/A":
+                interval = "unknown from a single release"
+            else:
+                interval = f"{(e.low / seconds):.0f} to {(e.high / seconds):.0f} {unit}"
+            print(f"{name}: {(e.value / seconds):.0f} {unit} (95% confidence interval: {interval})")
+    print(f"Estimated from {estimate.commits} commits of {estimate.releases_read} of {estimate.releases} releases")
 
 
-def calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date):
-    run = mk_run(path_to_git_repo)
+def find_deployments(snapshot, deploy_pattern, patch_pattern, start_date):
     match_deploy = partial(fnmatch, pat=deploy_pattern)
     match_patch = partial(fnmatch, pat=patch_pattern)
-    deploy_tags_author_date = fetch_tags_and_author_dates(
-        run,
-        match_deploy,
-        start_date,
-    )
-    deploy_tags_commit_date = dict(fetch_tags_and_sha(run, match_deploy))
+    deploy_tags_author_date = snapshot.tags_and_author_dates(match_deploy, start_date)
+    deploy_tags_commit_date = dict(snapshot.tags_and_sha(match_deploy))
     patch_dates = set(
         date
         for _tag, date
-        in fetch_tags_and_sha(run, match_patch)
+        in snapshot.tags_and_sha(match_patch)
     )
     deployments = []
     for deploy_tag, deploy_date in deploy_tags_author_date:
         is_patch = find_is_patch(deploy_tag, deploy_tags_commit_date, patch_dates)
         deployments.append(Deployment(is_patch, deploy_date))
-    outages = find_outages(deployments)
-    log.info("calculating downtime metrics from outages: %s", outages)
-    downtime = [end.time - start.time for start, end in outages]
-    return statistics.mean(downtime) if downtime else "N/A"
-
-
-def calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date):
-    run = mk_run(path_to_git_repo)
-    deploy_tags = list(fetch_tags_and_author_dates(
-        run,
-        partial(fnmatch, pat=deploy_pattern),
-        start_date,
-    ))
-    patch_tags = list(fetch_tags_and_author_dates(
-        run,
-        partial(fnmatch, pat=patch_pattern),
-        start_date,
-    ))
+    return deployments
+
+
+@staged("statistics")
+def calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot=None):
+    snapshot = snapshot or RepositorySnapshot(mk_run(path_to_git_repo))
+    deployments = find_deployments(snapshot, deploy_pattern, patch_pattern, start_date)
+    total = count = 0
+    for start, end in iter_outages(deployments):
+        total += end.time - start.time
+        count += 1
+    log.info("calculating downtime metrics from %s outages", count)
+    return exact_mean(total, count)
+
+
+@staged("statistics")
+def calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot=None):
+    snapshot = snapshot or RepositorySnapshot(mk_run(path_to_git_repo))
+    deploy_tags = snapshot.tags_and_author_dates(partial(fnmatch, pat=deploy_pattern), start_date)
+    patch_tags = snapshot.tags_and_author_dates(partial(fnmatch, pat=patch_pattern), start_date)
     log.info("calculating change fail rate from patches: %s and deploys: %s", patch_tags, deploy_tags)
     return len(patch_tags) / len(deploy_tags) * 100 if deploy_tags else "N/A"
 
 
-def calculate_deploy_interval(path_to_git_repo, pattern, start_date, now):
-    run = mk_run(path_to_git_repo)
-    deployments = list(fetch_tags_and_author_dates(
-        run,
-        partial(fnmatch, pat=pattern),
-        start_date,
-    ))
+@staged("statistics")
+def calculate_deploy_interval(path_to_git_repo, pattern, start_date, now, snapshot=None):
+    snapshot = snapshot or RepositorySnapshot(mk_run(path_to_git_repo))
+    deployments = snapshot.tags_and_author_dates(partial(fnmatch, pat=pattern), start_date)
     log.info("calculating deploy interval from deployments %s", deployments)
     deployment_data = set(tat for tag, tat in deployments)
     interval_seconds = (now - start_date) / len(deployment_data) if deployment_data else "N/A"
     return interval_seconds
 
 
-def calculate_lead_time(path_to_git_repo, pattern, start_date):
-    run = mk_run(path_to_git_repo)
-    deployment_data = list(commit_author_time_tag_author_time_and_from_to_tag_name(
-        run,
-        partial(fnmatch, pat=pattern),
-        start_date,
-    ))
-    deployment_tag_pairs = set(["%s..%s" % (old_tag, tag) for cat, tat, old_tag, tag in deployment_data])
+@staged("statistics")
+def calculate_lead_time(path_to_git_repo, pattern, start_date, snapshot=None):
+    snapshot = snapshot or RepositorySnapshot(mk_run(path_to_git_repo))
+    records = snapshot.release_records(partial(fnmatch, pat=pattern), start_date)
+    tag_pairs = set(zip(records.names_a, records.names_b))
+    deployment_tag_pairs = set("%s..%s" % (records.strings[old_tag], records.strings[tag]) for old_tag, tag in tag_pairs)
     log.info("calculating lead time data from deployments %s", deployment_tag_pairs)
-    lead_time_data = [(tat - cat) for cat, tat, old_tag, tag in deployment_data]
-    return statistics.mean(lead_time_data) if lead_time_data else "N/A"
-    
+    return exact_mean(sum(records.times_b) - sum(records.times_a), len(records))
+
+
+@staged("statistics")
+def calculate_timeseries(snapshot, deploy_pattern, patch_pattern, start_date, end_date, window, step):
+    """All four metrics for each window from `start_date` to `end_date`, from one collection of the data.
+
+    Lead times count towards the window of their deploy, recovery times towards the window of
+    the last patch. Each metric is summed with prefix sums, so every window costs two bisects.
+    """
+    match_deploy = partial(fnmatch, pat=deploy_pattern)
+    records = snapshot.release_records(match_deploy, start_date)
+    lead_times = PrefixSums((tat, tat - cat) for cat, tat in zip(records.times_a, records.times_b))
+    deploy_dates = [date for _tag, date in snapshot.tags_and_author_dates(match_deploy, start_date)]
+    patch_dates = [date for _tag, date in snapshot.tags_and_author_dates(partial(fnmatch, pat=patch_pattern), start_date)]
+    deploys = PrefixSums((date, 1) for date in set(deploy_dates))
+    deploy_tags = PrefixSums((date, 1) for date in deploy_dates)
+    patch_tags = PrefixSums((date, 1) for date in patch_dates)
+    outages = iter_outages(find_deployments(snapshot, deploy_pattern, patch_pattern, start_date))
+    downtimes = PrefixSums((end.time, end.time - start.time) for start, end in outages)
+    if not start_date and deploys.times:
+        start_date = deploys.times[0] - 1
+    rows = []
+    for start, end in windows(start_date, end_date, window, step):
+        deploy_count, _ = deploys.window(start, end)
+        deploy_tag_count, _ = deploy_tags.window(start, end)
+        patch_tag_count, _ = patch_tags.window(start, end)
+        rows.append((
+            start,
+            end,
+            lead_times.mean(start, end),
+            (end - start) / deploy_count if deploy_count else "N/A",
+            patch_tag_count / deploy_tag_count * 100 if deploy_tag_count else "N/A",
+            downtimes.mean(start, end),
+        ))
+    return rows
+
+
+@staged("statistics")
+def metric_sketches(snapshot, deploy_pattern, patch_pattern, start_date):
+    """Quantile sketches of every lead time, recovery time and interval between deploys, by metric."""
+    match_deploy = partial(fnmatch, pat=deploy_pattern)
+    lead_time = QuantileSketch()
+    lead_time.extend(tat - cat for cat, tat, _old_tag, _tag in snapshot.release_rows(match_deploy, start_date))
+    recovery_time = QuantileSketch()
+    outages = iter_outages(find_deployments(snapshot, deploy_pattern, patch_pattern, start_date))
+    recovery_time.extend(end.time - start.time for start, end in outages)
+    deploy_interval = QuantileSketch()
+    deploy_dates = sorted(set(date for _tag, date in snapshot.tags_and_author_dates(match_deploy, start_date)))
+    deploy_interval.extend(later - earlier for earlier, later in zip(deploy_dates, deploy_dates[1:]))
+    return {"lead_time": lead_time, "recovery_time": recovery_time, "deploy_interval": deploy_interval}
+
+
+@staged("output")
+def write_sketch_file(filename, repo_name, sketches):
+    with open(filename, "w") as f:
+        json.dump({"repo_name": repo_name, "sketches": {
+            metric: sketch.to_dict() for metric, sketch in sketches.items()
+        }}, f)
+
+
+@staged("statistics")
+def merge_sketch_files(filenames):
+    repo_names = []
+    sketches = {}
+    for filename in filenames:
+        with open(filename) as f:
+            saved = json.load(f)
+        repo_names.append(saved["repo_name"])
+        for metric, sketch in saved["sketches"].items():
+            sketch = QuantileSketch.from_dict(sketch)
+            sketches[metric] = sketches[metric].merge(sketch) if metric in sketches else sketch
+    return repo_names, sketches
+
+
+@staged("output")
+def write_percentiles_csv_file(sketches, repo_name):
+    writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
+    writer.writerow(("metric", "count", "mean", *(f"p{int(q * 100)}" for q in PERCENTILES), "repo name"))
+    for metric, sketch in sketches.items():
+        writer.writerow((metric, sketch.count, sketch.mean(), *(sketch.quantile(q) for q in PERCENTILES), repo_name))
+
+
+@staged("output")
+def write_timeseries_csv_file(data):
+    writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
+    writer.writerow((
+        "window start", "window end", "deploy lead time", "deploy interval", "change fail rate",
+        "mean time to recover", "repo name"
+    ))
+    writer.writerows(data)
+
 
+@staged("output")
 def write_four_metrics_csv_file(data):
     writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
     writer.writerow(("deploy lead time", "deploy interval", "change fail rate", "mean time to recover", "repo name"))
@@ -0,0 +1,72 @@
+"""Per-repository checkpoints of batch runs, so an interrupted run can resume where it stopped."""
+import hashlib
+import json
+import os
+from typing import List, Optional, Tuple
+
+from custom_git import show_ref
+from process import mk_run, proc_to_stdout
+
+REFS_WITH_HEAD_CMD = show_ref(head=True)
+
+
+def repository_state(path_to_git_repo) -> str:
+    """A digest of HEAD and every ref with the object it points to."""
+    digest = hashlib.sha1()
+    for line in proc_to_stdout(mk_run(path_to_git_repo)(REFS_WITH_HEAD_CMD)):
+        digest.update(line.encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """A directory with the rows and tags of every repository a batch run has finished.
+
+    `query` describes what was collected, e.g. the subcommand and its options, so that
+    rows of a different query are never reused. Checkpoints are only read when resuming.
+    """
+
+    def __init__(self, directory, query: str, resume=False):
+        self.directory = directory
+        self.query = query
+        self.resume = resume
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, path_to_git_repo) -> str:
+        name = hashlib.sha1(os.path.abspath(path_to_git_repo).encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, path_to_git_repo, state) -> Optional[Tuple[List[tuple], List[tuple]]]:
+        """The saved rows and tags of the repository, if it is unchanged since they were saved."""
+        if not self.resume:
+            return None
+        try:
+            with open(self.filename(path_to_git_repo)) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if saved["query"] != self.query or saved["state"] != state:
+            return None
+        return [tuple(row) for row in saved["rows"]], [tuple(tag) for tag in saved["tags"]]
+
+    def save(self, path_to_git_repo, state, rows, tags):
+        filename = self.filename(path_to_git_repo)
+        with open(filename + ".tmp", "w") as f:
+            json.dump({
+                "path": os.path.abspath(path_to_git_repo),
+                "query": self.query,
+                "state": state,
+                "rows": list(rows),
+                "tags": tags,
+            }, f)
+        os.replace(filename + ".tmp", filename)
+
+
+def checkpointed(checkpoint: Checkpoint, fetch_rows, path_to_git_repo):
+    """`fetch_rows` of the repository, or its saved rows when resuming and nothing has changed."""
+    state = repository_state(path_to_git_repo)
+    saved = checkpoint.load(path_to_git_repo, state)
+    if saved is not None:
+        return saved
+    rows, tags = fetch_rows(path_to_git_repo)
+    checkpoint.save(path_to_git_repo, state, rows, tags)
+    return rows, tags
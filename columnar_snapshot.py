@@ -0,0 +1,203 @@
+"""Compact binary snapshots of collected metrics data.
+
+A snapshot file starts with a 16 byte header, followed by fixed width rows of two
+int64 times and three int32 string ids, written as the data is collected. The
+interned strings and the tags of every repository follow the rows, and a 24 byte
+trailer gives the number of rows and where the tables start:
+
+    header   magic "GITMSNAP", kind (uint32), reserved (uint32)
+    rows     time_a (int64), time_b (int64), name_a, name_b, repo (int32)
+    strings  count (uint32), then length (uint32) and utf-8 bytes of each
+    tags     count (uint32), then repo, tag, sha (int32) and tag date (int64) of each
+    trailer  row count (int64), offset of the strings (int64), magic "GITMSEND"
+
+Release lead time rows are (commit time, tag time, previous tag, tag, repo) and open
+branches rows are (query time, commit time, branch, -1, repo), like the csv files.
+"""
+import mmap
+import os
+import struct
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from records import KINDS, RecordBatch, frame_from_columns
+
+MAGIC = b"GITMSNAP"
+END_MAGIC = b"GITMSEND"
+HEADER = struct.Struct("<8sII")
+ROW = struct.Struct("<qqiii")
+TAG = struct.Struct("<iiiq")
+TRAILER = struct.Struct("<qq8s")
+ROW_DTYPE = [("time_a", "<i8"), ("time_b", "<i8"), ("name_a", "<i4"), ("name_b", "<i4"), ("repo", "<i4")]
+
+
+def is_snapshot_file(filename) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ColumnarSnapshotWriter:
+    """Streams rows to a snapshot file as they arrive, keeping only the interned strings in memory."""
+
+    def __init__(self, filename, kind):
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, KINDS.index(kind), 0))
+        self.kind = kind
+        self.strings = {}
+        self.tags = []
+        self.row_count = 0
+
+    def intern(self, string: str) -> int:
+        return self.strings.setdefault(string, len(self.strings))
+
+    def write_rows(self, rows: Iterable[tuple]):
+        pack = ROW.pack
+        intern = self.intern
+        chunk = bytearray()
+        for row in rows:
+            if self.kind == "release-lead-time":
+                commit_time, tag_time, old_tag, tag, repo_name = row
+                chunk += pack(commit_time, tag_time, intern(old_tag), intern(tag), intern(repo_name))
+            else:
+                now, commit_time, branch, repo_name = row
+                chunk += pack(now, commit_time, intern(branch), -1, intern(repo_name))
+            self.row_count += 1
+            if len(chunk) >= 1 << 16:
+                self.file.write(chunk)
+                chunk = bytearray()
+        self.file.write(chunk)
+
+    def write_tags(self, repo_name: str, tags: Iterable[Tuple[str, int, str]]):
+        repo = self.intern(repo_name)
+        self.tags.extend((repo, self.intern(tag), self.intern(sha), date) for tag, date, sha in tags)
+
+    def close(self):
+        strings_offset = self.file.tell()
+        self.file.write(struct.pack("<I", len(self.strings)))
+        for string in self.strings:
+            encoded = string.encode()
+            self.file.write(struct.pack("<I", len(encoded)) + encoded)
+        self.file.write(struct.pack("<I", len(self.tags)))
+        self.file.write(b"".join(TAG.pack(*tag) for tag in self.tags))
+        self.file.write(TRAILER.pack(self.row_count, strings_offset, END_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Rows of a run that failed part way are not a snapshot of anything, so leave no file to read them from
+            self.file.close()
+            os.remove(self.filename)
+
+
+class ColumnarSnapshot:
+    """A snapshot file, memory mapped, with its rows as a numpy structured array."""
+
+    def __init__(self, filename):
+        import numpy as np
+
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, kind, _reserved = HEADER.unpack_from(self.map, 0)
+        row_count, strings_offset, end_magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != MAGIC or end_magic != END_MAGIC:
+            raise ValueError(f"{filename} is not a complete metrics snapshot")
+        self.kind = KINDS[kind]
+        self.rows = np.frombuffer(self.map, dtype=np.dtype(ROW_DTYPE), count=row_count, offset=HEADER.size)
+        pos = strings_offset
+        count, = struct.unpack_from("<I", self.map, pos)
+        pos += 4
+        self.strings = []
+        for _ in range(count):
+            length, = struct.unpack_from("<I", self.map, pos)
+            self.strings.append(self.map[pos + 4:pos + 4 + length].decode())
+            pos += 4 + length
+        count, = struct.unpack_from("<I", self.map, pos)
+        pos += 4
+        self.tags = defaultdict(list)
+        for repo, tag, sha, date in TAG.iter_unpack(self.map[pos:pos + count * TAG.size]):
+            self.tags[self.strings[repo]].append((self.strings[tag], date, self.strings[sha]))
+
+    def repo_names(self) -> List[str]:
+        names = set(self.tags)
+        names.update(self.strings[repo] for repo in set(self.rows["repo"].tolist()))
+        return sorted(names)
+
+    def row_tuples(self) -> Iterable[tuple]:
+        """The rows as the csv readers give them."""
+        strings = self.strings
+        for time_a, time_b, name_a, name_b, repo in zip(*(self.rows[column].tolist() for column, _ in ROW_DTYPE)):
+            if self.kind == "release-lead-time":
+                yield time_a, time_b, strings[name_a], strings[name_b], strings[repo]
+            else:
+                yield time_a, time_b, strings[name_a], strings[repo]
+
+    def to_frame(self, columns):
+        """The rows as a DataFrame with the given column names, names as categoricals of the string table."""
+        return frame_from_columns(self.kind, [self.rows[field] for field, _ in ROW_DTYPE], self.strings, columns)
+
+    def repository(self, repo_name=None) -> "ColumnarRepository":
+        if self.kind != "release-lead-time":
+            raise ValueError(f"a snapshot of {self.kind} rows has no releases to query")
+        if repo_name is None:
+            names = self.repo_names()
+            if len(names) != 1:
+                raise ValueError(f"snapshot holds {len(names)} repositories, pick one of: {', '.join(names)}")
+            repo_name = names[0]
+        return ColumnarRepository(self, repo_name)
+
+
+class ColumnarRepository:
+    """One repository of a release lead time snapshot, answering like a RepositorySnapshot."""
+
+    def __init__(self, snapshot: ColumnarSnapshot, repo_name: str):
+        self.snapshot = snapshot
+        self.repo_name = repo_name
+        self.tags = sorted(snapshot.tags.get(repo_name, []), key=lambda tag: (tag[1], tag[0]))
+
+    def tags_and_author_dates(self, match_tag, earliest_date=0) -> List[Tuple[str, int]]:
+        return [(tag, date) for tag, date, _sha in self.tags if match_tag(tag) and date > earliest_date]
+
+    def tags_and_sha(self, match_tag) -> List[Tuple[str, str]]:
+        return [(tag, sha) for tag, _date, sha in self.tags if match_tag(tag)]
+
+    def release_rows(self, match_tag, earliest_date=0) -> Iterable[Tuple[int, int, str, str]]:
+        """Rows for the matching tags, moving commits of other tags on to the next matching tag.
+
+        This is the same attribution as collecting with `match_tag` for linear history.
+        """
+        for commit_time, date, old_tag, tag, _repo_name in self.release_records(match_tag, earliest_date):
+            yield commit_time, date, old_tag, tag
+
+    def release_records(self, match_tag, earliest_date=0, repo_name=None) -> RecordBatch:
+        import numpy as np
+
+        strings = self.snapshot.strings
+        matching = [(tag, date) for tag, date, _sha in self.tags if match_tag(tag)]
+        release_of: Dict[str, int] = {}
+        following = len(matching)
+        for tag, _date, _sha in reversed(self.tags):
+            if match_tag(tag):
+                following -= 1
+            if following < len(matching):
+                release_of[tag] = following
+        rows = self.snapshot.rows
+        rows = rows[rows["repo"] == strings.index(self.repo_name)]
+        release = np.array(
+            [release_of.get(string, -1) for string in strings], dtype=np.int64
+        )[rows["name_b"]] if len(rows) else np.zeros(0, dtype=np.int64)
+        batch = RecordBatch("release-lead-time")
+        for index in range(1, len(matching)):
+            tag, date = matching[index]
+            if date <= earliest_date:
+                continue
+            old_tag = matching[index - 1][0]
+            commit_times = rows["time_a"][release == index].astype(np.int64).tobytes()
+            batch.extend_release(array("q", commit_times), date, old_tag, tag, repo_name or self.repo_name)
+        return batch
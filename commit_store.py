@@ -0,0 +1,194 @@
+"""Author time and parents of commits by SHA, in one sqlite file shared by the repositories of a batch.
+
+Forks and mirrors of one project share most of their history, and a commit in the store
+is never read from a repository again. Every commit in the store has all its ancestors
+in it, so walks go through stored history without asking git. Commits are added by
+walking the repository from its new tips down to the tips stored before, which are all
+left out with `^`, so a fork only adds the commits it does not share. Each commit also
+gets its generation, one more than the highest generation of its parents, like in a git
+commit-graph. A walk that leaves out the history of some commits can then stop as soon
+as everything left to visit is left out.
+
+Shallow clones are not stored, as their history stops at commits whose parents they do
+not have, and the store must have every ancestor of every commit in it.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from heapq import heappop, heappush
+from subprocess import PIPE
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from custom_git import log
+from data import columns
+from process import proc_to_stdout
+
+STORED_COMMITS_CMD = log(format='%H %at %ct %P', topo_order=True, stdin=True, ignore_missing=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    author_time INTEGER NOT NULL,
+    committer_time INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    parents TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tips (sha TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+INCLUDED = 1
+EXCLUDED = 2
+BOTH = INCLUDED | EXCLUDED
+
+
+class CommitStore:
+    """The commits in one sqlite file, read into memory once per process and added to by every repository."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._connection = None
+        self._pid = None
+        self._read_up_to = 0
+        self.commits: Dict[str, Tuple[int, int, int, Tuple[str, ...]]] = {}
+        self.tips = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be used across fork, so pool workers open their own
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def _read_new(self, connection):
+        """Read the commits and tips added since the last read, by this or any other process."""
+        rows = connection.execute(
+            "SELECT rowid, sha, author_time, committer_time, generation, parents FROM commits WHERE rowid > ? "
+            "ORDER BY rowid",
+            (self._read_up_to,),
+        ).fetchall()
+        if rows:
+            self.commits.update(
+                (sha, (author_time, committer_time, generation, tuple(parents.split())))
+                for _rowid, sha, author_time, committer_time, generation, parents in rows
+            )
+            self._read_up_to = rows[-1][0]
+        self.tips.update(sha for sha, in connection.execute("SELECT sha FROM tips"))
+
+    def fill(self, run, tips: Iterable[str]) -> int:
+        """Add the commits reachable from `tips`, commit SHAs of the repository of `run`, and count the new ones."""
+        with self._lock:
+            connection = self._connect()
+            self._read_new(connection)
+            missing = [sha for sha in dict.fromkeys(tips) if sha not in self.commits]
+            if not missing:
+                return 0
+            revisions = [f"{sha}\n" for sha in missing] + [f"^{sha}\n" for sha in self.tips]
+            proc = run(STORED_COMMITS_CMD, stdin=PIPE)
+            new = list(columns(proc_to_stdout(proc, revisions)))
+            commits = self.commits
+            added = {}
+            for sha, author_time, committer_time, *parents in reversed(new):
+                parents = tuple(parents)
+                generation = 1 + max([(added.get(parent) or commits[parent])[2] for parent in parents], default=0)
+                added[sha] = (int(author_time), int(committer_time), generation, parents)
+            with connection:
+                # Catch up with other processes inside the write lock, so the rows after ours are theirs,
+                # and only insert the commits none of them has stored in the meantime
+                connection.execute("BEGIN IMMEDIATE")
+                self._read_new(connection)
+                connection.executemany(
+                    "INSERT OR IGNORE INTO commits (sha, author_time, committer_time, generation, parents) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(sha, author_time, committer_time, generation, " ".join(parents))
+                     for sha, (author_time, committer_time, generation, parents) in sorted(added.items())
+                     if sha not in commits],
+                )
+                connection.executemany("INSERT OR IGNORE INTO tips (sha) VALUES (?)", ((sha,) for sha in missing))
+                self._read_up_to = connection.execute("SELECT max(rowid) FROM commits").fetchone()[0] or 0
+            commits.update(added)
+            self.tips.update(missing)
+            return len(new)
+
+    def reachable(self, include: List[str], exclude: List[str]) -> Dict[str, Tuple[int, int, List[str]]]:
+        """Author time, committer time and parents of the stored commits reachable from `include` but not `exclude`.
+
+        Commits are visited by generation, highest first, so every child of a commit has
+        been visited, and has marked it, before the commit itself.
+        """
+        commits = self.commits
+        found = {}
+        if not exclude:
+            stack = list(include)
+            while stack:
+                sha = stack.pop()
+                if sha not in found:
+                    author_time, committer_time, _generation, parents = commits[sha]
+                    found[sha] = (author_time, committer_time, list(parents))
+                    stack.extend(parents)
+            return found
+        marks = {}
+        queue = []
+        for flag, shas in ((INCLUDED, include), (EXCLUDED, exclude)):
+            for sha in shas:
+                old = marks.get(sha)
+                if old is None:
+                    heappush(queue, (-commits[sha][2], sha))
+                marks[sha] = flag if old is None or old == flag else BOTH
+        open_included = sum(1 for flag in marks.values() if flag == INCLUDED)
+        while open_included:
+            _generation, sha = heappop(queue)
+            flag = marks[sha]
+            author_time, committer_time, _generation, parents = commits[sha]
+            if flag == INCLUDED:
+                open_included -= 1
+                found[sha] = (author_time, committer_time, list(parents))
+            for parent in parents:
+                old = marks.get(parent)
+                if old is None:
+                    marks[parent] = flag
+                    heappush(queue, (-commits[parent][2], parent))
+                    open_included += flag == INCLUDED
+                elif old != flag and old != BOTH:
+                    marks[parent] = BOTH
+                    open_included -= old == INCLUDED
+        return found
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+
+_store: Optional[CommitStore] = None
+
+
+def open_commit_store(path) -> CommitStore:
+    """Keep commits in the store at `path` for every backend made from now on, also used to start pool workers."""
+    global _store
+    _store = CommitStore(path)
+    return _store
+
+
+def current_commit_store() -> Optional[CommitStore]:
+    return _store
+
+
+@contextmanager
+def commit_store_at(path):
+    """Use the store at `path` inside the block, or no store if it is None."""
+    if path is None:
+        yield None
+        return
+    global _store
+    previous = _store
+    store = open_commit_store(path)
+    try:
+        yield store
+    finally:
+        store.close()
+        _store = previous
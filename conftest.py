@@ -0,0 +1,16 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from io import StringIO
+
+import pytest
+
+
+@pytest.fixture
+def fake_run():
+    """Make a `run` that answers each git command with the lines given for it in `outputs`."""
+    def run_answering(outputs):
+        @contextmanager
+        def run(cmd, **_):
+            yield namedtuple("proc", ["stdin", "stdout"])(StringIO(), outputs[tuple(cmd)])
+        return run
+    return run_answering
@@ -10,11 +10,18 @@ def for_each_ref(glob=None, format=None, sort=None) -> List[str]:
     ), [])
 
 
-def log(selector=None, format=None, limit=None) -> List[str]:
+def log(selector=None, format=None, limit=None, topo_order=False, stdin=False, no_walk=None, patch=False,
+        no_merges=False, ignore_missing=False) -> List[str]:
     return sum((
         ["git", "log"],
+        ["--ignore-missing"] if ignore_missing else [],
         [] if limit is None else [f"-{limit}"],
+        ["--topo-order"] if topo_order else [],
+        ["--no-merges"] if no_merges else [],
+        [] if no_walk is None else [f"--no-walk={no_walk}"],
         [] if format is None else [f"--format={format}"],
+        ["--patch"] if patch else [],
+        ["--stdin"] if stdin else [],
         [] if selector is None else [selector],
     ), [])
 
@@ -34,3 +41,31 @@ def cherry(upstream=None, head=None) -> List[str]:
         [] if upstream is None else [upstream],
         [] if head is None else [head],
     ), [])
+
+
+def show_ref(head=False) -> List[str]:
+    return sum((
+        ["git", "show-ref"],
+        ["--head"] if head else [],
+    ), [])
+
+
+def rev_list(selector, no_merges=False, reverse=False, left_right=False) -> List[str]:
+    return sum((
+        ["git", "rev-list"],
+        ["--no-merges"] if no_merges else [],
+        ["--left-right"] if left_right else [],
+        ["--reverse"] if reverse else [],
+        [selector],
+    ), [])
+
+
+def patch_id(stable=True) -> List[str]:
+    return sum((
+        ["git", "patch-id"],
+        ["--stable"] if stable else [],
+    ), [])
+
+
+def rev_parse(revisions: Iterable[str]) -> List[str]:
+    return ["git", "rev-parse"] + list(revisions)
@@ -1,4 +1,5 @@
-from itertools import tee, islice
+from bisect import bisect_right
+from itertools import tee, islice, accumulate
 from typing import Iterable, TypeVar, Tuple
 
 
@@ -14,3 +15,51 @@ def zip_with_tail(to_zip: Iterable[T]) -> Iterable[Tuple[T, T]]:
     a, b = tee(to_zip)
     tail = islice(b, 1, None)
     return zip(a, tail)
+
+
+def label_commits(commits: Iterable[Tuple[str, int, list]], labels, combine) -> Iterable[Tuple[str, int, list, T]]:
+    """Push labels from commits to their parents in one pass over topo-ordered commits.
+
+    Commits are `(sha, author time, parents)`, children before parents as printed
+    by `git log --topo-order`. A commit's label is `combine` of the labels of all
+    children that reach it, so it is final by the time the commit is read.
+    """
+    pending = {}
+    for sha, label in labels:
+        other = pending.get(sha)
+        pending[sha] = label if other is None else combine(other, label)
+    for sha, author_time, parents in commits:
+        label = pending.pop(sha, None)
+        if label is None:
+            continue
+        for parent in parents:
+            other = pending.get(parent)
+            pending[parent] = label if other is None else combine(other, label)
+        yield sha, author_time, parents, label
+
+
+class PrefixSums:
+    """Timestamped values sorted once, so the count and sum in any (start, end] window is two bisects."""
+
+    def __init__(self, samples: Iterable[Tuple[int, float]]):
+        samples = sorted(samples)
+        self.times = [t for t, _value in samples]
+        self.sums = [0] + list(accumulate(value for _t, value in samples))
+
+    def window(self, start: int, end: int) -> Tuple[int, float]:
+        first = bisect_right(self.times, start)
+        last = bisect_right(self.times, end)
+        return last - first, self.sums[last] - self.sums[first]
+
+    def mean(self, start: int, end: int):
+        count, total = self.window(start, end)
+        return total / count if count else "N/A"
+
+
+def windows(start: int, end: int, width: int, step: int) -> Iterable[Tuple[int, int]]:
+    """(start, end] windows of `width` seconds every `step` seconds, the last one cut off at `end`."""
+    if width <= 0 or step <= 0:
+        raise ValueError(f"window width and step must be positive, not {width} and {step}")
+    while start < end:
+        yield start, min(start + width, end)
+        start += step
@@ -0,0 +1,292 @@
+import heapq
+import os
+from subprocess import PIPE
+from typing import Dict, Iterable, List, Tuple
+
+from commit_store import current_commit_store
+from custom_git import for_each_ref, log, rev_parse
+from data import columns
+from object_database import ObjectDatabase, find_git_dir, refs_stamp
+from process import proc_to_stdout, object_lookup
+
+TAGS_WITH_AUTHOR_DATE_AND_COMMIT_SHA_CMD = for_each_ref(
+    'refs/tags/**',
+    format='%(refname:short) %(taggerdate:unix) %(*objectname)',
+    sort='taggerdate'
+)
+
+REMOTE_BRANCHES_WITH_SHA_CMD = for_each_ref('refs/remotes/origin/**', format='%(refname:short) %(objectname)')
+
+REF_NAMES_CMD = for_each_ref(format='%(refname)')
+
+COMMITS_WITH_AUTHOR_TIME_AND_PARENTS_CMD = log(format='%H %at %P', topo_order=True, stdin=True)
+
+COMMITS_WITH_AUTHOR_AND_COMMITTER_TIME_AND_PARENTS_CMD = log(format='%H %at %ct %P', topo_order=True, stdin=True)
+
+
+def parse_tags_with_date_and_sha(lines: Iterable[str]) -> Iterable[Tuple[str, int, str]]:
+    return ((tag_date_and_maybe_sha[0], int(tag_date_and_maybe_sha[1]), tag_date_and_maybe_sha[2])
+            for tag_date_and_maybe_sha in columns(lines) if len(tag_date_and_maybe_sha) > 2)
+
+
+class SubprocessBackend:
+    """Reads the repository by running git commands through `run`."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def tags(self) -> List[Tuple[str, int, str]]:
+        """Annotated tags with tagger date and peeled commit, oldest first."""
+        stdout = proc_to_stdout(self.run(TAGS_WITH_AUTHOR_DATE_AND_COMMIT_SHA_CMD))
+        return list(parse_tags_with_date_and_sha(stdout))
+
+    def remote_branches(self) -> List[Tuple[str, str]]:
+        stdout = proc_to_stdout(self.run(REMOTE_BRANCHES_WITH_SHA_CMD))
+        return [(branch, sha) for branch, sha in columns(stdout)]
+
+    def ref_names(self) -> List[str]:
+        return [line.strip() for line in proc_to_stdout(self.run(REF_NAMES_CMD))]
+
+    def walk(self, include: Iterable[str], exclude: Iterable[str]) -> Iterable[Tuple[str, int, List[str]]]:
+        """Commits reachable from `include` but not from `exclude`, children before parents."""
+        proc = self.run(COMMITS_WITH_AUTHOR_TIME_AND_PARENTS_CMD, stdin=PIPE)
+        revisions = [f"{sha}\n" for sha in include] + [f"^{sha}\n" for sha in exclude]
+        for sha, author_time, *parents in columns(proc_to_stdout(proc, revisions)):
+            yield sha, int(author_time), parents
+
+    def walk_with_committer_time(self, include: Iterable[str],
+                                 exclude: Iterable[str]) -> Iterable[Tuple[str, int, int, List[str]]]:
+        """`walk` with the committer time of each commit after its author time."""
+        proc = self.run(COMMITS_WITH_AUTHOR_AND_COMMITTER_TIME_AND_PARENTS_CMD, stdin=PIPE)
+        revisions = [f"{sha}\n" for sha in include] + [f"^{sha}\n" for sha in exclude]
+        for sha, author_time, committer_time, *parents in columns(proc_to_stdout(proc, revisions)):
+            yield sha, int(author_time), int(committer_time), parents
+
+    def author_time(self, name: str) -> int:
+        return object_lookup(self.run).author_time(name)
+
+
+class InProcessBackend:
+    """Reads refs and commits straight from packed-refs, loose refs, loose objects and packfiles."""
+
+    def __init__(self, path_to_git_repo):
+        self.database = ObjectDatabase(path_to_git_repo)
+        self._refs = None
+
+    def refs(self) -> Dict[str, str]:
+        """Every ref with the object it points to, read once, `backend_for` makes a new backend when they change."""
+        if self._refs is None:
+            self._refs = self.database.refs()
+        return self._refs
+
+    def tags(self) -> List[Tuple[str, int, str]]:
+        tags = []
+        for name, sha in self.refs().items():
+            if not name.startswith("refs/tags/"):
+                continue
+            tag = self.database.tag(sha)
+            if tag is not None and tag[1] is not None:
+                target, tagger_time = tag
+                tags.append((name[len("refs/tags/"):], tagger_time, target))
+        tags.sort(key=lambda tag: (tag[1], tag[0]))
+        return tags
+
+    def remote_branches(self) -> List[Tuple[str, str]]:
+        return sorted(
+            (name[len("refs/remotes/"):], sha)
+            for name, sha in self.refs().items()
+            if name.startswith("refs/remotes/origin/")
+        )
+
+    def ref_names(self) -> List[str]:
+        return sorted(self.refs())
+
+    def walk(self, include: Iterable[str], exclude: Iterable[str]) -> Iterable[Tuple[str, int, List[str]]]:
+        return topo_order(self.reachable(include, exclude))
+
+    def walk_with_committer_time(self, include: Iterable[str],
+                                 exclude: Iterable[str]) -> Iterable[Tuple[str, int, int, List[str]]]:
+        return topo_order_with_committer_time(self.reachable(include, exclude))
+
+    def reachable(self, include: Iterable[str], exclude: Iterable[str]) -> Dict[str, Tuple[int, int, List[str]]]:
+        excluded = self.database.ancestors(self.resolve(exclude))
+        return self.database.ancestors(self.resolve(include), stop=excluded)
+
+    def resolve(self, revisions: Iterable[str]) -> List[str]:
+        """The commits of `revisions`, looking up names in the refs and taking SHAs as they are."""
+        peel = self.database.peel_to_commit
+        return [peel(revision if is_sha(revision) else self.database.resolve(revision, self.refs()))
+                for revision in revisions]
+
+    def author_time(self, name: str) -> int:
+        sha, = self.resolve([name])
+        return self.database.commit(sha)[0]
+
+
+def topo_order(commits: Dict[str, Tuple[int, int, List[str]]]) -> Iterable[Tuple[str, int, List[str]]]:
+    """Commits by author time, committer time and parents, children first and newest first, as `git log --topo-order`."""
+    for sha, author_time, _committer_time, parents in topo_order_with_committer_time(commits):
+        yield sha, author_time, parents
+
+
+def topo_order_with_committer_time(
+        commits: Dict[str, Tuple[int, int, List[str]]]) -> Iterable[Tuple[str, int, int, List[str]]]:
+    """`topo_order` with the committer time of each commit after its author time."""
+    children = dict.fromkeys(commits, 0)
+    for _author_time, _committer_time, parents in commits.values():
+        for parent in parents:
+            if parent in children:
+                children[parent] += 1
+    ready = [(-commits[sha][1], sha) for sha, count in children.items() if count == 0]
+    heapq.heapify(ready)
+    while ready:
+        _newest, sha = heapq.heappop(ready)
+        author_time, committer_time, parents = commits.pop(sha)
+        yield sha, author_time, committer_time, parents
+        for parent in parents:
+            if parent in children:
+                children[parent] -= 1
+                if children[parent] == 0:
+                    heapq.heappush(ready, (-commits[parent][1], parent))
+
+
+class StoredBackend:
+    """Reads commits from a commit store shared with other repositories, adding the ones it does not have yet.
+
+    Refs are read by `backend`, and commits are looked up by SHA, so revisions given by
+    name are resolved with `git rev-parse` first.
+    """
+
+    def __init__(self, backend, store, run):
+        self.backend = backend
+        self.store = store
+        self.run = run
+        self._filled_from_refs = False
+
+    def tags(self):
+        return self.backend.tags()
+
+    def remote_branches(self):
+        return self.backend.remote_branches()
+
+    def ref_names(self):
+        return self.backend.ref_names()
+
+    def resolve(self, revisions: Iterable[str]) -> List[str]:
+        revisions = list(revisions)
+        names = [revision for revision in revisions if not is_sha(revision)]
+        if not names:
+            return revisions
+        with self.run(rev_parse(f"{name}^{{commit}}" for name in names)) as proc:
+            shas = proc.stdout.read().split()
+            if proc.wait() != 0 or len(shas) != len(names):
+                raise LookupError(f"no commit for {' '.join(names)} in {self.run.keywords['cwd']}")
+        resolved = dict(zip(names, shas))
+        return [resolved.get(revision, revision) for revision in revisions]
+
+    def walk(self, include: Iterable[str], exclude: Iterable[str]) -> Iterable[Tuple[str, int, List[str]]]:
+        return topo_order(self.reachable(include, exclude))
+
+    def walk_with_committer_time(self, include: Iterable[str],
+                                 exclude: Iterable[str]) -> Iterable[Tuple[str, int, int, List[str]]]:
+        return topo_order_with_committer_time(self.reachable(include, exclude))
+
+    def reachable(self, include: Iterable[str], exclude: Iterable[str]) -> Dict[str, Tuple[int, int, List[str]]]:
+        include, exclude = self.resolve(include), self.resolve(exclude)
+        self.store.fill(self.run, include + exclude)
+        return self.store.reachable(include, exclude)
+
+    def author_time(self, name: str) -> int:
+        commit = self.store.commits.get(name)
+        if commit is None and not self._filled_from_refs:
+            # Commits are looked up one at a time, so add everything the tags and branches reach at once
+            self._filled_from_refs = True
+            tips = [sha for _tag, _date, sha in self.tags()] + [sha for _branch, sha in self.remote_branches()]
+            self.store.fill(self.run, tips)
+            commit = self.store.commits.get(name)
+        if commit is None:
+            return self.backend.author_time(name)
+        return commit[0]
+
+
+def is_shallow(path_to_git_repo) -> bool:
+    """Whether the repository is a shallow clone, without the parents of some of its commits."""
+    return os.path.exists(os.path.join(find_git_dir(path_to_git_repo), "shallow"))
+
+
+def is_sha(revision: str) -> bool:
+    return len(revision) in (40, 64) and all(c in "0123456789abcdef" for c in revision)
+
+
+class BackendMismatch(Exception):
+    pass
+
+
+class CompareBackend:
+    """Answers from the first backend after checking that the second one agrees."""
+
+    def __init__(self, backend, reference):
+        self.backend = backend
+        self.reference = reference
+
+    def _compare(self, method, normalise, *args):
+        result = list(getattr(self.backend, method)(*args))
+        expected = list(getattr(self.reference, method)(*args))
+        if normalise(result) != normalise(expected):
+            raise BackendMismatch(f"{method}{args}: {result!r} != {expected!r}")
+        return result
+
+    def tags(self):
+        return self._compare("tags", list)
+
+    def remote_branches(self):
+        return self._compare("remote_branches", list)
+
+    def ref_names(self):
+        return self._compare("ref_names", list)
+
+    def walk(self, include, exclude):
+        return self._compare("walk", sorted, list(include), list(exclude))
+
+    def walk_with_committer_time(self, include, exclude):
+        return self._compare("walk_with_committer_time", sorted, list(include), list(exclude))
+
+    def author_time(self, name):
+        result = self.backend.author_time(name)
+        expected = self.reference.author_time(name)
+        if result != expected:
+            raise BackendMismatch(f"author_time({name!r}): {result!r} != {expected!r}")
+        return result
+
+
+BACKENDS = ("subprocess", "in-process", "compare")
+
+_backends = {}
+
+
+def backend_for(run):
+    """The backend chosen for `run` by `mk_run`, git subprocesses unless told otherwise.
+
+    Commits come from the current commit store, if there is one and the repository is not a shallow clone.
+    Backends that read the repository themselves keep what they read, so they are made again whenever the
+    refs, packs or shallow file have changed since.
+    """
+    store = current_commit_store()
+    kind = getattr(run, "backend", "subprocess")
+    stamp = None if kind == "subprocess" else refs_stamp(find_git_dir(run.keywords["cwd"]))
+    cached = _backends.get((run, store))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if kind == "subprocess":
+        backend = SubprocessBackend(run)
+    elif kind == "in-process":
+        backend = InProcessBackend(run.keywords["cwd"])
+    elif kind == "compare":
+        backend = CompareBackend(InProcessBackend(run.keywords["cwd"]), SubprocessBackend(run))
+    else:
+        raise ValueError(f"unknown backend {kind}, use one of: {', '.join(BACKENDS)}")
+    if store is not None and not is_shallow(run.keywords["cwd"]):
+        backend = StoredBackend(backend, store, run)
+    _backends[(run, store)] = (stamp, backend)
+    return backend
+
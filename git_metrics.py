@@ -1,18 +1,37 @@
 """Calculate age of commits in open remote branches
 
 Usage:
-    git_metrics.py open-branches [--master-branch=<branch>] <path_to_git_repo>
-    git_metrics.py open-branches [--master-branch=<branch>] --plot <path_to_git_repo>
-    git_metrics.py release-lead-time [--tag-pattern=<fn_match>] [--earliest-date=<timestamp>] <path_to_git_repo>
-    git_metrics.py release-lead-time --plot [--tag-pattern=<fn_match>] <path_to_git_repo>
-    git_metrics.py plot --open-branches <csv_file>
-    git_metrics.py plot --release-lead-time <csv_file>
-    git_metrics.py batch --open-branches <path_to_git_repos>...
-    git_metrics.py batch --release-lead-time [--earliest-date=<timestamp>] <path_to_git_repos>...
+    git_metrics.py open-branches [--master-branch=<branch>] [--backend=<name>] [--snapshot=<file>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    git_metrics.py open-branches [--master-branch=<branch>] [--backend=<name>] [--trace=<file>] [--profile=<file>] --plot <path_to_git_repo>
+    git_metrics.py open-branches-history [--master-branch=<branch>] [--earliest-date=<timestamp>] [--step=<seconds>] [--backend=<name>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    git_metrics.py release-lead-time [--tag-pattern=<fn_match>] [--earliest-date=<timestamp>] [--backend=<name>] [--cherry [--jobs=<n>]] [--snapshot=<file>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    git_metrics.py release-lead-time (--sample=<n> [--time-budget=<seconds>] | --time-budget=<seconds>) [--tag-pattern=<fn_match>] [--earliest-date=<timestamp>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    git_metrics.py release-lead-time --plot [--tag-pattern=<fn_match>] [--backend=<name>] [--trace=<file>] [--profile=<file>] <path_to_git_repo>
+    git_metrics.py plot --open-branches [--output=<file>] [--max-points=<n>] [--profile=<file>] <csv_file>
+    git_metrics.py plot --release-lead-time [--output=<file>] [--max-points=<n>] [--profile=<file>] <csv_file>
+    git_metrics.py batch --open-branches [--jobs=<n>] [--snapshot=<file>] [--trace=<file>] [--profile=<file>] [--checkpoint=<dir> [--resume]] [--commit-store=<file>] <path_to_git_repos>...
+    git_metrics.py batch --release-lead-time [--earliest-date=<timestamp>] [--jobs=<n>] [--snapshot=<file>] [--trace=<file>] [--profile=<file>] [--checkpoint=<dir> [--resume]] [--commit-store=<file>] <path_to_git_repos>...
     git_metrics.py (-h | --help)
 
     Options:
         --master-branch=<branch>    example: origin/gh-pages
+        --jobs=<n>                  number of repositories, or with --cherry tag pairs, to analyse in parallel [default: 1]
+        --cherry                    compare adjacent tags like git cherry, leaving out commits that were cherry-picked
+        --sample=<n>                estimate lead time from releases read in random order until <n> commits are read
+        --time-budget=<seconds>     estimate lead time from releases read in random order until <seconds> have passed
+        --step=<seconds>            time between the dates open-branches-history reports, the last one now, starting after
+                                    --earliest-date or a year ago [default: 604800]
+        --backend=<name>            how to read the repository: subprocess, in-process or compare [default: subprocess]
+        --snapshot=<file>           write a binary snapshot to <file> instead of csv to stdout, plot reads both
+        --output=<file>             write the plot to a png or svg file instead of showing it
+        --max-points=<n>            plot quantile bands instead of single commits above <n> commits [default: 20000]
+        --trace=<file>              write the git commands run, with their timings and output sizes, as json to <file>
+        --profile=<file>            write a cProfile dump of the run to <file>, and wall time and peak memory per stage
+                                    to stderr, of the main process only with --jobs
+        --checkpoint=<dir>          save the rows of each repository in <dir> as soon as it is done
+        --resume                    reuse the rows saved in the checkpoint for repositories that have not changed
+        --commit-store=<file>       keep author time and parents of every commit in the sqlite file <file>, shared by
+                                    forks and mirrors, so that a commit is read from only one repository
 """
 import time
 from fnmatch import fnmatch
@@ -23,101 +42,277 @@ import os
 import docopt
 import sys
 
+from checkpoint import Checkpoint, checkpointed
+from commit_store import commit_store_at, current_commit_store, open_commit_store
+from columnar_snapshot import ColumnarSnapshot, ColumnarSnapshotWriter, is_snapshot_file
 from git_metrics_open_branches import plot_open_branches_metrics
 from git_metrics_open_branches import get_branches
-from git_metrics_open_branches import commit_author_time_and_branch_ref
-from git_metrics_release_lead_time import commit_author_time_tag_author_time_and_from_to_tag_name
+from git_metrics_open_branches import open_branch_records
+from git_metrics_open_branches import history_dates, open_branches_history
+from git_metrics_release_lead_time import commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry
+from git_metrics_release_lead_time import RepositorySnapshot
 from git_metrics_release_lead_time import plot_release_lead_time_metrics
-from process import mk_run
+from process import mk_run, start_trace, current_trace, trace_to, close_object_lookups
+from profiling import profile_to, staged
+from records import OPEN_BRANCHES_COLUMNS, RELEASE_LEAD_TIME_COLUMNS, YEAR, RecordBatch
+from sampling import estimate_lead_time
 
 
-def read_open_branches_csv_file(filename):
-    with open(filename) as csv_file:
-        reader = csv.reader(csv_file, delimiter=',')
-        yield from ((int(n), int(t), b, repo_name) for n, t, b, repo_name in reader if n.isdigit())
+def read_frame_file(filename, columns, chunksize=1000000):
+    """Load a csv or snapshot file as a DataFrame, with int64 times and categorical names."""
+    import numpy as np
+    from pandas import DataFrame, read_csv
+    from pandas.api.types import union_categoricals
 
+    if is_snapshot_file(filename):
+        return ColumnarSnapshot(filename).to_frame(columns)
+    times, names = columns[:2], columns[2:]
+    dtype = dict(dict.fromkeys(times, np.int64), **dict.fromkeys(names, "category"))
+    # Header lines are dropped wherever they are, csv files of several repositories concatenated repeat them
+    chunks = [
+        chunk[chunk[columns[0]].str.isdigit().fillna(False).astype(bool)].astype(dtype)
+        for chunk in read_csv(filename, header=None, names=columns, dtype=str, chunksize=chunksize)
+    ]
+    if not chunks:
+        return DataFrame({column: np.zeros(0, dtype[column]) for column in columns}).astype(dtype)
+    frame = {column: np.concatenate([chunk[column].to_numpy() for chunk in chunks]) for column in times}
+    frame.update({column: union_categoricals([chunk[column] for chunk in chunks]) for column in names})
+    return DataFrame(frame, columns=columns)
 
+
+@staged("output")
+def write_snapshot_file(filename, kind, data, tags_by_repo=None):
+    with ColumnarSnapshotWriter(filename, kind) as writer:
+        writer.write_rows(data)
+        for repo_name, tags in (tags_by_repo or {}).items():
+            writer.write_tags(repo_name, tags)
+
+
+@staged("output")
 def write_open_branches_csv_file(data):
     writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
     writer.writerow(("query timestamp", "commit timestamp", "branch name", "repo name"))
     writer.writerows(data)
 
 
-def read_release_lead_time_csv_file(filename):
-    with open(filename) as csv_file:
-        reader = csv.reader(csv_file, delimiter=',')
-        yield from ((int(n), int(t), tag1, tag2, repo_name) for n, t, tag1, tag2, repo_name in reader if n.isdigit())
+@staged("output")
+def write_open_branches_history_csv_file(data):
+    writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
+    writer.writerow((
+        "timestamp", "unmerged commits", "mean age", "median age", "90th percentile age", "oldest age", "repo name"
+    ))
+    writer.writerows(data)
 
 
+@staged("output")
 def write_release_lead_time_csv_file(data):
     writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
     writer.writerow(("commit timestamp", "tag timestamp", "previous release tag", "release tag", "repo name"))
     writer.writerows(data)
 
 
+@staged("output")
+def write_lead_time_estimate_csv_file(estimate, repo_name):
+    writer = csv.writer(sys.stdout, delimiter=',', lineterminator='\n')
+    writer.writerow((
+        "statistic", "estimate", "95% low", "95% high", "commits read", "releases read", "releases", "repo name"
+    ))
+    for e in estimate.estimates:
+        writer.writerow((
+            e.statistic, e.value, e.low, e.high, estimate.commits, estimate.releases_read, estimate.releases, repo_name
+        ))
+
+
 def main():
     flags = docopt.docopt(__doc__)
+    with profile_to(flags['--profile']), trace_to(flags['--trace']):
+        run_command(flags)
+
+
+def run_command(flags):
     now = int(time.time())
     if flags['<path_to_git_repo>']:
         path_to_git_repo = flags['<path_to_git_repo>']
         repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
-        run = mk_run(path_to_git_repo)
+        run = mk_run(path_to_git_repo, flags['--backend'])
         if flags["open-branches"]:
             master_branch = flags['--master-branch'] or 'origin/master'
             assert_master_branch(run, master_branch)
-            gen = commit_author_time_and_branch_ref(run, master_branch)
-            data = ((now, t, b, repo_name) for t, b in gen)
+            data = open_branch_records(run, master_branch, now, repo_name)
             if flags['--plot']:
                 plot_open_branches_metrics(data)
+            elif flags['--snapshot']:
+                write_snapshot_file(flags['--snapshot'], "open-branches", data)
             else:
                 write_open_branches_csv_file(data)
+        elif flags["open-branches-history"]:
+            master_branch = flags['--master-branch'] or 'origin/master'
+            assert_master_branch(run, master_branch)
+            earliest_date = int(flags["--earliest-date"] or now - YEAR)
+            if int(flags["--step"]) <= 0:
+                print("--step must be positive", file=sys.stderr)
+                exit(1)
+            try:
+                rows = open_branches_history(run, master_branch, history_dates(earliest_date, now, int(flags["--step"])))
+            except LookupError as e:
+                print(e, file=sys.stderr)
+                exit(1)
+            write_open_branches_history_csv_file((*row, repo_name) for row in rows)
         elif flags["release-lead-time"]:
             earliest_date = int(flags["--earliest-date"] or 0)
             pattern = flags['--tag-pattern'] or '*'
-            gen = commit_author_time_tag_author_time_and_from_to_tag_name(
-                run,
-                partial(fnmatch, pat=pattern),
-                earliest_date,
-            )
-            data = ((cat, tat, old_tag, tag, repo_name) for cat, tat, old_tag, tag in gen)
+            snapshot = RepositorySnapshot(run)
+            if flags['--sample'] or flags['--time-budget']:
+                estimate = estimate_lead_time(
+                    run,
+                    partial(fnmatch, pat=pattern),
+                    earliest_date,
+                    int(flags['--sample']) if flags['--sample'] else None,
+                    float(flags['--time-budget']) if flags['--time-budget'] else None,
+                    snapshot,
+                )
+                write_lead_time_estimate_csv_file(estimate, repo_name)
+                return
+            if flags['--cherry']:
+                gen = commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry(
+                    run,
+                    partial(fnmatch, pat=pattern),
+                    earliest_date,
+                    int(flags['--jobs']),
+                )
+                data = RecordBatch.from_rows(
+                    "release-lead-time",
+                    ((cat, tat, old_tag, tag, repo_name) for cat, tat, old_tag, tag in gen)
+                )
+            else:
+                data = snapshot.release_records(partial(fnmatch, pat=pattern), earliest_date, repo_name)
             if flags['--plot']:
                 plot_release_lead_time_metrics(data)
+            elif flags['--snapshot']:
+                write_snapshot_file(flags['--snapshot'], "release-lead-time", data, {repo_name: snapshot.tags})
             else:
                 write_release_lead_time_csv_file(data)
     if flags["plot"]:
         if flags["--open-branches"]:
-            data = read_open_branches_csv_file(flags["<csv_file>"])
-            plot_open_branches_metrics(data)
+            data = read_frame_file(flags["<csv_file>"], OPEN_BRANCHES_COLUMNS)
+            plot_open_branches_metrics(data, flags["--output"], int(flags["--max-points"]))
         elif flags["--release-lead-time"]:
-            data = read_release_lead_time_csv_file(flags["<csv_file>"])
-            plot_release_lead_time_metrics(data)
-    elif flags["batch"] and flags["--open-branches"]:
-        for path_to_git_repo in flags['<path_to_git_repos>']:
-            print("checking master branch in repo:", path_to_git_repo, file=sys.stderr)
-            run = mk_run(path_to_git_repo)
-            assert_master_branch(run, 'origin/master')
-        data = []
-        for path_to_git_repo in flags['<path_to_git_repos>']:
-            print("fetching data from in repo:", path_to_git_repo, file=sys.stderr)
-            repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
-            run = mk_run(path_to_git_repo)
-            gen = commit_author_time_and_branch_ref(run, 'origin/master')
-            data.extend((now, t, b, repo_name) for t, b in gen)
-        write_open_branches_csv_file(data)
-    elif flags["batch"] and flags["--release-lead-time"]:
+            data = read_frame_file(flags["<csv_file>"], RELEASE_LEAD_TIME_COLUMNS)
+            plot_release_lead_time_metrics(data, flags["--output"], int(flags["--max-points"]))
+    elif flags["batch"]:
+        with commit_store_at(flags["--commit-store"]):
+            run_batch(flags, now)
+
+
+def run_batch(flags, now):
+    jobs = int(flags["--jobs"])
+    failed = []
+    tags_by_repo = {}
+    if flags["--open-branches"]:
+        fetch_rows = partial(open_branches_rows, now, 'origin/master')
+        fetch_rows = with_checkpoint(flags, "open-branches origin/master", fetch_rows)
+        if flags['--checkpoint']:
+            fetch_rows = partial(restamped_open_branches_rows, now, fetch_rows)
+        data = fetch_rows_from_repos(fetch_rows, flags['<path_to_git_repos>'], jobs, failed)
+        if flags['--snapshot']:
+            write_snapshot_file(flags['--snapshot'], "open-branches", data)
+        else:
+            write_open_branches_csv_file(data)
+    elif flags["--release-lead-time"]:
         earliest_date = int(flags["--earliest-date"] or 0)
-        data = []
-        for path_to_git_repo in flags['<path_to_git_repos>']:
-            print("fetching data from in repo:", path_to_git_repo, file=sys.stderr)
-            repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
-            run = mk_run(path_to_git_repo)
-            gen = commit_author_time_tag_author_time_and_from_to_tag_name(
-                run,
-                lambda _: True,
-                earliest_date=earliest_date
-            )
-            data.extend((cat, tat, old_tag, tag, repo_name) for cat, tat, old_tag, tag in gen)
-        write_release_lead_time_csv_file(data)
+        fetch_rows = partial(release_lead_time_rows, earliest_date)
+        fetch_rows = with_checkpoint(flags, f"release-lead-time {earliest_date}", fetch_rows)
+        data = fetch_rows_from_repos(fetch_rows, flags['<path_to_git_repos>'], jobs, failed, tags_by_repo)
+        if flags['--snapshot']:
+            write_snapshot_file(flags['--snapshot'], "release-lead-time", data, tags_by_repo)
+        else:
+            write_release_lead_time_csv_file(data)
+    if failed:
+        exit(1)
+
+
+def with_checkpoint(flags, query, fetch_rows):
+    if not flags['--checkpoint']:
+        return fetch_rows
+    return partial(checkpointed, Checkpoint(flags['--checkpoint'], query, flags['--resume']), fetch_rows)
+
+
+def open_branches_rows(now, master_branch, path_to_git_repo):
+    repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
+    run = mk_run(path_to_git_repo)
+    assert_master_branch(run, master_branch)
+    return open_branch_records(run, master_branch, now, repo_name), []
+
+
+def restamped_open_branches_rows(now, fetch_rows, path_to_git_repo):
+    """The rows of `fetch_rows` queried at `now`, since rows resumed from a checkpoint keep the time of their run."""
+    rows, tags = fetch_rows(path_to_git_repo)
+    return [(now, commit_time, branch, repo_name) for _then, commit_time, branch, repo_name in rows], tags
+
+
+def release_lead_time_rows(earliest_date, path_to_git_repo):
+    repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
+    snapshot = RepositorySnapshot(mk_run(path_to_git_repo))
+    return snapshot.release_records(lambda _: True, earliest_date, repo_name), snapshot.tags
+
+
+def fetch_rows_from_repos(fetch_rows, paths_to_git_repos, jobs, failed, tags_by_repo=None):
+    """Yield the rows of every repository in the given order, analysing up to `jobs` repositories at once.
+
+    `fetch_rows` returns the rows and tags of one repository, the tags go to `tags_by_repo`
+    by repository name. A repository that fails is reported on stderr and added to `failed`,
+    the others carry on.
+    """
+    fetch = partial(try_fetch_rows, fetch_rows)
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        trace = current_trace()
+        store = current_commit_store()
+        store_in_worker = {} if store is None else {"initializer": open_commit_store, "initargs": (store.path,)}
+        with ProcessPoolExecutor(max_workers=jobs, **store_in_worker) as pool:
+            results = pool.map(partial(fetch_in_worker, fetch, trace is not None), paths_to_git_repos)
+            results = add_to_trace(trace, results)
+            yield from collect_rows(zip(paths_to_git_repos, results), failed, tags_by_repo)
+    else:
+        results = map(fetch, paths_to_git_repos)
+        yield from collect_rows(zip(paths_to_git_repos, results), failed, tags_by_repo)
+
+
+def fetch_in_worker(fetch, traced, path_to_git_repo):
+    """Fetch in a pool worker, sending back the git commands it ran when tracing."""
+    if not traced:
+        return fetch(path_to_git_repo), []
+    trace = start_trace()
+    result = fetch(path_to_git_repo)
+    close_object_lookups()
+    return result, trace.commands
+
+
+def add_to_trace(trace, results):
+    for result, commands in results:
+        if trace is not None:
+            trace.commands.extend(commands)
+        yield result
+
+
+def try_fetch_rows(fetch_rows, path_to_git_repo):
+    print("fetching data from in repo:", path_to_git_repo, file=sys.stderr)
+    try:
+        rows, tags = fetch_rows(path_to_git_repo)
+        return rows, tags, None
+    except (Exception, SystemExit) as e:
+        return [], [], e
+
+
+def collect_rows(results, failed, tags_by_repo=None):
+    for path_to_git_repo, (rows, tags, error) in results:
+        if error is not None:
+            print(f"failed to fetch data from repo: {path_to_git_repo}: {error!r}", file=sys.stderr)
+            failed.append(path_to_git_repo)
+        elif tags_by_repo is not None:
+            tags_by_repo[os.path.basename(os.path.abspath(path_to_git_repo))] = tags
+        yield from rows
 
 
 def assert_master_branch(run, master_branch):
@@ -1,53 +1,184 @@
-from data import columns
-from custom_git import for_each_ref, log
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from functools import partial
+from itertools import accumulate
+from operator import or_
+from typing import Iterable, List, Optional, Tuple
 
+from data import label_commits
+from git_backend import backend_for
+from plotting import DEFAULT_MAX_POINTS, pyplot, show_or_save, quantile_bands, plot_quantile_bars
+from profiling import stage, staged
+from records import RecordBatch
+from sketch import nearest_rank
 
-def plot_open_branches_metrics(data):
-    import numpy as np
-    import matplotlib.pyplot as plt
-    from pandas import DataFrame
 
-    df = DataFrame(data, columns=("now", "time", "ref", "repo_name"))
-    repo_name = df["repo_name"][0]
+@staged("output")
+def plot_open_branches_metrics(data, output=None, max_points=DEFAULT_MAX_POINTS):
+    """Plot commit ages per branch, as quantile bars per branch when there are more than `max_points` commits."""
+    from pandas import DataFrame, factorize
+
+    plt = pyplot(output)
+    columns = ("now", "time", "ref", "repo_name")
+    if isinstance(data, RecordBatch):
+        data = data.to_frame(columns)
+    df = data if isinstance(data, DataFrame) else DataFrame(data, columns=columns)
+    repo_name = df["repo_name"].iloc[0]
     df["age"] = df["now"] - df["time"]
     df["age in days"] = df.age // 86400
-    unique_refs = df.ref.unique()
-    df["ref_id"] = df.ref.map(lambda ref: np.where(unique_refs == ref)[0])
+    df["ref_id"], unique_refs = factorize(df.ref)
+    fig, ax = plt.subplots()
     plt.xticks(
         range(len(unique_refs)),
         unique_refs,
         rotation=40,
         horizontalalignment='right'
     )
-    plt.plot(
-        df.ref_id,
-        df["age in days"],
-        'bo',
-        label="commit age in days"
-    )
-    plt.plot(
-        range(len(unique_refs)),
-        df.groupby("ref")["age in days"].median(),
-        'r^',
-        label="median commit age in days"
-    )
+    if len(df) > max_points:
+        plot_quantile_bars(ax, quantile_bands(df, "ref_id", "age in days"))
+    else:
+        plt.plot(
+            df.ref_id,
+            df["age in days"],
+            'bo',
+            label="commit age in days"
+        )
+        plt.plot(
+            range(len(unique_refs)),
+            df.groupby("ref_id")["age in days"].median(),
+            'r^',
+            label="median commit age in days"
+        )
     plt.title(f"Inventory - unmerged commits in {repo_name}")
     plt.tight_layout()
     plt.legend()
-    plt.show()
+    show_or_save(plt, output)
 
 
 def commit_author_time_and_branch_ref(run, master_branch):
-    get_refs = for_each_ref('refs/remotes/origin/**', format='%(refname:short) %(authordate:unix)')
-    with run(get_refs) as program:
-        for branch, t in columns(program.stdout):
-            get_time = log(f"{master_branch}..{branch}", format='%at')
-            with run(get_time) as inner_program:
-                for author_time, in columns(inner_program.stdout):
-                    yield int(author_time), branch
+    """Yield the author time of every commit on every remote branch that is not merged to master, newest first.
+
+    All branches are walked together in one `git log`, each commit carrying a bit mask
+    of the branches that contain it, so commits shared by several branches are read once.
+    """
+    for branch, author_times in branch_commit_times(run, master_branch):
+        for author_time in author_times:
+            yield author_time, branch
+
+
+def open_branch_records(run, master_branch, now, repo_name) -> RecordBatch:
+    """The rows of `commit_author_time_and_branch_ref` as a record batch, queried at `now`."""
+    batch = RecordBatch("open-branches")
+    for branch, author_times in branch_commit_times(run, master_branch):
+        batch.extend_branch(now, author_times, branch, repo_name)
+    return batch
+
+
+def branch_commit_times(run, master_branch) -> Iterable[Tuple[str, array]]:
+    backend = backend_for(run)
+    with stage("branch listing"):
+        branches = backend.remote_branches()
+    if not branches:
+        return
+    author_times = defaultdict(partial(array, "q"))
+    with stage("range computation"):
+        commits = backend.walk(
+            include=(sha for _branch, sha in branches),
+            exclude=[master_branch],
+        )
+        labels = ((sha, 1 << index) for index, (_branch, sha) in enumerate(branches))
+        for _sha, author_time, _parents, branch_mask in label_commits(commits, labels, or_):
+            while branch_mask:
+                lowest_bit = branch_mask & -branch_mask
+                author_times[lowest_bit.bit_length() - 1].append(author_time)
+                branch_mask ^= lowest_bit
+    for index, (branch, _sha) in enumerate(branches):
+        # Newest commit first, as `git log` lists the commits of a branch
+        yield branch, array("q", sorted(author_times.pop(index, ()), reverse=True))
+
+
+def history_dates(earliest_date, now, step) -> List[int]:
+    """Every `step` seconds after `earliest_date`, ending at `now`."""
+    if step <= 0:
+        raise ValueError(f"step must be positive, not {step}")
+    return list(range(now - (now - earliest_date) // step * step, now + 1, step))
+
+
+def open_branches_history(run, master_branch, dates: List[int]) -> List[tuple]:
+    """Each of `dates`, how many commits were unmerged then, and their mean, median, 90th percentile and oldest age.
+
+    One walk of master and every remote branch labels each commit with the first commit of
+    master's first-parent history that contains it, like release lead time labels commits
+    with tags. A commit is unmerged from its author time until that first-parent commit was
+    committed, or for good if only branches have it. The first-parent commits themselves are
+    not counted, and neither are branches deleted before they were merged.
+    """
+    backend = backend_for(run)
+    with stage("branch listing"):
+        branches = backend.remote_branches()
+    master = dict(branches).get(master_branch)
+    if master is None:
+        raise LookupError(f"no remote branch {master_branch}")
+    with stage("range computation"):
+        commits = list(backend.walk_with_committer_time(include=[sha for _branch, sha in branches], exclude=[]))
+        intervals = unmerged_intervals(commits, master)
+    return [(date, *age_statistics(date, author_times)) for date, author_times in unmerged_at(intervals, dates)]
+
+
+def unmerged_intervals(commits: List[Tuple[str, int, int, list]], master: str) -> List[Tuple[int, Optional[int]]]:
+    """From when to when each commit was unmerged, until None if it still is.
+
+    `commits` are topo-ordered with author and committer time. A first-parent commit lands
+    at its committer time, since rebased and fast-forwarded commits keep their author time.
+    """
+    parents_of = {sha: parents for sha, _author_time, _committer_time, parents in commits}
+    first_parents = []
+    sha = master
+    while sha is not None:
+        first_parents.append(sha)
+        parents = parents_of.get(sha)
+        sha = parents[0] if parents else None
+    first_parents.reverse()
+    committer_time_of = {sha: committer_time for sha, _author_time, committer_time, _parents in commits}
+    # A commit is not in master before the first-parent commits before it, whatever their committer times
+    merged_at = list(accumulate((committer_time_of[sha] for sha in first_parents), max))
+    on_master = set(first_parents)
+    labels = ((sha, index) for index, sha in enumerate(first_parents))
+    author_times = ((sha, author_time, parents) for sha, author_time, _committer_time, parents in commits)
+    intervals = []
+    for sha, author_time, _parents, index in label_commits(author_times, labels, min):
+        if sha not in on_master:
+            intervals.append((author_time, merged_at[index]))
+        parents_of.pop(sha)
+    author_time_of = {sha: author_time for sha, author_time, _committer_time, _parents in commits}
+    intervals.extend((author_time_of[sha], None) for sha in parents_of)
+    return [(start, end) for start, end in intervals if end is None or start < end]
+
+
+def unmerged_at(intervals: List[Tuple[int, Optional[int]]], dates: List[int]) -> Iterable[Tuple[int, List[int]]]:
+    """The sorted author times of the commits unmerged at each of the sorted `dates`, in one sweep."""
+    starts = sorted(start for start, _end in intervals)
+    ends = sorted((end, start) for start, end in intervals if end is not None)
+    unmerged = []
+    next_start = next_end = 0
+    for date in dates:
+        while next_start < len(starts) and starts[next_start] <= date:
+            insort(unmerged, starts[next_start])
+            next_start += 1
+        while next_end < len(ends) and ends[next_end][0] <= date:
+            del unmerged[bisect_left(unmerged, ends[next_end][1])]
+            next_end += 1
+        yield date, unmerged
+
+
+def age_statistics(date, author_times: List[int]):
+    """Count, mean, median, 90th percentile and highest age at `date` of commits with sorted `author_times`."""
+    if not author_times:
+        return 0, "N/A", "N/A", "N/A", "N/A"
+    ages = [date - author_time for author_time in reversed(author_times)]
+    return len(ages), sum(ages) / len(ages), nearest_rank(ages, 0.5), nearest_rank(ages, 0.9), ages[-1]
 
 
 def get_branches(run):
-    with run(for_each_ref(format='%(refname)')) as cmd:
-        for line in cmd.stdout:
-            yield line.strip()
+    return backend_for(run).ref_names()
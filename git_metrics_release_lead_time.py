@@ -1,12 +1,17 @@
-from itertools import zip_longest
-from typing import Tuple, Iterable, List
-
-import matplotlib
-
-from data import columns, zip_with_tail
-from custom_git import for_each_ref, show
-from custom_git import cherry
-from process import proc_to_stdout
+from array import array
+from collections import defaultdict
+from functools import partial
+from typing import Tuple, Iterable, List, Optional
+
+from data import columns, zip_with_tail, label_commits
+from custom_git import for_each_ref
+from custom_git import log
+from git_backend import backend_for
+from patch_ids import unpicked_commits, unpicked_commits_of_pairs, async_unpicked_commits
+from plotting import DEFAULT_MAX_POINTS, MAX_ANNOTATIONS, pyplot, show_or_save, quantile_bands, plot_quantile_area
+from process import proc_to_stdout, async_stdout, run_in_order
+from profiling import stage, staged
+from records import RecordBatch
 
 TAGS_WITH_AUTHOR_DATE_CMD = for_each_ref(
     'refs/tags/**',
@@ -19,6 +24,8 @@ TAGS_WITH_COMMIT_SHA_CMD = for_each_ref(
     format='%(refname:short) %(*objectname)',
 )
 
+AUTHOR_TIMES_CMD = log(format='%at', stdin=True, no_walk='unsorted')
+
 
 def tags_with_author_date(run) -> Iterable[Tuple[str, int]]:
     proc = run(TAGS_WITH_AUTHOR_DATE_CMD)
@@ -31,39 +38,139 @@ def parse_tags_with_date(lines: Iterable[str]) -> Iterable[Tuple[str, int]]:
             len(tag_and_maybe_date) > 1)
 
 
+class RepositorySnapshot:
+    """Tag names, tagger dates and peeled commit SHAs of a repository, listed once and shared by every metric."""
+
+    def __init__(self, run):
+        self.run = run
+        self._tags = None
+
+    @property
+    def tags(self) -> List[Tuple[str, int, str]]:
+        if self._tags is None:
+            with stage("tag listing"):
+                self._tags = backend_for(self.run).tags()
+        return self._tags
+
+    def tags_and_author_dates(self, match_tag, earliest_date=0) -> List[Tuple[str, int]]:
+        return [(tag, date) for tag, date, _sha in self.tags if match_tag(tag) and date > earliest_date]
+
+    def tags_and_sha(self, match_tag) -> List[Tuple[str, str]]:
+        return [(tag, sha) for tag, _date, sha in self.tags if match_tag(tag)]
+
+    def release_rows(self, match_tag, earliest_date=0) -> Iterable[Tuple[int, int, str, str]]:
+        return commit_author_time_tag_author_time_and_from_to_tag_name(self.run, match_tag, earliest_date, self)
+
+    def release_records(self, match_tag, earliest_date=0, repo_name="") -> RecordBatch:
+        return release_records(self.run, match_tag, earliest_date, self, repo_name)
+
+
 def diff_of_commits_between(run, upstream: str, head: str) -> Iterable[str]:
-    cmd = cherry(upstream, head)
-    proc = run(cmd)
-    stdout = proc_to_stdout(proc)
-    for sign, commit in columns(stdout):
-        if sign == '+':
-            yield commit
+    """The commits of `head` that are not in `upstream`, leaving out those cherry-picked to it, like `git cherry`."""
+    return unpicked_commits(run, upstream, head)
 
 
+@staged("date lookup")
 def date_from_git_objects(run, objects: Iterable[str]) -> List[int]:
-    cmd = show(objects=objects, diff=False, format='%at')
-    proc = run(cmd)
-    stdout = proc_to_stdout(proc)
-    return list(int(line) for line in stdout)
+    backend = backend_for(run)
+    return list(backend.author_time(obj) for obj in objects)
+
+
+def commit_author_time_tag_author_time_and_from_to_tag_name(run, match_tag, earliest_date=0, snapshot=None):
+    """Attribute every commit to the first matching tag that contains it, walking history once.
 
+    Commits reachable from a tag at or before `earliest_date` are excluded from the
+    walk altogether, since they belong to a tag that is not reported.
+    """
+    tags, first = reported_tags(snapshot or RepositorySnapshot(run), match_tag, earliest_date)
+    if first is not None:
+        yield from release_rows_from(run, tags, first)
 
-def commit_author_time_tag_author_time_and_from_to_tag_name(run, match_tag, earliest_date=0):
+
+def release_records(run, match_tag, earliest_date=0, snapshot=None, repo_name="") -> RecordBatch:
+    """The rows of `commit_author_time_tag_author_time_and_from_to_tag_name` as a record batch."""
+    batch = RecordBatch("release-lead-time")
+    tags, first = reported_tags(snapshot or RepositorySnapshot(run), match_tag, earliest_date)
+    if first is not None:
+        for old_tag, tag, tag_author_time, commit_times in releases_from(run, tags, first):
+            batch.extend_release(commit_times, tag_author_time, old_tag, tag, repo_name)
+    return batch
+
+
+def reported_tags(snapshot, match_tag, earliest_date) -> Tuple[List[Tuple[str, int, str]], Optional[int]]:
+    """The matching tags, and the index of the first one reported after `earliest_date`, if any."""
+    tags = [(tag, date, sha) for tag, date, sha in snapshot.tags if match_tag(tag)]
+    first = next((i for i, (_tag, date, _sha) in enumerate(tags) if i > 0 and date > earliest_date), None)
+    return tags, first
+
+
+def release_rows_from(run, tags: List[Tuple[str, int, str]], first: int) -> Iterable[Tuple[int, int, str, str]]:
+    """Rows of `tags[first:]`, oldest tag first, leaving out commits reachable from `tags[:first]`.
+
+    The rows of earlier tags do not change when tags are added after them, so this also
+    extends the rows of a tag list that has grown.
+    """
+    for old_tag, tag, tag_author_time, commit_times in releases_from(run, tags, first):
+        for commit_author_time in commit_times:
+            yield commit_author_time, tag_author_time, old_tag, tag
+
+
+def releases_from(run, tags: List[Tuple[str, int, str]], first: int) -> Iterable[Tuple[str, str, int, array]]:
+    """Previous tag, tag, tag date and the author times of the commits of each tag in `tags[first:]`, oldest first."""
+    commit_times = defaultdict(partial(array, "q"))
+    with stage("range computation"):
+        commits = backend_for(run).walk(
+            include=(sha for _tag, _date, sha in tags[first:]),
+            exclude=(sha for _tag, _date, sha in tags[:first]),
+        )
+        labels = ((sha, index) for index, (_tag, _date, sha) in enumerate(tags) if index >= first)
+        for _sha, author_time, parents, index in label_commits(commits, labels, min):
+            if len(parents) <= 1:
+                commit_times[index].append(author_time)
+    tag_pairs = zip_with_tail(tags[first - 1:])
+    for index, ((old_tag, _old_date, _old_sha), (tag, tag_author_time, _sha)) in enumerate(tag_pairs, start=first):
+        # Oldest commit first, as `git cherry` lists the commits of a tag pair
+        yield old_tag, tag, tag_author_time, array("q", sorted(commit_times.pop(index, ())))
+
+
+def commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry(run, match_tag, earliest_date=0, jobs=1):
+    """Commits between adjacent tags, leaving out commits already cherry-picked, as `git cherry` does.
+
+    With `jobs` above one, up to `jobs` tag pairs are queried at once, and the rows still
+    come in tag order.
+    """
     def match_tag_value(p):
         tag_name, _date = p
         return match_tag(tag_name)
-    filtered_on_tags = fetch_tags_and_author_dates_with_filter(
-        run,
-        match_tag_value
-    )
-    tag_pairs = zip_with_tail(filtered_on_tags)
-    for (old_tag, old_author_time), (tag, tag_author_time) in tag_pairs:
-        if tag_author_time <= earliest_date:
-            continue
-        commits = diff_of_commits_between(run, old_tag, tag)
-        for chunked_commits in zip_longest(*([iter(commits)] * 25)):
-            removed_fill_value = filter(lambda x: x is not None, chunked_commits)
-            for commit_author_time in date_from_git_objects(run, removed_fill_value):
-                yield int(commit_author_time), int(tag_author_time), old_tag, tag
+    with stage("tag listing"):
+        filtered_on_tags = fetch_tags_and_author_dates_with_filter(
+            run,
+            match_tag_value
+        )
+        tag_pairs = [
+            (old_tag, tag, tag_author_time)
+            for (old_tag, _old_author_time), (tag, tag_author_time) in zip_with_tail(filtered_on_tags)
+            if tag_author_time > earliest_date
+        ]
+    if jobs > 1:
+        queries = (tag_pair_rows(run, old_tag, tag, tag_author_time) for old_tag, tag, tag_author_time in tag_pairs)
+        for rows in run_in_order(queries, jobs):
+            yield from rows
+        return
+    with stage("range computation"):
+        unpicked = unpicked_commits_of_pairs(run, [(old_tag, tag) for old_tag, tag, _tag_author_time in tag_pairs])
+    for (old_tag, tag, tag_author_time), commits in zip(tag_pairs, unpicked):
+        for commit_author_time in date_from_git_objects(run, commits):
+            yield int(commit_author_time), int(tag_author_time), old_tag, tag
+
+
+async def tag_pair_rows(run, old_tag, tag, tag_author_time) -> List[Tuple[int, int, str, str]]:
+    """The rows of one tag pair, from its commits that were not cherry-picked and their author times."""
+    commits = [f"{commit}\n" for commit in await async_unpicked_commits(run, old_tag, tag)]
+    if not commits:
+        return []
+    author_times = await async_stdout(run, AUTHOR_TIMES_CMD, stdin=commits)
+    return [(int(commit_author_time), int(tag_author_time), old_tag, tag) for commit_author_time in author_times]
 
 
 def fetch_tags_and_author_dates(run, match_tag, earliest_date=0):
@@ -92,41 +199,51 @@ def fetch_tags_and_sha(run, match_tag):
     )
 
 
-def plot_release_lead_time_metrics(data):
-    import matplotlib.pyplot as plt
-    from pandas import DataFrame
+@staged("output")
+def plot_release_lead_time_metrics(data, output=None, max_points=DEFAULT_MAX_POINTS):
+    """Plot commit ages per release, as quantile bands over time when there are more than `max_points` commits."""
+    from pandas import DataFrame, to_datetime
 
-    df = DataFrame(data, columns=("commit_time", "tag_time", "from_tag", "tag", "repo_name"))
-    repo_name = df["repo_name"][0]
+    plt = pyplot(output)
+    columns = ("commit_time", "tag_time", "from_tag", "tag", "repo_name")
+    if isinstance(data, RecordBatch):
+        data = data.to_frame(columns)
+    df = data if isinstance(data, DataFrame) else DataFrame(data, columns=columns)
+    repo_name = df["repo_name"].iloc[0]
     df["age"] = df["tag_time"] - df["commit_time"]
-    df["label"] = df["from_tag"] + '..' + df["tag"]
-    df["tag_date"] = matplotlib.dates.epoch2num(df["tag_time"])
+    df["tag_date"] = to_datetime(df["tag_time"], unit="s")
     df["age in days"] = df.age // 86400
-    tmp = df[df["tag"] < "REL-4.4.10"]
     df = df.sort_values('tag_time')
     fig, ax = plt.subplots()
-    plt.plot_date(
-        df["tag_date"],
-        df["age in days"],
-        'bo',
-        label="commit age in days"
-    )
-    plt.plot_date(
-        df["tag_date"].unique(),
-        df.groupby("tag_date")["age in days"].median(),
-        'r^',
-        label="median commit age in days",
-
-    )
-    for tag_date, group in df.groupby("tag_date"):
-        ax.annotate(
-            group["label"].max(),
-            (tag_date, group["age in days"].max() + 5),
-            horizontalalignment='center',
-            verticalalignment='bottom',
-            rotation=90
+    if len(df) > max_points:
+        plot_quantile_area(ax, quantile_bands(df, "tag_date", "age in days"))
+    else:
+        ax.plot(
+            df["tag_date"],
+            df["age in days"],
+            'bo',
+            label="commit age in days"
+        )
+        median = df.groupby("tag_date")["age in days"].median()
+        ax.plot(
+            median.index,
+            median,
+            'r^',
+            label="median commit age in days",
         )
+    labels = df[["tag_date", "from_tag", "tag"]].drop_duplicates()
+    labels["label"] = labels["from_tag"].astype(str) + '..' + labels["tag"].astype(str)
+    label_by_tag_date = labels.groupby("tag_date")["label"].max()
+    if len(label_by_tag_date) <= MAX_ANNOTATIONS:
+        for tag_date, max_age in df.groupby("tag_date")["age in days"].max().items():
+            ax.annotate(
+                label_by_tag_date[tag_date],
+                (tag_date, max_age + 5),
+                horizontalalignment='center',
+                verticalalignment='bottom',
+                rotation=90
+            )
     plt.legend()
     plt.tight_layout()
     plt.title(repo_name)
-    plt.show()
+    show_or_save(plt, output)
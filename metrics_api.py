@@ -0,0 +1,133 @@
+"""The metrics as NumPy arrays and pandas DataFrames, for notebooks and services that would otherwise parse the csv.
+
+Repositories are given by path and read with the backend named like `--backend` of the
+command line tools. Every call answers for the repository as it is then, also with the
+in-process backend, which is read again once refs or packs change. Nothing is printed,
+no log is configured, and NumPy and pandas are only imported when a function that
+returns them is called. Values the command line tools print as N/A are None, or NaN in
+arrays and DataFrames.
+"""
+import logging
+import os
+import time
+from fnmatch import fnmatch
+from functools import partial
+from typing import Dict, Iterator, Optional
+
+from calculate_four_metrics import (
+    calculate_MTTR, calculate_change_fail_rate, calculate_deploy_interval, calculate_lead_time, calculate_timeseries
+)
+from git_metrics_open_branches import history_dates, open_branch_records, open_branches_history
+from git_metrics_release_lead_time import RepositorySnapshot, release_records, releases_from, reported_tags
+from process import mk_run
+from records import OPEN_BRANCHES_COLUMNS, RELEASE_LEAD_TIME_COLUMNS, YEAR, RecordBatch
+
+OPEN_BRANCHES_HISTORY_COLUMNS = ("date", "unmerged_commits", "mean_age", "median_age", "p90_age", "oldest_age")
+TIMESERIES_COLUMNS = ("window_start", "window_end", "lead_time", "deploy_interval", "change_fail_rate", "recovery_time")
+WEEK = 7 * 86400
+
+# Without a handler of its own, a warning of the library would go to stderr through the last resort handler
+logging.getLogger("metrics").addHandler(logging.NullHandler())
+
+
+def repo_name_of(path_to_git_repo) -> str:
+    return os.path.basename(os.path.abspath(path_to_git_repo))
+
+
+def release_lead_time_frame(path_to_git_repo, tag_pattern="*", earliest_date=0, backend="subprocess"):
+    """The rows of `git_metrics.py release-lead-time`, with tag and repository names as categoricals."""
+    run = mk_run(path_to_git_repo, backend)
+    repo_name = repo_name_of(path_to_git_repo)
+    records = release_records(run, partial(fnmatch, pat=tag_pattern), earliest_date, repo_name=repo_name)
+    return records.to_frame(RELEASE_LEAD_TIME_COLUMNS)
+
+
+def release_lead_time_chunks(path_to_git_repo, tag_pattern="*", earliest_date=0, chunk_size=1000000,
+                             backend="subprocess") -> Iterator:
+    """`release_lead_time_frame` in DataFrames of whole releases, of at least `chunk_size` rows but the last."""
+    run = mk_run(path_to_git_repo, backend)
+    repo_name = repo_name_of(path_to_git_repo)
+    tags, first = reported_tags(RepositorySnapshot(run), partial(fnmatch, pat=tag_pattern), earliest_date)
+    if first is None:
+        return
+    batch = RecordBatch("release-lead-time")
+    for old_tag, tag, tag_author_time, commit_times in releases_from(run, tags, first):
+        batch.extend_release(commit_times, tag_author_time, old_tag, tag, repo_name)
+        if len(batch) >= chunk_size:
+            yield batch.to_frame(RELEASE_LEAD_TIME_COLUMNS)
+            batch = RecordBatch("release-lead-time")
+    if len(batch):
+        yield batch.to_frame(RELEASE_LEAD_TIME_COLUMNS)
+
+
+def lead_times(path_to_git_repo, tag_pattern="*", earliest_date=0, backend="subprocess"):
+    """The lead time in seconds of every commit `release_lead_time_frame` has, as an int64 array."""
+    import numpy as np
+
+    run = mk_run(path_to_git_repo, backend)
+    records = release_records(run, partial(fnmatch, pat=tag_pattern), earliest_date)
+    return np.frombuffer(records.times_b, dtype=np.int64) - np.frombuffer(records.times_a, dtype=np.int64)
+
+
+def open_branches_frame(path_to_git_repo, master_branch="origin/master", now=None, backend="subprocess"):
+    """The rows of `git_metrics.py open-branches`, queried at `now` or the current time."""
+    run = mk_run(path_to_git_repo, backend)
+    now = int(time.time()) if now is None else now
+    return open_branch_records(run, master_branch, now, repo_name_of(path_to_git_repo)).to_frame(OPEN_BRANCHES_COLUMNS)
+
+
+def open_branches_history_frame(path_to_git_repo, master_branch="origin/master", earliest_date=None, step=WEEK,
+                                now=None, backend="subprocess"):
+    """The rows of `git_metrics.py open-branches-history`, ages in seconds and NaN on dates without unmerged commits.
+
+    Raises LookupError if `master_branch` is not a remote branch.
+    """
+    from pandas import DataFrame
+
+    now = int(time.time()) if now is None else now
+    earliest_date = now - YEAR if earliest_date is None else earliest_date
+    dates = history_dates(earliest_date, now, step)
+    rows = open_branches_history(mk_run(path_to_git_repo, backend), master_branch, dates)
+    frame = DataFrame([[number(value) for value in row] for row in rows], columns=OPEN_BRANCHES_HISTORY_COLUMNS)
+    return frame.astype({"date": "int64", "unmerged_commits": "int64"}).astype(
+        {column: "float64" for column in OPEN_BRANCHES_HISTORY_COLUMNS[2:]}
+    )
+
+
+def four_metrics(path_to_git_repo, deploy_pattern="*", patch_pattern="*", start_date=0, now=None,
+                 backend="subprocess") -> Dict[str, Optional[float]]:
+    """The numbers of `calculate_four_metrics.py metrics-all` by name, from one listing of the tags.
+
+    Lead time, deploy interval and recovery time are in seconds, change fail rate in percent.
+    """
+    snapshot = RepositorySnapshot(mk_run(path_to_git_repo, backend))
+    now = int(time.time()) if now is None else now
+    return {
+        "lead_time": number(calculate_lead_time(path_to_git_repo, deploy_pattern, start_date, snapshot)),
+        "deploy_interval": number(
+            calculate_deploy_interval(path_to_git_repo, deploy_pattern, start_date, now, snapshot)
+        ),
+        "change_fail_rate": number(
+            calculate_change_fail_rate(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)
+        ),
+        "recovery_time": number(calculate_MTTR(path_to_git_repo, deploy_pattern, patch_pattern, start_date, snapshot)),
+    }
+
+
+def timeseries_frame(path_to_git_repo, deploy_pattern="*", patch_pattern="*", start_date=0, end_date=None,
+                     window=WEEK, step=None, backend="subprocess"):
+    """The rows of `calculate_four_metrics.py timeseries`, NaN in windows without the data for a metric."""
+    from pandas import DataFrame
+
+    snapshot = RepositorySnapshot(mk_run(path_to_git_repo, backend))
+    end_date = int(time.time()) if end_date is None else end_date
+    rows = calculate_timeseries(snapshot, deploy_pattern, patch_pattern, start_date, end_date, window, step or window)
+    frame = DataFrame([[number(value) for value in row] for row in rows], columns=TIMESERIES_COLUMNS)
+    return frame.astype({"window_start": "int64", "window_end": "int64"}).astype(
+        {column: "float64" for column in TIMESERIES_COLUMNS[2:]}
+    )
+
+
+def number(value) -> Optional[float]:
+    """`value`, or None for N/A."""
+    return None if value == "N/A" else value
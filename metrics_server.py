@@ -0,0 +1,232 @@
+"""Serve the four metrics and the collected rows of repositories, keeping their state warm
+
+Usage:
+    metrics_server.py [--host=<host>] [--port=<port>] [--backend=<name>] <path_to_git_repos>...
+    metrics_server.py --socket=<path> [--backend=<name>] <path_to_git_repos>...
+    metrics_server.py (-h | --help)
+
+Options:
+    --host=<host>       address to listen on [default: 127.0.0.1]
+    --port=<port>       port to listen on [default: 8080]
+    --socket=<path>     listen on a unix socket instead of a tcp port
+    --backend=<name>    how to read the repositories: subprocess, in-process or compare [default: subprocess]
+
+Endpoints, answered with json:
+    GET /repos
+    GET /repos/<name>/metrics?deploy-tag-pattern=<fn_match>&patch-tag-pattern=<fn_match>&start-date=<timestamp>
+    GET /repos/<name>/release-lead-time?tag-pattern=<fn_match>&earliest-date=<timestamp>
+    GET /repos/<name>/open-branches?master-branch=<branch>
+
+Errors are answered with {"error": <message>}, status 400 for a bad query, 404 for a
+repository, endpoint or commit that does not exist and 500 for anything else.
+"""
+import json
+import logging
+import os
+import socketserver
+import sys
+import time
+from fnmatch import fnmatch
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import docopt
+
+from calculate_four_metrics import calculate_lead_time, calculate_deploy_interval, calculate_change_fail_rate, \
+    calculate_MTTR
+from git_backend import backend_for
+from git_metrics_open_branches import commit_author_time_and_branch_ref, get_branches
+from git_metrics_release_lead_time import releases_from
+from object_database import find_git_dir, refs_stamp
+from process import mk_run
+from records import OPEN_BRANCHES_COLUMNS, RELEASE_LEAD_TIME_COLUMNS, RecordBatch
+
+log = logging.getLogger("metrics")
+
+
+class WarmRepository:
+    """Tags and collected rows of one repository, answering like a RepositorySnapshot.
+
+    The state is checked against the refs before every query. Release rows are kept per
+    list of matching tags, and when tags are only added after the known ones, only the
+    commits of the new tags are walked.
+    """
+
+    def __init__(self, path_to_git_repo, backend="subprocess"):
+        self.repo_name = os.path.basename(os.path.abspath(path_to_git_repo))
+        self.run = mk_run(path_to_git_repo, backend)
+        self.git_dir = find_git_dir(os.path.abspath(path_to_git_repo))
+        self.lock = Lock()
+        self.stamp = None
+        self.tags: List[Tuple[str, int, str]] = []
+        self._release_records: Dict[Tuple[Tuple[str, str], ...], RecordBatch] = {}
+        self._open_branches: Dict[str, List[Tuple[int, str]]] = {}
+
+    def refresh(self):
+        stamp = refs_stamp(self.git_dir)
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+        self.tags = backend_for(self.run).tags()
+        current = {(tag, sha) for tag, _date, sha in self.tags}
+        for key in [key for key in self._release_records if not current.issuperset(key)]:
+            del self._release_records[key]
+        self._open_branches.clear()
+
+    def tags_and_author_dates(self, match_tag, earliest_date=0) -> List[Tuple[str, int]]:
+        return [(tag, date) for tag, date, _sha in self.tags if match_tag(tag) and date > earliest_date]
+
+    def tags_and_sha(self, match_tag) -> List[Tuple[str, str]]:
+        return [(tag, sha) for tag, _date, sha in self.tags if match_tag(tag)]
+
+    def release_rows(self, match_tag, earliest_date=0) -> Iterable[Tuple[int, int, str, str]]:
+        for commit_time, date, old_tag, tag, _repo_name in self.release_records(match_tag, earliest_date):
+            yield commit_time, date, old_tag, tag
+
+    def release_records(self, match_tag, earliest_date=0, repo_name=None) -> RecordBatch:
+        tags = [(tag, date, sha) for tag, date, sha in self.tags if match_tag(tag)]
+        key = tuple((tag, sha) for tag, _date, sha in tags)
+        batch = self._release_records.get(key)
+        if batch is None:
+            known = max((known for known in self._release_records if key[:len(known)] == known), key=len, default=())
+            # A batch without rows is falsy, so only a missing one is started afresh
+            batch = self._release_records.pop(known, None)
+            if batch is None:
+                batch = RecordBatch("release-lead-time")
+            first = max(len(known), 1)
+            if len(tags) > first:
+                for old_tag, tag, tag_author_time, commit_times in releases_from(self.run, tags, first):
+                    batch.extend_release(commit_times, tag_author_time, old_tag, tag, self.repo_name)
+            self._release_records[key] = batch
+        return batch.filtered(date > earliest_date for date in batch.times_b)
+
+    def open_branches_rows(self, master_branch) -> List[Tuple[int, str]]:
+        rows = self._open_branches.get(master_branch)
+        if rows is None:
+            if not any(branch.endswith(master_branch) for branch in get_branches(self.run)):
+                raise ValueError(f"branch {master_branch} does not exist")
+            rows = self._open_branches[master_branch] = list(commit_author_time_and_branch_ref(self.run, master_branch))
+        return rows
+
+
+def metrics(repository: WarmRepository, query) -> dict:
+    deploy_pattern = query.get("deploy-tag-pattern", "*")
+    patch_pattern = query.get("patch-tag-pattern", "*")
+    start_date = int(query.get("start-date", 0))
+    return {
+        "lead_time": calculate_lead_time(None, deploy_pattern, start_date, repository),
+        "deploy_interval": calculate_deploy_interval(None, deploy_pattern, start_date, int(time.time()), repository),
+        "change_fail_rate": calculate_change_fail_rate(None, deploy_pattern, patch_pattern, start_date, repository),
+        "recovery_time": calculate_MTTR(None, deploy_pattern, patch_pattern, start_date, repository),
+    }
+
+
+def release_lead_time(repository: WarmRepository, query) -> dict:
+    match_tag = partial(fnmatch, pat=query.get("tag-pattern", "*"))
+    records = repository.release_records(match_tag, int(query.get("earliest-date", 0)))
+    return {"columns": RELEASE_LEAD_TIME_COLUMNS, "rows": list(records)}
+
+
+def open_branches(repository: WarmRepository, query) -> dict:
+    now = int(time.time())
+    rows = repository.open_branches_rows(query.get("master-branch", "origin/master"))
+    return {
+        "columns": OPEN_BRANCHES_COLUMNS,
+        "rows": [(now, t, branch, repository.repo_name) for t, branch in rows],
+    }
+
+
+ENDPOINTS = {
+    "metrics": metrics,
+    "release-lead-time": release_lead_time,
+    "open-branches": open_branches,
+}
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    repositories: Dict[str, WarmRepository] = {}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if parts == ["repos"]:
+            return self.respond(200, sorted(self.repositories))
+        if len(parts) != 3 or parts[0] != "repos" or parts[2] not in ENDPOINTS:
+            return self.respond(404, {"error": f"no such endpoint: {url.path}"})
+        repository = self.repositories.get(parts[1])
+        if repository is None:
+            return self.respond(404, {"error": f"no such repository: {parts[1]}"})
+        try:
+            with repository.lock:
+                repository.refresh()
+                body = ENDPOINTS[parts[2]](repository, query)
+        except ValueError as e:
+            return self.respond(400, {"error": str(e)})
+        except LookupError as e:
+            return self.respond(404, {"error": str(e)})
+        except Exception as e:
+            # Answer instead of dropping the connection, the traceback goes to the log
+            log.exception("failed to answer %s", self.path)
+            return self.respond(500, {"error": f"{type(e).__name__}: {e}"})
+        self.respond(200, body)
+
+    def respond(self, status, body):
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix socket"
+
+    def log_message(self, format, *args):
+        log.info("%s %s", self.address_string(), format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(repositories: Dict[str, WarmRepository], address, unix_socket=False):
+    handler = type("Handler", (MetricsHandler,), {"repositories": repositories})
+    server_class = ThreadingUnixHTTPServer if unix_socket else ThreadingHTTPServer
+    return server_class(address, handler)
+
+
+def warm_repositories(paths_to_git_repos, backend="subprocess") -> Dict[str, WarmRepository]:
+    repositories = {}
+    for path_to_git_repo in paths_to_git_repos:
+        repository = WarmRepository(path_to_git_repo, backend)
+        if repository.repo_name in repositories:
+            raise ValueError(f"two repositories are named {repository.repo_name}")
+        repositories[repository.repo_name] = repository
+    return repositories
+
+
+def main():
+    flags = docopt.docopt(__doc__)
+    try:
+        repositories = warm_repositories(flags["<path_to_git_repos>"], flags["--backend"])
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+    for repository in repositories.values():
+        print("reading repo:", repository.repo_name, file=sys.stderr)
+        repository.refresh()
+    if flags["--socket"]:
+        server = serve(repositories, flags["--socket"], unix_socket=True)
+    else:
+        server = serve(repositories, (flags["--host"], int(flags["--port"])))
+    print("serving metrics on:", flags["--socket"] or f"http://{flags['--host']}:{flags['--port']}", file=sys.stderr)
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import mmap
+import os
+import zlib
+from bisect import bisect_left
+from struct import unpack_from
+from typing import Dict, Iterable, List, Optional, Tuple
+
+OBJECT_TYPES = {1: b"commit", 2: b"tree", 3: b"blob", 4: b"tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+
+def find_git_dir(path_to_git_repo: str) -> str:
+    dot_git = os.path.join(path_to_git_repo, ".git")
+    if os.path.isfile(dot_git):
+        with open(dot_git) as f:
+            git_dir = f.read().strip()[len("gitdir: "):]
+        return os.path.join(path_to_git_repo, git_dir)
+    if os.path.isdir(dot_git):
+        return dot_git
+    return path_to_git_repo
+
+
+def refs_stamp(git_dir) -> Tuple[Tuple[str, int, int], ...]:
+    """Modification time and size of the refs, the pack directories and the shallow file.
+
+    They change whenever a ref does, a pack is added or removed, or a shallow clone is deepened.
+    """
+    paths = [os.path.join(git_dir, "packed-refs"), os.path.join(git_dir, "shallow"),
+             os.path.join(git_dir, "objects", "pack")]
+    for directory, _dirs, files in os.walk(os.path.join(git_dir, "refs")):
+        paths.extend(os.path.join(directory, file) for file in files)
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stamp.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stamp))
+
+
+class Pack:
+    """A version 2 pack index and its packfile, both memory mapped."""
+
+    def __init__(self, idx_path: str):
+        self.path = idx_path
+        self.idx = _mmap(idx_path)
+        self.pack = _mmap(idx_path[:-len(".idx")] + ".pack")
+        if self.idx[:8] != b"\377tOc\0\0\0\2":
+            raise ValueError(f"unsupported pack index: {idx_path}")
+        self.fanout = unpack_from(">256I", self.idx, 8)
+        self.count = self.fanout[255]
+        self.names_at = 8 + 256 * 4
+        self.offsets_at = self.names_at + self.count * (20 + 4)
+        self.large_offsets_at = self.offsets_at + self.count * 4
+
+    def _name(self, i: int) -> bytes:
+        at = self.names_at + i * 20
+        return self.idx[at:at + 20]
+
+    def offset(self, sha: bytes) -> Optional[int]:
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+        i = bisect_left(_Names(self), sha, lo, hi)
+        if i == hi or self._name(i) != sha:
+            return None
+        offset, = unpack_from(">I", self.idx, self.offsets_at + i * 4)
+        if offset & 0x80000000:
+            offset, = unpack_from(">Q", self.idx, self.large_offsets_at + (offset & 0x7fffffff) * 8)
+        return offset
+
+    def read(self, offset: int, database: "ObjectDatabase") -> Tuple[bytes, bytes]:
+        pos = offset
+        byte = self.pack[pos]
+        pos += 1
+        kind = (byte >> 4) & 7
+        while byte & 0x80:
+            byte = self.pack[pos]
+            pos += 1
+        if kind == OFS_DELTA:
+            byte = self.pack[pos]
+            pos += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = self.pack[pos]
+                pos += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base_type, base = self.read(offset - distance, database)
+            return base_type, apply_delta(base, self._inflate(pos))
+        if kind == REF_DELTA:
+            base_type, base = database.read(self.pack[pos:pos + 20].hex())
+            return base_type, apply_delta(base, self._inflate(pos + 20))
+        return OBJECT_TYPES[kind], self._inflate(pos)
+
+    def _inflate(self, pos: int) -> bytes:
+        inflater = zlib.decompressobj()
+        chunks = []
+        while not inflater.eof:
+            chunks.append(inflater.decompress(self.pack[pos:pos + 65536]))
+            pos += 65536
+        return b"".join(chunks)
+
+
+class _Names:
+    """Sequence view of the sorted object names in a pack index, for bisect."""
+
+    def __init__(self, pack: Pack):
+        self.pack = pack
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.pack._name(i)
+
+    def __len__(self) -> int:
+        return self.pack.count
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    pos = 0
+    for _size in range(2):
+        while delta[pos] & 0x80:
+            pos += 1
+        pos += 1
+    result = []
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for shift in range(4):
+                if op & (1 << shift):
+                    offset |= delta[pos] << (8 * shift)
+                    pos += 1
+            for shift in range(3):
+                if op & (0x10 << shift):
+                    size |= delta[pos] << (8 * shift)
+                    pos += 1
+            result.append(base[offset:offset + (size or 0x10000)])
+        else:
+            result.append(delta[pos:pos + op])
+            pos += op
+    return b"".join(result)
+
+
+class ObjectDatabase:
+    """Reads refs and objects of a repository from disk, without running git."""
+
+    def __init__(self, path_to_git_repo: str):
+        self.git_dir = find_git_dir(path_to_git_repo)
+        self.object_dirs = [os.path.join(self.git_dir, "objects")]
+        alternates = os.path.join(self.object_dirs[0], "info", "alternates")
+        if os.path.exists(alternates):
+            with open(alternates) as f:
+                self.object_dirs.extend(
+                    os.path.join(self.object_dirs[0], line.strip()) for line in f if line.strip()
+                )
+        self.packs: List[Pack] = []
+        self.scan_packs()
+        self.shallow = frozenset()
+        shallow = os.path.join(self.git_dir, "shallow")
+        if os.path.exists(shallow):
+            with open(shallow) as f:
+                self.shallow = frozenset(line.strip() for line in f if line.strip())
+
+    def scan_packs(self) -> bool:
+        """Open the packs added since the last scan and drop the removed ones, telling whether any were added."""
+        known = {pack.path: pack for pack in self.packs}
+        paths = [
+            os.path.join(object_dir, "pack", name)
+            for object_dir in self.object_dirs
+            if os.path.isdir(os.path.join(object_dir, "pack"))
+            for name in sorted(os.listdir(os.path.join(object_dir, "pack")))
+            if name.endswith(".idx")
+        ]
+        self.packs = [known.get(path) or Pack(path) for path in paths]
+        return any(path not in known for path in paths)
+
+    def read(self, sha: str) -> Tuple[bytes, bytes]:
+        for object_dir in self.object_dirs:
+            loose = os.path.join(object_dir, sha[:2], sha[2:])
+            if os.path.exists(loose):
+                with open(loose, "rb") as f:
+                    raw = zlib.decompress(f.read())
+                header, _, body = raw.partition(b"\0")
+                return header.split(b" ")[0], body
+        binary_sha = bytes.fromhex(sha)
+        for pack in self.packs:
+            offset = pack.offset(binary_sha)
+            if offset is not None:
+                return pack.read(offset, self)
+        # A repack or fetch since the packs were listed may have moved the object to a new pack
+        if self.scan_packs():
+            return self.read(sha)
+        raise KeyError(sha)
+
+    def commit(self, sha: str) -> Tuple[int, int, List[str]]:
+        """Author time, committer time and parents of a commit, none for the oldest commits of a shallow clone."""
+        kind, body = self.read(sha)
+        if kind != b"commit":
+            raise ValueError(f"{sha} is a {kind.decode()}, not a commit")
+        parents = []
+        author_time = committer_time = 0
+        for line in headers(body):
+            if line.startswith(b"parent ") and sha not in self.shallow:
+                parents.append(line[7:].decode())
+            elif line.startswith(b"author "):
+                author_time = signature_time(line)
+            elif line.startswith(b"committer "):
+                committer_time = signature_time(line)
+        return author_time, committer_time, parents
+
+    def tag(self, sha: str) -> Optional[Tuple[str, int]]:
+        """Object and tagger time of an annotated tag, or None if `sha` is not a tag."""
+        kind, body = self.read(sha)
+        if kind != b"tag":
+            return None
+        target, tagger_time = None, None
+        for line in headers(body):
+            if line.startswith(b"object "):
+                target = line[7:].decode()
+            elif line.startswith(b"tagger "):
+                tagger_time = signature_time(line)
+        return target, tagger_time
+
+    def refs(self) -> Dict[str, str]:
+        refs = {}
+        packed_refs = os.path.join(self.git_dir, "packed-refs")
+        if os.path.exists(packed_refs):
+            with open(packed_refs) as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+                    sha, name = line.split()
+                    refs[name] = sha
+        symbolic = {}
+        refs_dir = os.path.join(self.git_dir, "refs")
+        for directory, _dirs, files in os.walk(refs_dir):
+            for file in files:
+                path = os.path.join(directory, file)
+                name = os.path.relpath(path, self.git_dir).replace(os.sep, "/")
+                with open(path) as f:
+                    value = f.read().strip()
+                if value.startswith("ref: "):
+                    symbolic[name] = value[len("ref: "):]
+                else:
+                    refs[name] = value
+        for name, target in symbolic.items():
+            if target in refs:
+                refs[name] = refs[target]
+        return refs
+
+    def resolve(self, revision: str, refs: Dict[str, str]=None) -> str:
+        if revision == "HEAD":
+            with open(os.path.join(self.git_dir, "HEAD")) as f:
+                value = f.read().strip()
+            revision = value[len("ref: "):] if value.startswith("ref: ") else value
+        refs = self.refs() if refs is None else refs
+        for name in (revision, f"refs/{revision}", f"refs/tags/{revision}", f"refs/heads/{revision}",
+                     f"refs/remotes/{revision}", f"refs/remotes/{revision}/HEAD"):
+            if name in refs:
+                return refs[name]
+        if len(revision) == 40 and all(c in "0123456789abcdef" for c in revision):
+            return revision
+        raise KeyError(revision)
+
+    def peel_to_commit(self, sha: str) -> str:
+        while True:
+            tag = self.tag(sha)
+            if tag is None:
+                return sha
+            sha = tag[0]
+
+    def ancestors(self, tips: Iterable[str], stop=frozenset()) -> Dict[str, Tuple[int, int, List[str]]]:
+        """Every commit reachable from `tips` without passing through `stop`, with its commit data."""
+        seen = {}
+        stack = [sha for sha in tips if sha not in stop]
+        while stack:
+            sha = stack.pop()
+            if sha in seen:
+                continue
+            seen[sha] = commit = self.commit(sha)
+            stack.extend(parent for parent in commit[2] if parent not in seen and parent not in stop)
+        return seen
+
+
+def headers(body: bytes) -> Iterable[bytes]:
+    for line in body.split(b"\n"):
+        if not line:
+            return
+        yield line
+
+
+def signature_time(line: bytes) -> int:
+    return int(line.rsplit(b" ", 2)[1])
+
+
+def _mmap(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
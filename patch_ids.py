@@ -0,0 +1,133 @@
+"""Patch-ids of commits, kept next to the repository so that every commit is diffed only once.
+
+`git cherry` takes two commits to be the same change when their diffs have the same
+patch-id, and works out the patch-id of every commit on both sides again on every run.
+Here the patch-ids are saved by commit SHA in a file in the git directory, and only the
+commits that are not in it yet are diffed. Nothing is diffed when either side has no commits,
+which is every range of a linear history. Like in `git cherry`, merges are left out and
+commits with an empty diff all have the same patch-id.
+"""
+import logging
+import os
+from subprocess import PIPE
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+from custom_git import log as git_log, patch_id, rev_list
+from data import columns
+from object_database import find_git_dir
+from process import async_stdout, proc_to_stdout
+
+log = logging.getLogger("metrics")
+
+CACHE_FILE = "metrics-patch-ids"
+EMPTY_PATCH_ID = "-"
+
+PATCHES_CMD = git_log(format='commit %H', stdin=True, no_walk='unsorted', patch=True)
+PATCH_ID_CMD = patch_id()
+
+
+def sides_cmd(upstream: str, head: str) -> List[str]:
+    return rev_list(f"{upstream}...{head}", no_merges=True, reverse=True, left_right=True)
+
+
+class PatchIdCache:
+    """Patch-ids by commit SHA, read from and appended to one file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._ids = None
+
+    @property
+    def ids(self) -> Dict[str, str]:
+        with self._lock:
+            if self._ids is None:
+                self._ids = {}
+                try:
+                    with open(self.path) as f:
+                        for line in f:
+                            fields = line.split()
+                            # A line cut short by an interrupted run has no newline or too few fields
+                            if line.endswith("\n") and len(fields) == 2:
+                                self._ids[fields[0]] = fields[1]
+                except FileNotFoundError:
+                    pass
+            return self._ids
+
+    def missing(self, commits: Iterable[str]) -> List[str]:
+        ids = self.ids
+        return [commit for commit in dict.fromkeys(commits) if commit not in ids]
+
+    def add(self, commits: List[str], patch_id_lines: Iterable[str]):
+        """Save the patch-ids of `commits` from the output of `git patch-id`, which leaves out empty diffs."""
+        found = {commit: patch_id for patch_id, commit in columns(patch_id_lines)}
+        new = {commit: found.get(commit, EMPTY_PATCH_ID) for commit in commits}
+        ids = self.ids
+        with self._lock:
+            ids.update(new)
+            try:
+                with open(self.path, "a") as f:
+                    f.write("".join(f"{commit} {patch_id}\n" for commit, patch_id in new.items()))
+            except OSError as e:
+                log.warning("could not save patch-ids to %s: %s", self.path, e)
+
+    def unpicked(self, head_side: List[str], upstream_side: List[str]) -> List[str]:
+        """The commits of `head_side` with a patch-id that no commit of `upstream_side` has."""
+        if not head_side or not upstream_side:
+            return head_side
+        ids = self.ids
+        upstream_ids = {ids[commit] for commit in upstream_side}
+        return [commit for commit in head_side if ids[commit] not in upstream_ids]
+
+
+_caches = {}
+_caches_lock = Lock()
+
+
+def patch_id_cache(run) -> PatchIdCache:
+    path = os.path.join(find_git_dir(run.keywords["cwd"]), CACHE_FILE)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = PatchIdCache(path)
+        return cache
+
+
+def unpicked_commits(run, upstream: str, head: str) -> List[str]:
+    """The commits `git cherry upstream head` marks with +, oldest first."""
+    return next(iter(unpicked_commits_of_pairs(run, [(upstream, head)])))
+
+
+def unpicked_commits_of_pairs(run, pairs: Iterable[Tuple[str, str]]) -> Iterable[List[str]]:
+    """`unpicked_commits` of every (upstream, head) pair, diffing the commits of all of them at once."""
+    sides = [commit_sides(proc_to_stdout(run(sides_cmd(upstream, head)))) for upstream, head in pairs]
+    cache = patch_id_cache(run)
+    missing = cache.missing(
+        commit for head_side, upstream_side in sides if head_side and upstream_side for commit in head_side + upstream_side
+    )
+    if missing:
+        with run(PATCHES_CMD, stdin=PIPE) as patches, run(PATCH_ID_CMD, stdin=patches.stdout) as patch_ids:
+            patches.stdin.writelines(f"{commit}\n" for commit in missing)
+            patches.stdin.close()
+            cache.add(missing, list(patch_ids.stdout))
+    return (cache.unpicked(head_side, upstream_side) for head_side, upstream_side in sides)
+
+
+async def async_unpicked_commits(run, upstream: str, head: str) -> List[str]:
+    """`unpicked_commits` without blocking the event loop."""
+    head_side, upstream_side = commit_sides(await async_stdout(run, sides_cmd(upstream, head)))
+    cache = patch_id_cache(run)
+    missing = cache.missing(head_side + upstream_side) if head_side and upstream_side else []
+    if missing:
+        patches = await async_stdout(run, PATCHES_CMD, stdin=[f"{commit}\n" for commit in missing])
+        cache.add(missing, await async_stdout(run, PATCH_ID_CMD, stdin=patches))
+    return cache.unpicked(head_side, upstream_side)
+
+
+def commit_sides(lines: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """The commits only in head and only in upstream, from `git rev-list --left-right upstream...head`."""
+    head_side, upstream_side = [], []
+    for line in lines:
+        (head_side if line.startswith(">") else upstream_side).append(line[1:].strip())
+    return head_side, upstream_side
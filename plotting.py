@@ -0,0 +1,41 @@
+"""Helpers shared by the plots: headless output to files and quantile bands for large data."""
+
+DEFAULT_MAX_POINTS = 20000
+MAX_ANNOTATIONS = 200
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def pyplot(output=None):
+    """matplotlib.pyplot, on the non-interactive Agg backend when the plot goes to a file."""
+    import matplotlib
+    if output is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def show_or_save(plt, output=None):
+    if output is None:
+        plt.show()
+    else:
+        plt.savefig(output)
+        plt.close()
+
+
+def quantile_bands(df, by, column):
+    """Quantiles of `column` for each `by` group, one row per group and one column per quantile."""
+    return df.groupby(by, sort=True)[column].quantile(list(QUANTILES)).unstack()
+
+
+def plot_quantile_bars(ax, bands):
+    low, lower, median, upper, high = (bands[q] for q in QUANTILES)
+    ax.vlines(bands.index, low, high, colors='b', linewidth=1, label="10th to 90th percentile")
+    ax.vlines(bands.index, lower, upper, colors='b', linewidth=5, label="25th to 75th percentile")
+    ax.plot(bands.index, median, 'r^', label="median commit age in days")
+
+
+def plot_quantile_area(ax, bands):
+    low, lower, median, upper, high = (bands[q] for q in QUANTILES)
+    ax.fill_between(bands.index, low, high, color='b', alpha=0.2, label="10th to 90th percentile")
+    ax.fill_between(bands.index, lower, upper, color='b', alpha=0.4, label="25th to 75th percentile")
+    ax.plot(bands.index, median, 'r^-', label="median commit age in days")
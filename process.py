@@ -1,17 +1,240 @@
-from functools import partial
+import asyncio
+import atexit
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import partial, lru_cache
+from itertools import islice
 from subprocess import Popen, PIPE
-from typing import Iterable
+from threading import Lock
+from typing import Awaitable, Iterable, Iterator, List, Optional
 
 
-def mk_run(path_to_git_repo):
-    return partial(
-        Popen,
+def mk_run(path_to_git_repo, backend="subprocess"):
+    return _mk_run(os.path.abspath(path_to_git_repo), backend, _trace is not None)
+
+
+@lru_cache(maxsize=None)
+def _mk_run(path_to_git_repo, backend, traced):
+    run = partial(
+        TracedPopen if traced else Popen,
         stdout=PIPE,
         cwd=path_to_git_repo,
         universal_newlines=True
     )
+    run.backend = backend
+    return run
+
+
+class Trace:
+    """The commands run while tracing, with wall time, output read and exit status of each."""
+
+    def __init__(self):
+        self.commands: List[dict] = []
+        self._lock = Lock()
+
+    def record(self, argv, wall_time, stdout_bytes, stdout_lines, exit_status):
+        with self._lock:
+            self.commands.append({
+                "argv": list(argv),
+                "wall_time": wall_time,
+                "bytes": stdout_bytes,
+                "lines": stdout_lines,
+                "exit_status": exit_status,
+            })
+
+    def summary(self) -> dict:
+        """Totals per command type, the git subcommand or the program run."""
+        totals = defaultdict(lambda: {"count": 0, "wall_time": 0.0, "bytes": 0, "lines": 0, "failures": 0})
+        for command in self.commands:
+            argv = command["argv"]
+            total = totals[argv[1] if argv[0] == "git" and len(argv) > 1 else argv[0]]
+            total["count"] += 1
+            total["wall_time"] += command["wall_time"]
+            total["bytes"] += command["bytes"]
+            total["lines"] += command["lines"]
+            total["failures"] += command["exit_status"] != 0
+        return dict(totals)
+
+    def write(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"summary": self.summary(), "commands": self.commands}, f, indent=2)
+
+
+_trace: Optional[Trace] = None
+
+
+def start_trace() -> Trace:
+    """Record every command run through `mk_run` from now on."""
+    global _trace
+    _trace = Trace()
+    return _trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace
+
+
+@contextmanager
+def trace_to(filename):
+    """Trace the commands run inside the block and write them as json to `filename`, unless it is None."""
+    if filename is None:
+        yield None
+        return
+    global _trace
+    previous = _trace
+    trace = start_trace()
+    try:
+        yield trace
+    finally:
+        close_object_lookups()
+        _trace = previous
+        trace.write(filename)
+
+
+class CountingReader:
+    """Wraps the stdout of a process, counting the bytes and lines read from it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+        self.lines = 0
+
+    def _count(self, data):
+        self.bytes += len(data.encode()) if isinstance(data, str) else len(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.lines += 1
+            yield self._count(line)
+
+    def readline(self, *args):
+        line = self.stream.readline(*args)
+        self.lines += bool(line)
+        return self._count(line)
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        self.lines += data.count("\n" if isinstance(data, str) else b"\n")
+        return self._count(data)
 
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
-def proc_to_stdout(proc) -> Iterable[str]:
+
+class TracedPopen(Popen):
+    """Popen that records itself in the trace once it has been waited for."""
+
+    def __init__(self, args, **kwargs):
+        self._trace = _trace
+        self._started = time.perf_counter()
+        self._recorded = False
+        super().__init__(args, **kwargs)
+        if self.stdout is not None:
+            self.stdout = CountingReader(self.stdout)
+
+    def wait(self, timeout=None):
+        returncode = super().wait(timeout)
+        if not self._recorded and self._trace is not None:
+            self._recorded = True
+            stdout = self.stdout if isinstance(self.stdout, CountingReader) else CountingReader(None)
+            self._trace.record(self.args, time.perf_counter() - self._started, stdout.bytes, stdout.lines, returncode)
+        return returncode
+
+
+def proc_to_stdout(proc, stdin: Iterable[str]=None) -> Iterable[str]:
     with proc as p:
-        yield from p.stdout
\ No newline at end of file
+        if stdin is not None:
+            p.stdin.writelines(stdin)
+            p.stdin.close()
+        yield from p.stdout
+
+
+async def async_stdout(run, cmd, stdin: Iterable[str]=None) -> List[str]:
+    """The stdout lines of `cmd` run in the repository of `run`, without blocking the event loop."""
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=run.keywords["cwd"], stdin=None if stdin is None else PIPE, stdout=PIPE
+    )
+    stdout, _ = await proc.communicate(None if stdin is None else "".join(stdin).encode())
+    if _trace is not None:
+        _trace.record(cmd, time.perf_counter() - started, len(stdout), stdout.count(b"\n"), proc.returncode)
+    return stdout.decode().splitlines(keepends=True)
+
+
+def run_in_order(coroutines: Iterable[Awaitable], jobs: int) -> Iterator:
+    """The results of `coroutines` in the order given, with up to `jobs` of them running at once."""
+    loop = asyncio.new_event_loop()
+    coroutines = iter(coroutines)
+    pending = deque()
+    try:
+        pending.extend(loop.create_task(coroutine) for coroutine in islice(coroutines, jobs))
+        while pending:
+            result = loop.run_until_complete(pending.popleft())
+            pending.extend(loop.create_task(coroutine) for coroutine in islice(coroutines, 1))
+            yield result
+    finally:
+        if pending:
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        for coroutine in coroutines:
+            coroutine.close()
+        loop.close()
+
+
+class ObjectLookup:
+    """One long-lived `git cat-file --batch` process answering commit lookups over a pipe."""
+
+    def __init__(self, run):
+        self._proc = run(["git", "cat-file", "--batch"], stdin=PIPE, universal_newlines=False)
+        self._lock = Lock()
+
+    def commit(self, name: str) -> bytes:
+        with self._lock:
+            self._proc.stdin.write(f"{name}^{{commit}}\n".encode())
+            self._proc.stdin.flush()
+            header = self._proc.stdout.readline().split()
+            if len(header) != 3:
+                raise LookupError(f"no commit for {name} in {self._proc.args}")
+            size = int(header[2])
+            body = self._proc.stdout.read(size + 1)
+        return body[:size]
+
+    def author_time(self, name: str) -> int:
+        for line in self.commit(name).splitlines():
+            if line.startswith(b"author "):
+                return int(line.rsplit(b" ", 2)[1])
+            if not line:
+                break
+        raise LookupError(f"commit {name} has no author")
+
+    def close(self):
+        with self._lock:
+            if self._proc.poll() is None:
+                self._proc.stdin.close()
+                self._proc.wait()
+            self._proc.stdout.close()
+
+
+_object_lookups = {}
+_object_lookups_lock = Lock()
+
+
+def object_lookup(run) -> ObjectLookup:
+    with _object_lookups_lock:
+        lookup = _object_lookups.get(run)
+        if lookup is None:
+            lookup = _object_lookups[run] = ObjectLookup(run)
+        return lookup
+
+
+@atexit.register
+def close_object_lookups():
+    with _object_lookups_lock:
+        while _object_lookups:
+            _run, lookup = _object_lookups.popitem()
+            lookup.close()
@@ -0,0 +1,124 @@
+"""Wall time and peak memory of each stage of a run, and a cProfile of all of it.
+
+Stages are the named parts of the work: listing tags, computing the ranges of commits
+between them, looking up dates, working out statistics and writing output. Time and
+memory go to the innermost stage running, so the stages add up to the whole run, and
+whatever ran outside of them is reported as "other". Memory is traced with tracemalloc,
+which slows Python down, so compare the shares of the stages within a profiled run
+rather than with the times of a run without profiling.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, Optional
+
+OTHER = "other"
+
+
+@dataclass
+class StageTotals:
+    calls: int = 0
+    wall_time: float = 0.0
+    peak_memory: int = 0
+
+
+class Profile:
+    """Totals per stage, for stages entered by the thread that started profiling."""
+
+    def __init__(self):
+        self.stages: Dict[str, StageTotals] = {OTHER: StageTotals(calls=1)}
+        self._running = [OTHER]
+        self._since = time.perf_counter()
+        self._thread = threading.get_ident()
+
+    def _switch(self):
+        """Charge the time and peak memory since the last switch to the innermost stage running."""
+        import tracemalloc
+
+        now = time.perf_counter()
+        totals = self.stages[self._running[-1]]
+        totals.wall_time += now - self._since
+        totals.peak_memory = max(totals.peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._since = now
+
+    @contextmanager
+    def stage(self, name):
+        self._switch()
+        self.stages.setdefault(name, StageTotals()).calls += 1
+        self._running.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._running.pop()
+
+    def finish(self):
+        self._switch()
+
+    def summary(self) -> str:
+        """A table of the calls, seconds, share of the total and peak memory of every stage."""
+        total = sum(totals.wall_time for totals in self.stages.values()) or 1.0
+        lines = [f"{'stage':<20} {'calls':>7} {'seconds':>9} {'share':>7} {'peak MiB':>9}"]
+        for name, totals in self.stages.items():
+            lines.append(
+                f"{name:<20} {totals.calls:>7} {totals.wall_time:>9.3f} {totals.wall_time / total:>7.1%} "
+                f"{totals.peak_memory / 2 ** 20:>9.1f}"
+            )
+        peak = max(totals.peak_memory for totals in self.stages.values())
+        lines.append(f"{'total':<20} {'':>7} {total:>9.3f} {1:>7.1%} {peak / 2 ** 20:>9.1f}")
+        return "\n".join(lines) + "\n"
+
+
+_profile: Optional[Profile] = None
+
+
+def current_profile() -> Optional[Profile]:
+    return _profile
+
+
+def stage(name):
+    """Charge what runs inside the block to stage `name`, when profiling."""
+    if _profile is None or threading.get_ident() != _profile._thread:
+        return nullcontext()
+    return _profile.stage(name)
+
+
+def staged(name):
+    """Run every call of the decorated function as stage `name`."""
+    def decorate(function):
+        @wraps(function)
+        def staged_function(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return staged_function
+    return decorate
+
+
+@contextmanager
+def profile_to(filename):
+    """Profile the block, write the cProfile stats to `filename` and the stage table to stderr, unless it is None."""
+    if filename is None:
+        yield None
+        return
+    import cProfile
+    import tracemalloc
+
+    global _profile
+    previous = _profile
+    tracemalloc.start()
+    profile = _profile = Profile()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        profile.finish()
+        tracemalloc.stop()
+        _profile = previous
+        profiler.dump_stats(filename)
+        sys.stderr.write(profile.summary())
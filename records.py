@@ -0,0 +1,129 @@
+"""Record batches: collected rows as array columns, with names interned once per batch.
+
+A batch holds the same rows as the csv files, release lead time rows
+(commit time, tag time, previous tag, tag, repo) or open branches rows (query time,
+commit time, branch, repo), in the column layout of a columnar snapshot. Each row
+takes 28 bytes instead of a tuple with its own references to the names.
+"""
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, Iterator, List
+
+KINDS = ("release-lead-time", "open-branches")
+OPEN_BRANCHES_COLUMNS = ("now", "time", "ref", "repo_name")
+RELEASE_LEAD_TIME_COLUMNS = ("commit_time", "tag_time", "from_tag", "tag", "repo_name")
+YEAR = 365 * 86400
+COLUMNS = ("times_a", "times_b", "names_a", "names_b", "repos")
+
+
+class RecordBatch:
+    """Rows as two int64 time columns and three int32 name id columns into `strings`."""
+
+    def __init__(self, kind: str):
+        if kind not in KINDS:
+            raise ValueError(f"unknown kind of rows {kind}, use one of: {', '.join(KINDS)}")
+        self.kind = kind
+        self.times_a = array("q")
+        self.times_b = array("q")
+        self.names_a = array("i")
+        self.names_b = array("i")
+        self.repos = array("i")
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    @classmethod
+    def from_rows(cls, kind: str, rows: Iterable[tuple]) -> "RecordBatch":
+        batch = cls(kind)
+        batch.extend(rows)
+        return batch
+
+    def intern(self, string: str) -> int:
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def extend(self, rows: Iterable[tuple]):
+        intern = self.intern
+        for row in rows:
+            if self.kind == "release-lead-time":
+                commit_time, tag_time, old_tag, tag, repo_name = row
+                self.times_a.append(commit_time)
+                self.times_b.append(tag_time)
+                self.names_a.append(intern(old_tag))
+                self.names_b.append(intern(tag))
+            else:
+                now, commit_time, branch, repo_name = row
+                self.times_a.append(now)
+                self.times_b.append(commit_time)
+                self.names_a.append(intern(branch))
+                self.names_b.append(-1)
+            self.repos.append(intern(repo_name))
+
+    def extend_release(self, commit_times: Iterable[int], tag_time: int, old_tag: str, tag: str, repo_name: str):
+        """Add the commits of one release, which share everything but the commit time."""
+        start = len(self.times_a)
+        self.times_a.extend(commit_times)
+        count = len(self.times_a) - start
+        self.times_b.extend(array("q", [tag_time]) * count)
+        self.names_a.extend(array("i", [self.intern(old_tag)]) * count)
+        self.names_b.extend(array("i", [self.intern(tag)]) * count)
+        self.repos.extend(array("i", [self.intern(repo_name)]) * count)
+
+    def extend_branch(self, now: int, commit_times: Iterable[int], branch: str, repo_name: str):
+        """Add the commits of one branch, which share everything but the commit time."""
+        start = len(self.times_b)
+        self.times_b.extend(commit_times)
+        count = len(self.times_b) - start
+        self.times_a.extend(array("q", [now]) * count)
+        self.names_a.extend(array("i", [self.intern(branch)]) * count)
+        self.names_b.extend(array("i", [-1]) * count)
+        self.repos.extend(array("i", [self.intern(repo_name)]) * count)
+
+    def filtered(self, keep: Iterable[bool]) -> "RecordBatch":
+        """The rows where `keep` is true, sharing the string table."""
+        keep = list(keep)
+        batch = RecordBatch(self.kind)
+        batch.strings, batch._ids = self.strings, self._ids
+        for column in COLUMNS:
+            values = getattr(self, column)
+            setattr(batch, column, array(values.typecode, compress(values, keep)))
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.times_a)
+
+    def __iter__(self) -> Iterator[tuple]:
+        """The rows as the csv readers give them."""
+        strings = self.strings
+        if self.kind == "release-lead-time":
+            for row in zip(self.times_a, self.times_b, self.names_a, self.names_b, self.repos):
+                yield row[0], row[1], strings[row[2]], strings[row[3]], strings[row[4]]
+        else:
+            for now, commit_time, branch, repo in zip(self.times_a, self.times_b, self.names_a, self.repos):
+                yield now, commit_time, strings[branch], strings[repo]
+
+    def to_frame(self, columns):
+        """The rows as a DataFrame with the given column names, names as categoricals of the string table."""
+        return frame_from_columns(
+            self.kind, [self.times_a, self.times_b, self.names_a, self.names_b, self.repos], self.strings, columns
+        )
+
+
+def frame_from_columns(kind: str, fields: List, strings: List[str], columns):
+    """A DataFrame of the two time and three name id columns of `kind` rows, names as categoricals of `strings`.
+
+    The columns are the arrays of a record batch or the fields of a columnar snapshot.
+    """
+    import numpy as np
+    from pandas import Categorical, DataFrame
+
+    fields = list(fields)
+    if kind == "open-branches":
+        del fields[3]
+    frame = {}
+    for index, (column, field) in enumerate(zip(columns, fields)):
+        values = np.asarray(field)
+        frame[column] = values if index < 2 else Categorical.from_codes(values, strings)
+    return DataFrame(frame, columns=columns)
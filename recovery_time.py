@@ -1,19 +1,26 @@
 from dataclasses import dataclass
+from typing import Iterable, Iterator, Tuple
 
 
 def find_outages(deployments):
-    results = []
+    return list(iter_outages(deployments))
 
-    for patch_split in split_sequence(deployments):
-        first_patch = patch_split[0]
 
-        deployment_index = deployments.index(first_patch) - 1
-        if deployment_index >= 0:
-            failed_deployment = deployments[deployment_index]
-            last_patch = patch_split[-1]
-            results.append((failed_deployment, last_patch))
-
-    return results
+def iter_outages(deployments: Iterable["Deployment"]) -> Iterator[Tuple["Deployment", "Deployment"]]:
+    """Each failed deployment with the last patch of the run of patches that follows it, in one pass."""
+    previous = failed_deployment = last_patch = None
+    for deployment in deployments:
+        if deployment.is_patch:
+            if last_patch is None:
+                failed_deployment = previous
+            last_patch = deployment
+        else:
+            if last_patch is not None and failed_deployment is not None:
+                yield failed_deployment, last_patch
+            last_patch = None
+        previous = deployment
+    if last_patch is not None and failed_deployment is not None:
+        yield failed_deployment, last_patch
 
 
 def split_sequence(deployments):
@@ -35,7 +42,9 @@ def find_is_patch(deployment_name, deploy_tags, patch_dates):
     return deploy_date in patch_dates
 
 
-@dataclass
+@dataclass(eq=False)
 class Deployment:
+    """One deployment, equal only to itself even when another has the same time."""
+    __slots__ = ("is_patch", "time")
     is_patch: bool
-    time: int
\ No newline at end of file
+    time: int
@@ -0,0 +1,158 @@
+"""Estimated release lead time from the commits of a random sample of the releases.
+
+Git has to walk every commit of a release to tell which commits it has, and the author
+times come with the walk, so reading only some of the commits of a release saves
+nothing. Instead, whole releases are read in random order until `sample_size` commits
+are read or `time_budget` seconds have passed, and they stand for all the releases.
+A release is read leaving out the previous tag, which contains all the earlier ones on
+a line of history, so reading it costs the same however many tags came before.
+The mean is the ratio estimate over the releases read, and percentiles are read off
+their commits. Both come with 95% confidence intervals from the variance between
+releases, using Woodruff's method for the percentiles, which narrow to the exact value
+as the share of releases read goes to one.
+"""
+import math
+import random
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from subprocess import PIPE
+from typing import List, Optional, Union
+
+from custom_git import log
+from data import columns
+from git_metrics_release_lead_time import RepositorySnapshot, reported_tags
+from process import proc_to_stdout
+from profiling import stage, staged
+from sketch import PERCENTILES, nearest_rank
+
+Z_95 = 1.959963984540054
+
+RELEASE_COMMITS_CMD = log(format='%H %at %P', stdin=True)
+
+
+@dataclass
+class Estimate:
+    statistic: str
+    value: float
+    low: Union[float, str]
+    high: Union[float, str]
+
+
+@dataclass
+class LeadTimeEstimate:
+    """Estimates of the mean and percentiles of lead time, and how many commits and releases they are from."""
+    estimates: List[Estimate]
+    commits: int
+    releases_read: int
+    releases: int
+
+
+def estimate_lead_time(run, match_tag, earliest_date=0, sample_size: Optional[int] = None,
+                       time_budget: Optional[float] = None, snapshot=None, rng=None) -> LeadTimeEstimate:
+    """Lead time of the releases `commit_author_time_tag_author_time_and_from_to_tag_name` reports, from a sample."""
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    tags, first = reported_tags(snapshot or RepositorySnapshot(run), match_tag, earliest_date)
+    indices = [] if first is None else list(range(first, len(tags)))
+    releases = sample_releases(run, tags, indices, sample_size, deadline, rng or random.Random())
+    return LeadTimeEstimate(
+        estimates=estimate(releases, len(indices)),
+        commits=sum(len(lead_times) for lead_times in releases),
+        releases_read=len(releases),
+        releases=len(indices),
+    )
+
+
+def sample_releases(run, tags, indices, sample_size, deadline, rng) -> List[List[int]]:
+    """Sorted lead times of the commits of `tags[index]`, leaving out commits of earlier tags, for random indices.
+
+    At least one release is read, however small the budget.
+    """
+    releases = []
+    commits = 0
+    first_index = {}
+    for index, (_tag, _date, sha) in enumerate(tags):
+        first_index.setdefault(sha, index)
+    boundary = min(indices, default=1) - 1
+    for index in rng.sample(indices, len(indices)):
+        if releases and sample_size is not None and commits >= sample_size:
+            break
+        if releases and deadline is not None and time.perf_counter() > deadline:
+            break
+        with stage("range computation"):
+            author_times = release_author_times(run, tags, index, boundary, first_index)
+        tag_time = tags[index][1]
+        releases.append(sorted(tag_time - author_time for author_time in author_times))
+        commits += len(releases[-1])
+    return releases
+
+
+def release_author_times(run, tags, index, boundary, first_index) -> List[int]:
+    """Author times of the commits of `tags[index]` that no earlier tag has, leaving out merges.
+
+    Only the previous tag and `tags[boundary]`, the last tag before the reported ones, are
+    left out, which is enough when every tag contains the ones before it. If an earlier
+    tag, by its index in `first_index`, turns up among the commits, the tags are not on
+    one line of history, and the release is read again leaving out every earlier tag, a
+    revision each, which makes reading all releases of such a repository quadratic in the tags.
+    """
+    commits = release_commits(run, tags[index][2], [tags[index - 1][2], tags[boundary][2]])
+    if any(first_index.get(sha, index) < index for sha, *_rest in commits):
+        commits = release_commits(run, tags[index][2], [sha for _tag, _date, sha in tags[:index]])
+    return [int(author_time) for _sha, author_time, *parents in commits if len(parents) <= 1]
+
+
+def release_commits(run, sha, excluded) -> List[List[str]]:
+    revisions = [f"{sha}\n"] + [f"^{excluded_sha}\n" for excluded_sha in dict.fromkeys(excluded)]
+    return list(columns(proc_to_stdout(run(RELEASE_COMMITS_CMD, stdin=PIPE), revisions)))
+
+
+@staged("statistics")
+def estimate(releases: List[List[int]], population: int, percentiles=PERCENTILES) -> List[Estimate]:
+    """The mean and `percentiles` of lead time with 95% confidence intervals, none without commits.
+
+    `releases` are the sorted lead times of a simple random sample of `population` releases.
+    """
+    commits = sum(len(lead_times) for lead_times in releases)
+    if not commits:
+        return []
+    mean = sum(sum(lead_times) for lead_times in releases) / commits
+    estimates = [with_interval("mean", mean, ratio_margin(releases, population, [sum(t) for t in releases], mean))]
+    pooled = sorted(lead_time for lead_times in releases for lead_time in lead_times)
+    for q in percentiles:
+        value = nearest_rank(pooled, q)
+        at_or_below = [bisect_right(lead_times, value) for lead_times in releases]
+        share = sum(at_or_below) / commits
+        margin = ratio_margin(releases, population, at_or_below, share)
+        if margin == "N/A":
+            estimates.append(Estimate(f"p{int(q * 100)}", value, margin, margin))
+        else:
+            estimates.append(Estimate(
+                f"p{int(q * 100)}",
+                value,
+                nearest_rank(pooled, max(q - margin, 0)),
+                nearest_rank(pooled, min(q + margin, 1)),
+            ))
+    return estimates
+
+
+def with_interval(statistic, value, margin) -> Estimate:
+    if margin == "N/A":
+        return Estimate(statistic, value, margin, margin)
+    return Estimate(statistic, value, value - margin, value + margin)
+
+
+def ratio_margin(releases: List[List[int]], population: int, totals: List[float], ratio: float):
+    """Half the width of the 95% confidence interval of `ratio`, the sum of `totals` per commit of `releases`.
+
+    Without two releases read out of more, the variance between releases is unknown.
+    """
+    sampled = len(releases)
+    if sampled == population:
+        return 0.0
+    if sampled < 2:
+        return "N/A"
+    commits_per_release = sum(len(lead_times) for lead_times in releases) / sampled
+    residuals = sum((total - ratio * len(lead_times)) ** 2 for total, lead_times in zip(totals, releases))
+    variance = (1 - sampled / population) * residuals / (sampled - 1) / (sampled * commits_per_release ** 2)
+    return Z_95 * math.sqrt(variance)
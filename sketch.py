@@ -0,0 +1,137 @@
+"""Mergeable quantile sketches with bounded memory.
+
+A KLL sketch keeps samples in levels of compactors. A sample at level h stands for 2^h
+samples. When a level is full it is sorted and every other sample moves up a level,
+the offset alternating between compactions. About `k` samples are kept per level,
+with O(log(n / k)) levels, and ranks are off by about 1/k of the count. Count, total,
+minimum and maximum are kept exactly, so the mean is the same as from all samples.
+"""
+import math
+from typing import Iterable, List, Optional
+
+DEFAULT_K = 200
+PERCENTILES = (0.5, 0.9, 0.99)
+CAPACITY_DECAY = 2 / 3
+
+
+class QuantileSketch:
+    """A KLL sketch of numbers, serializable with `to_dict` and combined with `merge`."""
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.offsets: List[int] = [0]
+        self._first_capacity = self.capacity(0)
+        self.count = 0
+        self.total = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def capacity(self, level: int) -> int:
+        return int(math.ceil(CAPACITY_DECAY ** (len(self.levels) - level - 1) * self.k)) + 1
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.levels[0]) >= self._first_capacity:
+            self._compress()
+
+    def extend(self, values: Iterable):
+        for value in values:
+            self.update(value)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            while len(self.levels[level]) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                    self.offsets.append(0)
+                samples = sorted(self.levels[level])
+                keep_odd = len(samples) % 2
+                promoted = samples[keep_odd + self.offsets[level]::2]
+                self.levels[level] = samples[:keep_odd]
+                self.levels[level + 1].extend(promoted)
+                self.offsets[level] ^= 1
+            level += 1
+        self._first_capacity = self.capacity(0)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add the samples of `other` to this sketch, as if they had been updated here.
+
+        Raises ValueError if the sketches were made with different `k`, as their levels hold
+        samples at different rates.
+        """
+        if other.k != self.k:
+            raise ValueError(f"cannot merge a sketch with k={other.k} into one with k={self.k}")
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+            self.offsets.append(0)
+        for level, samples in enumerate(other.levels):
+            self.levels[level].extend(samples)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        self._compress()
+        return self
+
+    def mean(self):
+        return exact_mean(self.total, self.count)
+
+    def quantile(self, q: float):
+        """The sample at rank `q` of the count, between 0 and 1, or N/A for an empty sketch."""
+        if not self.count:
+            return "N/A"
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        weighted = sorted((value, 1 << level) for level, samples in enumerate(self.levels) for value in samples)
+        rank = q * sum(weight for _value, weight in weighted)
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= rank:
+                return value
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "levels": self.levels,
+            "offsets": self.offsets,
+        }
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "QuantileSketch":
+        sketch = cls(saved["k"])
+        sketch.levels = [list(samples) for samples in saved["levels"]]
+        sketch.offsets = list(saved["offsets"])
+        sketch.count = saved["count"]
+        sketch.total = saved["total"]
+        sketch.min = saved["min"]
+        sketch.max = saved["max"]
+        sketch._first_capacity = sketch.capacity(0)
+        return sketch
+
+
+def exact_mean(total, count):
+    """The mean of `count` integers summing to `total`, an int when it is one, like statistics.mean."""
+    if not count:
+        return "N/A"
+    return total // count if total % count == 0 else total / count
+
+
+def nearest_rank(ordered: List[int], q: float) -> int:
+    """The value at quantile `q` of the sorted values `ordered`, by the nearest-rank method."""
+    return ordered[max(math.ceil(q * len(ordered) * (1 - 1e-12)) - 1, 0)]
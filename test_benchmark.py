@@ -0,0 +1,27 @@
+import json
+
+from benchmark import generate_repository, run_benchmarks, entry_points
+import process
+
+
+def git_lines(repo_dir, *args):
+    with process.mk_run(repo_dir)(["git"] + list(args)) as proc:
+        return proc.stdout.read().split()
+
+
+def test_generate_repository(tmp_path):
+    repo_dir = str(tmp_path)
+    generate_repository(repo_dir, commits=40, deploy_every=10, patch_every=2, branches=3, merge_every=5)
+    assert git_lines(repo_dir, "tag") == ["D-1", "D-2", "D-3", "D-4", "P-2", "P-4"]
+    assert len(git_lines(repo_dir, "branch", "-r")) == 4
+    assert len(git_lines(repo_dir, "rev-list", "--merges", "master")) == 8
+
+
+def test_run_benchmarks(tmp_path):
+    repo_dir = str(tmp_path)
+    generate_repository(repo_dir, commits=30, deploy_every=10, patch_every=2, branches=2, merge_every=0)
+    results = run_benchmarks(repo_dir, repeat=1)
+    assert list(results) == list(entry_points(repo_dir))
+    assert results["calculate_MTTR"]["git_processes"] == 1
+    assert all(result["wall_time"] > 0 for result in results.values())
+    json.dumps(results)
@@ -0,0 +1,57 @@
+import os
+import subprocess
+from functools import partial
+
+import pytest
+
+from checkpoint import Checkpoint, checkpointed
+from git_metrics import restamped_open_branches_rows
+
+ENVIRONMENT = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+    GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com",
+)
+
+
+def commit(repo_dir, message):
+    subprocess.run(["git", "commit", "-q", "--allow-empty", "-m", message], cwd=repo_dir, env=ENVIRONMENT, check=True)
+
+
+def fetch(path_to_git_repo):
+    return [(1, 2, "D-1", "D-2", "repo")], [("D-1", 1, "abc")]
+
+
+def fail(path_to_git_repo):
+    raise AssertionError("should have resumed from the checkpoint")
+
+
+def test_resume_reuses_rows_of_unchanged_repositories(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    subprocess.run(["git", "init", "-q", repo_dir], check=True)
+    commit(repo_dir, "one")
+    directory = str(tmp_path / "checkpoint")
+    assert checkpointed(Checkpoint(directory, "release-lead-time 0"), fetch, repo_dir) == fetch(repo_dir)
+    assert checkpointed(Checkpoint(directory, "release-lead-time 0", resume=True), fail, repo_dir) == fetch(repo_dir)
+    with pytest.raises(AssertionError):
+        checkpointed(Checkpoint(directory, "release-lead-time 0"), fail, repo_dir)
+    with pytest.raises(AssertionError):
+        checkpointed(Checkpoint(directory, "release-lead-time 100", resume=True), fail, repo_dir)
+    commit(repo_dir, "two")
+    with pytest.raises(AssertionError):
+        checkpointed(Checkpoint(directory, "release-lead-time 0", resume=True), fail, repo_dir)
+
+
+def test_resumed_open_branches_rows_are_queried_at_the_time_of_the_run(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    subprocess.run(["git", "init", "-q", repo_dir], check=True)
+    commit(repo_dir, "one")
+    directory = str(tmp_path / "checkpoint")
+
+    def fetch_at(now, path_to_git_repo):
+        return [(now, 50, "origin/feature", "repo")], []
+
+    saved = partial(checkpointed, Checkpoint(directory, "open-branches"), partial(fetch_at, 100))
+    assert restamped_open_branches_rows(100, saved, repo_dir) == ([(100, 50, "origin/feature", "repo")], [])
+    resumed = partial(checkpointed, Checkpoint(directory, "open-branches", resume=True), fail)
+    assert restamped_open_branches_rows(200, resumed, repo_dir) == ([(200, 50, "origin/feature", "repo")], [])
@@ -0,0 +1,46 @@
+from fnmatch import fnmatch
+from functools import partial
+
+import pytest
+
+from columnar_snapshot import ColumnarSnapshot, ColumnarSnapshotWriter, is_snapshot_file
+
+
+def test_open_branches_rows_round_trip(tmp_path):
+    filename = str(tmp_path / "open-branches.snap")
+    rows = [(100, 10, "origin/feature", "repo"), (100, 20, "origin/fix", "repo")]
+    with ColumnarSnapshotWriter(filename, "open-branches") as writer:
+        writer.write_rows(iter(rows))
+    assert is_snapshot_file(filename)
+    assert list(ColumnarSnapshot(filename).row_tuples()) == rows
+    with pytest.raises(ValueError):
+        ColumnarSnapshot(filename).repository()
+
+
+def test_failed_run_leaves_no_snapshot(tmp_path):
+    filename = tmp_path / "open-branches.snap"
+
+    def failing_rows():
+        yield 100, 10, "origin/feature", "repo"
+        raise OSError("repository went away")
+
+    with pytest.raises(OSError):
+        with ColumnarSnapshotWriter(str(filename), "open-branches") as writer:
+            writer.write_rows(failing_rows())
+    assert not filename.exists()
+
+
+def test_release_rows_move_to_next_matching_tag(tmp_path):
+    filename = str(tmp_path / "release-lead-time.snap")
+    with ColumnarSnapshotWriter(filename, "release-lead-time") as writer:
+        writer.write_rows([
+            (10, 200, "D-1", "X-1", "repo"),
+            (20, 300, "X-1", "D-2", "repo"),
+        ])
+        writer.write_tags("repo", [("D-1", 100, "a"), ("X-1", 200, "b"), ("D-2", 300, "c")])
+    repository = ColumnarSnapshot(filename).repository()
+    assert repository.tags_and_sha(partial(fnmatch, pat="D-*")) == [("D-1", "a"), ("D-2", "c")]
+    assert list(repository.release_rows(partial(fnmatch, pat="D-*"))) == [
+        (10, 300, "D-1", "D-2"),
+        (20, 300, "D-1", "D-2"),
+    ]
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import subprocess
+
+import pytest
+
+from commit_store import CommitStore, commit_store_at
+from git_backend import StoredBackend, SubprocessBackend, backend_for
+from process import mk_run
+
+ENVIRONMENT = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="Integration Test",
+    GIT_AUTHOR_EMAIL="test@example.com",
+    GIT_COMMITTER_NAME="Integration Test",
+    GIT_COMMITTER_EMAIL="test@example.com",
+)
+
+
+def git(repo_dir, *args, date=None):
+    env = ENVIRONMENT if date is None else dict(ENVIRONMENT, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    subprocess.run(("git",) + args, cwd=repo_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="module")
+def forks(tmp_path_factory):
+    """An upstream with a merge and two tags, and a fork of it with one more commit and tag."""
+    upstream = str(tmp_path_factory.mktemp("upstream"))
+    git(upstream, "init", "-q", "-b", "master")
+    git(upstream, "commit", "-q", "--allow-empty", "-m", "one", date="@1000 +0000")
+    git(upstream, "tag", "-a", "D-1", "-m", "D-1", date="@1100 +0000")
+    git(upstream, "checkout", "-q", "-b", "feature")
+    git(upstream, "commit", "-q", "--allow-empty", "-m", "two", date="@1200 +0000")
+    git(upstream, "checkout", "-q", "master")
+    git(upstream, "commit", "-q", "--allow-empty", "-m", "three", date="@1300 +0000")
+    git(upstream, "merge", "-q", "--no-ff", "-m", "merge", "feature", date="@1400 +0000")
+    git(upstream, "tag", "-a", "D-2", "-m", "D-2", date="@1500 +0000")
+    fork = str(tmp_path_factory.mktemp("fork"))
+    git(fork, "clone", "-q", upstream, ".")
+    git(fork, "commit", "-q", "--allow-empty", "-m", "four", date="@1600 +0000")
+    git(fork, "tag", "-a", "D-3", "-m", "D-3", date="@1700 +0000")
+    return upstream, fork
+
+
+def tag_shas(run):
+    return [sha for _tag, _date, sha in SubprocessBackend(run).tags()]
+
+
+def test_stored_walk_agrees_with_git(forks, tmp_path):
+    with commit_store_at(str(tmp_path / "commits.db")):
+        for repo_dir in forks:
+            run = mk_run(repo_dir)
+            subprocess_backend = SubprocessBackend(run)
+            tags = tag_shas(run)
+            backend = backend_for(run)
+            assert isinstance(backend, StoredBackend)
+            for include, exclude in [(tags[1:], tags[:1]), (tags, []), (["HEAD"], ["D-1"]), (tags[:1], tags[-1:])]:
+                commits = list(backend.walk(include, exclude))
+                assert sorted(commits) == sorted(subprocess_backend.walk(include, exclude))
+                timed = backend.walk_with_committer_time(include, exclude)
+                assert sorted(timed) == sorted(subprocess_backend.walk_with_committer_time(include, exclude))
+                seen = set()
+                for sha, _author_time, parents in commits:
+                    assert not seen.intersection(parents)
+                    seen.add(sha)
+            assert backend.author_time("D-2") == 1400
+    assert not isinstance(backend_for(mk_run(forks[0])), StoredBackend)
+
+
+def test_fork_adds_only_the_commits_it_does_not_share(forks, tmp_path):
+    path = str(tmp_path / "commits.db")
+    upstream, fork = (mk_run(repo_dir) for repo_dir in forks)
+    assert CommitStore(path).fill(upstream, tag_shas(upstream)) == 4
+    store = CommitStore(path)
+    assert store.fill(fork, tag_shas(fork)) == 1
+    assert len(store.commits) == 5
+    assert store.fill(upstream, tag_shas(upstream)) == 0
+    assert CommitStore(path).fill(fork, tag_shas(fork)) == 0
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT count(*), count(DISTINCT sha) FROM commits").fetchone() == (5, 5)
+
+
+def test_shallow_clone_is_not_stored(forks, tmp_path):
+    upstream, _fork = forks
+    shallow = str(tmp_path / "shallow")
+    git(tmp_path, "clone", "-q", "--depth=1", f"file://{upstream}", shallow)
+    with commit_store_at(str(tmp_path / "commits.db")) as store:
+        backend = backend_for(mk_run(shallow))
+        assert not isinstance(backend, StoredBackend)
+        assert len(list(backend.walk(["HEAD"], []))) == 1
+        assert not store.commits
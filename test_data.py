@@ -1,5 +1,9 @@
+import pytest
+
 from data import columns
 from data import zip_with_tail
+from data import label_commits
+from data import PrefixSums, windows
 
 
 def test_single_column():
@@ -12,3 +16,32 @@ def test_two_columns():
 
 def test_zip_with_tail():
     assert [(0, 1), (1, 2)] == list(zip_with_tail(range(3)))
+
+
+def test_label_commits_takes_lowest_label_through_merges():
+    commits = [
+        ("d", 4, ["c", "b"]),
+        ("c", 3, ["a"]),
+        ("b", 2, ["a"]),
+        ("a", 1, []),
+    ]
+    labels = [("d", 1), ("b", 0)]
+    result = [(sha, label) for sha, _t, _p, label in label_commits(commits, labels, min)]
+    assert result == [("d", 1), ("c", 1), ("b", 0), ("a", 0)]
+
+
+def test_prefix_sums_window():
+    sums = PrefixSums([(30, 3), (10, 1), (20, 2)])
+    assert sums.window(10, 30) == (2, 5)
+    assert sums.mean(0, 20) == 1.5
+    assert sums.mean(30, 40) == "N/A"
+
+
+def test_sliding_windows():
+    assert list(windows(0, 25, 10, 5)) == [(0, 10), (5, 15), (10, 20), (15, 25), (20, 25)]
+
+
+def test_windows_need_a_positive_width_and_step():
+    for width, step in [(10, 0), (10, -5), (0, 5)]:
+        with pytest.raises(ValueError):
+            list(windows(0, 25, width, step))
@@ -1,4 +1,4 @@
-from custom_git import for_each_ref, cherry, show
+from custom_git import for_each_ref, cherry, show, rev_list, patch_id, rev_parse
 from custom_git import log
 
 
@@ -107,3 +107,79 @@ def test_cherry_upstream_and_head_arguments():
         "<upstream>",
         "<head>"
     ]
+
+
+def test_log_topo_order_from_stdin():
+    assert log(format='%H', topo_order=True, stdin=True) == [
+        "git",
+        "log",
+        "--topo-order",
+        "--format=%H",
+        "--stdin"
+    ]
+
+
+def test_log_patches_of_commits_from_stdin():
+    assert log(format='commit %H', stdin=True, no_walk='unsorted', patch=True) == [
+        "git",
+        "log",
+        "--no-walk=unsorted",
+        "--format=commit %H",
+        "--patch",
+        "--stdin"
+    ]
+
+
+def test_rev_list_oldest_first_without_merges():
+    assert rev_list("<upstream>..<head>", no_merges=True, reverse=True) == [
+        "git",
+        "rev-list",
+        "--no-merges",
+        "--reverse",
+        "<upstream>..<head>"
+    ]
+
+
+def test_rev_list_sides_of_symmetric_difference():
+    assert rev_list("<upstream>...<head>", left_right=True) == [
+        "git",
+        "rev-list",
+        "--left-right",
+        "<upstream>...<head>"
+    ]
+
+
+def test_log_without_merges_from_stdin():
+    assert log(format='%at', stdin=True, no_merges=True) == [
+        "git",
+        "log",
+        "--no-merges",
+        "--format=%at",
+        "--stdin"
+    ]
+
+
+def test_patch_id():
+    assert patch_id() == [
+        "git",
+        "patch-id",
+        "--stable"
+    ]
+
+
+def test_log_ignoring_missing_revisions_from_stdin():
+    assert log(format='%H', stdin=True, ignore_missing=True) == [
+        "git",
+        "log",
+        "--ignore-missing",
+        "--format=%H",
+        "--stdin"
+    ]
+
+
+def test_rev_parse():
+    assert rev_parse(["origin/master^{commit}"]) == [
+        "git",
+        "rev-parse",
+        "origin/master^{commit}"
+    ]
@@ -0,0 +1,109 @@
+import os
+import subprocess
+
+import pytest
+
+from git_backend import CompareBackend, InProcessBackend, SubprocessBackend, backend_for
+from object_database import ObjectDatabase, apply_delta
+from process import mk_run
+
+ENVIRONMENT = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="Integration Test",
+    GIT_AUTHOR_EMAIL="test@example.com",
+    GIT_COMMITTER_NAME="Integration Test",
+    GIT_COMMITTER_EMAIL="test@example.com",
+)
+
+
+def git(repo_dir, *args, date=None):
+    env = ENVIRONMENT if date is None else dict(ENVIRONMENT, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    subprocess.run(("git",) + args, cwd=repo_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="module", params=["loose", "packed"])
+def repo_dir(tmp_path_factory, request):
+    repo_dir = str(tmp_path_factory.mktemp(request.param))
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "one", date="@1000 +0000")
+    git(repo_dir, "tag", "-a", "D-1", "-m", "D-1", date="@1100 +0000")
+    git(repo_dir, "checkout", "-q", "-b", "feature")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "two", date="@1200 +0000")
+    git(repo_dir, "checkout", "-q", "-")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "three", date="@1300 +0000")
+    git(repo_dir, "merge", "-q", "--no-ff", "-m", "merge", "feature", date="@1400 +0000")
+    git(repo_dir, "tag", "-a", "D-2", "-m", "D-2", date="@1500 +0000")
+    git(repo_dir, "tag", "lightweight")
+    if request.param == "packed":
+        git(repo_dir, "gc", "-q")
+    return repo_dir
+
+
+def test_in_process_backend_agrees_with_git(repo_dir):
+    backend = CompareBackend(InProcessBackend(repo_dir), SubprocessBackend(mk_run(repo_dir)))
+    tags = backend.tags()
+    assert [(tag, date) for tag, date, _sha in tags] == [("D-1", 1100), ("D-2", 1500)]
+    commits = backend.walk([tags[1][2]], [tags[0][2]])
+    assert sorted(author_time for _sha, author_time, _parents in commits) == [1200, 1300, 1400]
+    timed = backend.walk_with_committer_time([tags[1][2]], [tags[0][2]])
+    assert [(sha, author_time, parents) for sha, author_time, _committer_time, parents in timed] == commits
+    assert backend.author_time("D-2") == 1400
+    assert backend.author_time(tags[0][2]) == 1000
+    backend.ref_names()
+
+
+def test_in_process_backend_reads_refs_once(repo_dir, monkeypatch):
+    backend = InProcessBackend(repo_dir)
+    tags = backend.tags()
+    monkeypatch.setattr(backend.database, "refs", lambda: pytest.fail("read the refs again"))
+    assert [backend.author_time(tag) for tag, _date, _sha in tags] == [1000, 1400]
+    assert [backend.author_time(sha) for _tag, _date, sha in tags] == [1000, 1400]
+
+
+def test_in_process_walk_puts_children_before_parents(repo_dir):
+    seen = set()
+    for sha, _author_time, parents in InProcessBackend(repo_dir).walk(["HEAD"], []):
+        assert not seen.intersection(parents)
+        seen.add(sha)
+    assert len(seen) == 4
+
+
+def test_in_process_backend_sees_a_commit_tagged_between_calls(tmp_path):
+    repo_dir = str(tmp_path)
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "one", date="@1000 +0000")
+    git(repo_dir, "tag", "-a", "D-1", "-m", "D-1", date="@1100 +0000")
+    git(repo_dir, "gc", "-q")
+    run = mk_run(repo_dir, "in-process")
+    assert [tag for tag, _date, _sha in backend_for(run).tags()] == ["D-1"]
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "two", date="@1200 +0000")
+    git(repo_dir, "tag", "-a", "D-2", "-m", "D-2", date="@1300 +0000")
+    tags = backend_for(run).tags()
+    assert [tag for tag, _date, _sha in tags] == ["D-1", "D-2"]
+    assert backend_for(run).author_time("D-2") == 1200
+    assert backend_for(run) is backend_for(run)
+
+
+def test_object_database_finds_objects_packed_after_it_listed_the_packs(tmp_path):
+    repo_dir = str(tmp_path)
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "one", date="@1000 +0000")
+    database = ObjectDatabase(repo_dir)
+    sha = database.resolve("HEAD")
+    git(repo_dir, "gc", "-q", "--prune=now")
+    assert database.commit(sha) == (1000, 1000, [])
+
+
+def test_in_process_backend_stops_at_the_boundary_of_a_shallow_clone(repo_dir, tmp_path):
+    shallow = str(tmp_path / "shallow")
+    git(str(tmp_path), "clone", "-q", "--no-local", "--depth=2", repo_dir, shallow)
+    backend = CompareBackend(InProcessBackend(shallow), SubprocessBackend(mk_run(shallow)))
+    commits = backend.walk(["HEAD"], [])
+    assert sorted(author_time for _sha, author_time, _parents in commits) == [1200, 1300, 1400]
+    assert [parents for _sha, author_time, parents in commits if author_time < 1400] == [[], []]
+
+
+def test_apply_delta_copies_and_inserts():
+    base = b"hello world"
+    delta = bytes([11, 8, 0x90, 5, 3]) + b"!!!"
+    assert apply_delta(base, delta) == b"hello!!!"
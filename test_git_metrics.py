@@ -0,0 +1,46 @@
+from git_metrics import fetch_rows_from_repos, read_frame_file
+from records import OPEN_BRANCHES_COLUMNS
+
+
+def rows_or_failure(path_to_git_repo):
+    if path_to_git_repo == "broken":
+        raise ValueError(path_to_git_repo)
+    return [(path_to_git_repo, 1), (path_to_git_repo, 2)], []
+
+
+def test_fetch_rows_from_repos_keeps_order_and_skips_failures():
+    failed = []
+    rows = fetch_rows_from_repos(rows_or_failure, ["a", "broken", "b"], 1, failed)
+    assert list(rows) == [("a", 1), ("a", 2), ("b", 1), ("b", 2)]
+    assert failed == ["broken"]
+
+
+def test_fetch_rows_from_repos_in_parallel():
+    failed = []
+    rows = fetch_rows_from_repos(rows_or_failure, ["a", "b", "broken", "c"], 2, failed)
+    assert list(rows) == [("a", 1), ("a", 2), ("b", 1), ("b", 2), ("c", 1), ("c", 2)]
+    assert failed == ["broken"]
+
+
+def test_read_frame_file_from_csv(tmp_path):
+    filename = tmp_path / "open-branches.csv"
+    filename.write_text(
+        "query timestamp,commit timestamp,branch name,repo name\n"
+        "100,10,origin/feature,repo\n"
+        "100,20,origin/fix,repo\n"
+        "100,30,origin/feature,repo\n"
+    )
+    df = read_frame_file(str(filename), OPEN_BRANCHES_COLUMNS, chunksize=2)
+    assert df["time"].tolist() == [10, 20, 30]
+    assert df["time"].dtype == "int64"
+    assert df["ref"].cat.codes.tolist() == [0, 1, 0]
+    assert list(df["ref"].cat.categories) == ["origin/feature", "origin/fix"]
+
+
+def test_read_frame_file_from_concatenated_csv_files(tmp_path):
+    filename = tmp_path / "open-branches.csv"
+    header = "query timestamp,commit timestamp,branch name,repo name\n"
+    filename.write_text(header + "100,10,origin/feature,a\n" + header + "100,20,origin/fix,b\n")
+    df = read_frame_file(str(filename), OPEN_BRANCHES_COLUMNS, chunksize=2)
+    assert df["time"].tolist() == [10, 20]
+    assert df["repo_name"].tolist() == ["a", "b"]
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = {"matplotlib", "numpy", "pandas"}
+IMPORT_TIME_BUDGET = 0.25  # seconds, for importing both command line tools
+
+
+def import_times(tmp_path, *modules):
+    """Cumulative import time in seconds of every module imported, from `python -X importtime`."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=str(tmp_path), env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _self_time, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_command_line_tools_import_fast(tmp_path):
+    times = import_times(tmp_path, "calculate_four_metrics", "git_metrics")
+    assert not HEAVY_MODULES & {name.split(".")[0] for name in times}
+    assert times["calculate_four_metrics"] + times["git_metrics"] < IMPORT_TIME_BUDGET
+
+
+def test_import_does_not_touch_the_log(tmp_path):
+    import_times(tmp_path, "calculate_four_metrics")
+    assert not (tmp_path / "metrics.log").exists()
+
+
+def test_library_api_imports_without_heavy_modules_or_log(tmp_path):
+    times = import_times(tmp_path, "metrics_api")
+    assert not HEAVY_MODULES & {name.split(".")[0] for name in times}
+    assert not (tmp_path / "metrics.log").exists()
@@ -6,7 +6,13 @@ import pytest
 from git import Repo
 
 from calculate_four_metrics import calculate_lead_time, calculate_deploy_interval, calculate_change_fail_rate, \
-    calculate_MTTR
+    calculate_MTTR, calculate_timeseries, metric_sketches
+from git_metrics_release_lead_time import RepositorySnapshot, \
+    commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry
+from metrics_api import four_metrics, lead_times, open_branches_frame, open_branches_history_frame, \
+    release_lead_time_chunks, release_lead_time_frame, timeseries_frame
+from process import mk_run
+from sampling import estimate_lead_time
 
 
 @pytest.fixture(scope="session")
@@ -112,3 +118,107 @@ def test_lead_time_multiple_deploys(git_repo_DDDP):
     mean_lead_time = calculate_lead_time(git_repo_DDDP.working_dir, "FOO*", 1548321540)
     assert mean_lead_time == "N/A"
 
+
+
+def test_all_metrics_list_tags_once(git_repo_DDDP):
+    commands = []
+    run_git = mk_run(git_repo_DDDP.working_dir)
+
+    def run(cmd, **kwargs):
+        commands.append(cmd[1])
+        return run_git(cmd, **kwargs)
+
+    snapshot = RepositorySnapshot(run)
+    calculate_lead_time(git_repo_DDDP.working_dir, "D-*", 0, snapshot)
+    calculate_deploy_interval(git_repo_DDDP.working_dir, "D-*", 0, 1548322020, snapshot)
+    calculate_change_fail_rate(git_repo_DDDP.working_dir, "D-*", "P-*", 0, snapshot)
+    calculate_MTTR(git_repo_DDDP.working_dir, "D-*", "P-*", 0, snapshot)
+    assert commands.count("for-each-ref") == 1
+
+
+def test_timeseries_matches_metrics_in_each_window(git_repo_DDDP):
+    snapshot = RepositorySnapshot(mk_run(git_repo_DDDP.working_dir))
+    rows = calculate_timeseries(snapshot, "D-*", "P-*", 1548321420, 1548322020, 300, 300)
+    # D-0.0.1 deployed at 10:21 in the first window, D-0.0.2 at 10:26 in the second one
+    assert [(start, end, lead_time) for start, end, lead_time, *_ in rows] == [
+        (1548321420, 1548321720, 60),
+        (1548321720, 1548322020, 180),
+    ]
+    # The patch tag itself is dated the day after, so it is not counted as a failed change in this window
+    assert rows[1][3:] == (300, 0, 300)
+
+
+def test_cherry_rows_in_tag_order_with_concurrent_tag_pairs(git_repo_DDDP):
+    run = mk_run(git_repo_DDDP.working_dir)
+    rows = list(commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry(run, lambda tag: True))
+    assert rows
+    assert list(commit_author_time_tag_author_time_and_from_to_tag_name_with_cherry(run, lambda tag: True, jobs=3)) == rows
+
+
+def test_metric_sketches_of_every_release_outage_and_deploy(git_repo_DDDP):
+    snapshot = RepositorySnapshot(mk_run(git_repo_DDDP.working_dir))
+    sketches = metric_sketches(snapshot, "D-*", "P-*", 1548321540)
+    # Lead times are 60, 240 and 120 seconds, as in test_lead_time_multiple_deploys
+    assert (sketches["lead_time"].count, sketches["lead_time"].mean(), sketches["lead_time"].quantile(0.5)) == (3, 140, 120)
+    assert sketches["recovery_time"].mean() == 5*60
+    assert sketches["deploy_interval"].count == 1
+
+
+def test_lead_time_estimate_from_every_release_is_exact(git_repo_DDDP):
+    estimate = estimate_lead_time(mk_run(git_repo_DDDP.working_dir), lambda tag: tag.startswith("D-"), 1548321540,
+                                  time_budget=60)
+    mean, p50, *_ = estimate.estimates
+    assert (estimate.commits, estimate.releases_read, estimate.releases) == (3, 2, 2)
+    assert mean.value == mean.low == mean.high == 140
+    assert p50.value == 120
+
+
+def test_api_returns_release_lead_times_as_frames_and_arrays(git_repo_DDDP):
+    path = git_repo_DDDP.working_dir
+    frame = release_lead_time_frame(path, "D-*", 1548321540)
+    # Lead times are 60, 240 and 120 seconds, as in test_lead_time_multiple_deploys
+    assert (frame.tag_time - frame.commit_time).tolist() == [60, 240, 120]
+    assert frame.tag.tolist() == ["D-0.0.1", "D-0.0.2", "D-0.0.2"]
+    assert lead_times(path, "D-*", 1548321540).dtype == "int64"
+    assert lead_times(path, "D-*", 1548321540).tolist() == [60, 240, 120]
+    chunks = list(release_lead_time_chunks(path, "D-*", 1548321540, chunk_size=1))
+    assert [len(chunk) for chunk in chunks] == [1, 2]
+    assert [row for chunk in chunks for row in chunk.values.tolist()] == frame.values.tolist()
+
+
+def test_api_metrics_are_numbers_or_none(git_repo_DDDP):
+    path = git_repo_DDDP.working_dir
+    assert four_metrics(path, "D-*", "P-*", 0, now=1548322020) == {
+        "lead_time": calculate_lead_time(path, "D-*", 0),
+        "deploy_interval": calculate_deploy_interval(path, "D-*", 0, 1548322020),
+        "change_fail_rate": calculate_change_fail_rate(path, "D-*", "P-*", 0),
+        "recovery_time": 5*60,
+    }
+    assert set(four_metrics(path, "X-*", "X-*").values()) == {None}
+    frame = timeseries_frame(path, "D-*", "P-*", 1548321420, 1548322020, 300)
+    assert frame.lead_time.tolist() == [60, 180]
+    assert frame.recovery_time.isna().tolist() == [True, False]
+
+
+def test_api_open_branches_without_remote_branches(git_repo_DDDP):
+    path = git_repo_DDDP.working_dir
+    assert open_branches_frame(path).empty
+    with pytest.raises(LookupError):
+        open_branches_history_frame(path)
+
+
+@pytest.mark.parametrize("backend", ["subprocess", "in-process", "compare"])
+def test_api_sees_a_deploy_tagged_between_calls(tmp_path, backend):
+    git_repo = Repo.init(str(tmp_path))
+    create_and_commit_file(git_repo, "file_zero", "initial commit", "Thu Jan 24 10:17:00 2019 +0100")
+    create_tag_with_date(git_repo, 'D-0.0.0', '0.0.0 deploy tag', "Thu Jan 24 10:18:00 2019 +0100")
+    create_and_commit_file(git_repo, "file_one", "second commit", "Thu Jan 24 10:20:00 2019 +0100")
+    create_tag_with_date(git_repo, 'D-0.0.1', '0.0.1 deploy tag', "Thu Jan 24 10:21:00 2019 +0100")
+    path = git_repo.working_dir
+    assert release_lead_time_frame(path, "D-*", backend=backend).tag.tolist() == ["D-0.0.1"]
+    create_and_commit_file(git_repo, "file_two", "third commit", "Thu Jan 24 10:22:00 2019 +0100")
+    create_tag_with_date(git_repo, 'D-0.0.2', '0.0.2 deploy tag', "Thu Jan 24 10:26:00 2019 +0100")
+    frame = release_lead_time_frame(path, "D-*", backend=backend)
+    assert frame.tag.tolist() == ["D-0.0.1", "D-0.0.2"]
+    assert (frame.tag_time - frame.commit_time).tolist() == [60, 240]
+    assert lead_times(path, "D-*", backend=backend).tolist() == [60, 240]
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import threading
+from fnmatch import fnmatch
+from functools import partial
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from benchmark import generate_repository
+from git_metrics_release_lead_time import RepositorySnapshot
+from metrics_server import ENDPOINTS, serve, warm_repositories
+from process import mk_run
+
+
+@pytest.fixture
+def server(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    generate_repository(repo_dir, commits=60, deploy_every=10, patch_every=2, branches=2, merge_every=4)
+    server = serve(warm_repositories([repo_dir]), ("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield repo_dir, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    with urlopen(url) as response:
+        return json.load(response)
+
+
+def release_rows(repo_dir):
+    return [list(row) + ["repo"] for row in RepositorySnapshot(mk_run(repo_dir)).release_rows(partial(fnmatch, pat="D-*"))]
+
+
+def test_release_rows_follow_new_tags(server):
+    repo_dir, url = server
+    assert get(f"{url}/repos") == ["repo"]
+    assert get(f"{url}/repos/repo/release-lead-time?tag-pattern=D-*")["rows"] == release_rows(repo_dir)
+    env = {"GIT_AUTHOR_DATE": "@1600000000 +0000", "GIT_COMMITTER_DATE": "@1600000000 +0000"}
+    git = partial(subprocess.run, cwd=repo_dir, env=dict(os.environ, **env), check=True)
+    git(["git", "-c", "user.name=a", "-c", "user.email=a@example.com", "commit", "-q", "--allow-empty", "-m", "new"])
+    git(["git", "-c", "user.name=a", "-c", "user.email=a@example.com", "tag", "-a", "D-7", "-m", "D-7"])
+    rows = get(f"{url}/repos/repo/release-lead-time?tag-pattern=D-*")["rows"]
+    assert rows == release_rows(repo_dir)
+    assert rows[-1] == [1600000000, 1600000000, "D-6", "D-7", "repo"]
+
+
+def test_metrics_and_errors(server):
+    _repo_dir, url = server
+    metrics = get(f"{url}/repos/repo/metrics?deploy-tag-pattern=D-*&patch-tag-pattern=P-*")
+    assert metrics["change_fail_rate"] == 50.0
+    assert metrics["recovery_time"] == 600
+    assert len(get(f"{url}/repos/repo/open-branches")["rows"]) == 6
+    with pytest.raises(Exception, match="404"):
+        get(f"{url}/repos/other/metrics")
+    with pytest.raises(Exception, match="400"):
+        get(f"{url}/repos/repo/open-branches?master-branch=origin/other")
+
+
+def test_unexpected_errors_are_answered_in_json(server, monkeypatch):
+    _repo_dir, url = server
+
+    def missing_commit(repository, query):
+        raise LookupError("no commit for v9")
+
+    def broken(repository, query):
+        raise RuntimeError("disk went away")
+
+    monkeypatch.setitem(ENDPOINTS, "missing", missing_commit)
+    monkeypatch.setitem(ENDPOINTS, "broken", broken)
+    for endpoint, status, error in (("missing", 404, "no commit for v9"), ("broken", 500, "RuntimeError: disk went away")):
+        with pytest.raises(HTTPError) as raised:
+            get(f"{url}/repos/repo/{endpoint}")
+        assert raised.value.code == status
+        assert json.load(raised.value) == {"error": error}
@@ -0,0 +1,70 @@
+import pytest
+
+from git_metrics_open_branches import (
+    commit_author_time_and_branch_ref, history_dates, open_branches_history, plot_open_branches_metrics
+)
+from git_backend import REMOTE_BRANCHES_WITH_SHA_CMD
+
+
+def test_shared_commits_are_reported_for_every_branch(fake_run):
+    outputs = {
+        tuple(REMOTE_BRANCHES_WITH_SHA_CMD): [
+            "origin/feature c",
+            "origin/fix b",
+        ],
+        ("git", "log", "--topo-order", "--format=%H %at %P", "--stdin"): [
+            "c 30 b",
+            "b 20 a",
+        ],
+    }
+    result = commit_author_time_and_branch_ref(
+        fake_run(outputs),
+        'origin/master'
+    )
+    assert list(result) == [
+        (30, "origin/feature"),
+        (20, "origin/feature"),
+        (20, "origin/fix"),
+    ]
+
+
+def test_open_branches_history_counts_commits_until_master_merges_them(fake_run):
+    outputs = {
+        tuple(REMOTE_BRANCHES_WITH_SHA_CMD): [
+            "origin/feature f1",
+            "origin/master m3",
+        ],
+        ("git", "log", "--topo-order", "--format=%H %at %ct %P", "--stdin"): [
+            "m3 500 500 m2",
+            "f1 400 400 f0",
+            "f0 350 350 m2",
+            "m2 250 320 m1 b1",
+            "b1 150 150 m1",
+            "m1 100 100",
+        ],
+    }
+    # The merge m2 was authored at 250 but only landed at 320, when it was committed
+    result = open_branches_history(
+        fake_run(outputs),
+        'origin/master',
+        [100, 200, 300, 450],
+    )
+    assert result == [
+        (100, 0, "N/A", "N/A", "N/A", "N/A"),
+        (200, 1, 50.0, 50, 50, 50),
+        (300, 1, 150.0, 150, 150, 150),
+        (450, 2, 75.0, 50, 100, 100),
+    ]
+
+
+def test_history_dates_end_now():
+    assert history_dates(0, 100, 30) == [10, 40, 70, 100]
+    with pytest.raises(ValueError):
+        history_dates(0, 100, 0)
+
+
+def test_plot_open_branches_to_file_with_quantile_bars(tmp_path):
+    output = tmp_path / "open-branches.png"
+    data = [(864000, t, f"origin/branch-{t % 3}", "repo") for t in range(0, 86400, 100)]
+    plot_open_branches_metrics(data, str(output), max_points=100)
+    assert output.stat().st_size > 0
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+import patch_ids
+from patch_ids import CACHE_FILE, async_unpicked_commits, unpicked_commits, unpicked_commits_of_pairs
+from process import mk_run
+
+ENVIRONMENT = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+    GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com",
+)
+
+
+def git(repo_dir, *args):
+    return subprocess.run(["git", *args], cwd=repo_dir, env=ENVIRONMENT, check=True, capture_output=True, text=True)
+
+
+def commit_file(repo_dir, name, content):
+    with open(os.path.join(repo_dir, name), "w") as f:
+        f.write(content)
+    git(repo_dir, "add", name)
+    git(repo_dir, "commit", "-q", "-m", f"{name} {content}")
+
+
+def cherry(repo_dir, upstream, head):
+    return [line[2:] for line in git(repo_dir, "cherry", upstream, head).stdout.splitlines() if line[0] == "+"]
+
+
+@pytest.fixture
+def diverged_repo(tmp_path):
+    """master and side share a root, side has a change that master cherry-picked, and both have an empty commit."""
+    repo_dir = str(tmp_path / "repo")
+    git(str(tmp_path), "init", "-q", "-b", "master", repo_dir)
+    commit_file(repo_dir, "a", "root")
+    git(repo_dir, "checkout", "-q", "-b", "side")
+    commit_file(repo_dir, "b", "picked")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "empty on side")
+    commit_file(repo_dir, "c", "only on side")
+    git(repo_dir, "checkout", "-q", "master")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "empty on master")
+    git(repo_dir, "cherry-pick", "side~2")
+    commit_file(repo_dir, "d", "only on master")
+    patch_ids._caches.clear()
+    yield repo_dir
+    patch_ids._caches.clear()
+
+
+def test_unpicked_commits_like_git_cherry(diverged_repo):
+    run = mk_run(diverged_repo)
+    for upstream, head in [("master", "side"), ("side", "master"), ("master~3", "side"), ("side", "side")]:
+        assert unpicked_commits(run, upstream, head) == cherry(diverged_repo, upstream, head)
+    assert len(unpicked_commits(run, "master", "side")) == 1
+
+
+def test_patch_ids_are_saved_and_reused(diverged_repo):
+    run = mk_run(diverged_repo)
+    pairs = [("master", "side"), ("side", "master")]
+    expected = list(unpicked_commits_of_pairs(run, pairs))
+    with open(os.path.join(diverged_repo, ".git", CACHE_FILE)) as f:
+        assert len(f.readlines()) == 6
+    patch_ids._caches.clear()
+    commands = []
+
+    def counting_run(cmd, **kwargs):
+        commands.append(cmd[1])
+        return run(cmd, **kwargs)
+
+    counting_run.keywords = run.keywords
+    assert list(unpicked_commits_of_pairs(counting_run, pairs)) == expected
+    assert "patch-id" not in commands and "log" not in commands
+
+
+def test_async_unpicked_commits_like_git_cherry(diverged_repo):
+    run = mk_run(diverged_repo)
+    assert asyncio.run(async_unpicked_commits(run, "master", "side")) == cherry(diverged_repo, "master", "side")
+
+
+def test_line_cut_short_is_diffed_again(diverged_repo):
+    run = mk_run(diverged_repo)
+    expected = unpicked_commits(run, "master", "side")
+    path = os.path.join(diverged_repo, ".git", CACHE_FILE)
+    with open(path) as f:
+        saved = f.read()
+    with open(path, "w") as f:
+        f.write(saved[:-10])
+    patch_ids._caches.clear()
+    assert unpicked_commits(run, "master", "side") == expected
@@ -1,7 +1,10 @@
+import asyncio
+import json
 import os
+import subprocess
 from subprocess import Popen, PIPE
 
-from process import proc_to_stdout
+from process import proc_to_stdout, mk_run, object_lookup, close_object_lookups, trace_to, run_in_order
 
 
 def test_proc_to_pocess():
@@ -12,3 +15,52 @@ def test_proc_to_pocess():
         shell=(os.name == 'nt')
     )
     assert list(line.strip('"\n') for line in proc_to_stdout(proc)) == ['hello world']
+
+
+def test_object_lookup_author_time(tmp_path):
+    env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+               GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com",
+               GIT_AUTHOR_DATE="@1548321600 +0100")
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    subprocess.run(["git", "commit", "-q", "--allow-empty", "-m", "empty"], cwd=str(tmp_path), env=env, check=True)
+    lookup = object_lookup(mk_run(str(tmp_path)))
+    assert lookup.author_time("HEAD") == 1548321600
+    assert lookup is object_lookup(mk_run(str(tmp_path)))
+    close_object_lookups()
+
+
+def test_trace_to_records_git_commands(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    subprocess.run(["git", "init", "-q", repo_dir], check=True)
+    trace_file = str(tmp_path / "trace.json")
+    with trace_to(trace_file):
+        run = mk_run(repo_dir)
+        assert list(proc_to_stdout(run(["git", "rev-parse", "--git-dir"]))) == [".git\n"]
+        assert list(proc_to_stdout(run(["git", "log"]))) == []
+        with trace_to(None):
+            pass
+        assert mk_run(repo_dir) is run
+    assert mk_run(repo_dir) is not run
+    with open(trace_file) as f:
+        trace = json.load(f)
+    assert [command["argv"][1] for command in trace["commands"]] == ["rev-parse", "log"]
+    assert trace["commands"][0]["bytes"] == 5
+    assert trace["commands"][0]["lines"] == 1
+    assert trace["commands"][1]["exit_status"] == 128
+    assert trace["summary"]["log"]["failures"] == 1
+    assert trace["summary"]["rev-parse"]["count"] == 1
+
+
+def test_run_in_order_keeps_order_with_bounded_concurrency():
+    running = []
+    most_running = []
+
+    async def query(i):
+        running.append(i)
+        most_running.append(len(running))
+        await asyncio.sleep(0.001 * (5 - i % 5))
+        running.remove(i)
+        return i
+
+    assert list(run_in_order((query(i) for i in range(20)), 4)) == list(range(20))
+    assert max(most_running) == 4
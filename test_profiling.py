@@ -0,0 +1,53 @@
+import pstats
+import time
+
+from profiling import OTHER, current_profile, profile_to, stage, staged
+
+
+@staged("statistics")
+def sleep_in_statistics():
+    time.sleep(0.02)
+
+
+def test_time_goes_to_the_innermost_stage(tmp_path, capsys):
+    with profile_to(str(tmp_path / "run.prof")) as profile:
+        with stage("range computation"):
+            time.sleep(0.02)
+            sleep_in_statistics()
+            sleep_in_statistics()
+            time.sleep(0.02)
+    stages = profile.stages
+    assert list(stages) == [OTHER, "range computation", "statistics"]
+    assert stages["range computation"].calls == 1 and stages["statistics"].calls == 2
+    assert 0.04 <= stages["range computation"].wall_time < 0.08
+    assert 0.04 <= stages["statistics"].wall_time < 0.08
+    assert current_profile() is None
+    summary = capsys.readouterr().err
+    assert summary.splitlines()[0].split() == ["stage", "calls", "seconds", "share", "peak", "MiB"]
+    assert summary.splitlines()[-1].split()[0] == "total"
+
+
+def test_peak_memory_of_each_stage(tmp_path, capsys):
+    with profile_to(str(tmp_path / "run.prof")) as profile:
+        with stage("tag listing"):
+            big = bytearray(20 * 2 ** 20)
+            del big
+        with stage("output"):
+            pass
+    assert profile.stages["tag listing"].peak_memory >= 20 * 2 ** 20
+    assert profile.stages["output"].peak_memory < 2 ** 20
+
+
+def test_profile_dump_can_be_read_with_pstats(tmp_path, capsys):
+    with profile_to(str(tmp_path / "run.prof")):
+        sleep_in_statistics()
+    functions = {function for _file, _line, function in pstats.Stats(str(tmp_path / "run.prof")).stats}
+    assert "sleep_in_statistics" in functions
+
+
+def test_stages_do_nothing_without_profiling():
+    with profile_to(None) as profile:
+        sleep_in_statistics()
+        with stage("output"):
+            pass
+    assert profile is None and current_profile() is None
@@ -0,0 +1,31 @@
+import pickle
+
+from records import RELEASE_LEAD_TIME_COLUMNS, RecordBatch
+
+
+def test_rows_round_trip_with_interned_names():
+    rows = [(1, 10, "D-1", "D-2", "repo"), (2, 10, "D-1", "D-2", "repo"), (11, 20, "D-2", "D-3", "repo")]
+    batch = RecordBatch.from_rows("release-lead-time", rows)
+    assert list(batch) == rows
+    assert batch.strings == ["D-1", "D-2", "repo", "D-3"]
+    assert list(pickle.loads(pickle.dumps(batch))) == rows
+
+
+def test_extend_release_and_branch():
+    releases = RecordBatch("release-lead-time")
+    releases.extend_release([3, 2], 10, "D-1", "D-2", "repo")
+    releases.extend_release([], 20, "D-2", "D-3", "repo")
+    assert list(releases) == [(3, 10, "D-1", "D-2", "repo"), (2, 10, "D-1", "D-2", "repo")]
+    branches = RecordBatch("open-branches")
+    branches.extend_branch(100, [5, 6], "origin/feature", "repo")
+    assert list(branches) == [(100, 5, "origin/feature", "repo"), (100, 6, "origin/feature", "repo")]
+
+
+def test_filtered_and_to_frame():
+    batch = RecordBatch.from_rows("release-lead-time", [(1, 10, "D-1", "D-2", "repo"), (11, 20, "D-2", "D-3", "repo")])
+    later = batch.filtered(tag_time > 10 for tag_time in batch.times_b)
+    assert list(later) == [(11, 20, "D-2", "D-3", "repo")]
+    df = later.to_frame(RELEASE_LEAD_TIME_COLUMNS)
+    assert df["commit_time"].dtype == "int64"
+    assert df["tag"].tolist() == ["D-3"]
+    assert RecordBatch("open-branches").to_frame(("now", "time", "ref", "repo_name")).empty
@@ -1,4 +1,4 @@
-from recovery_time import find_outages, split_sequence, Deployment, find_is_patch
+from recovery_time import find_outages, iter_outages, split_sequence, Deployment, find_is_patch
 
 deployment_zero = Deployment(False, 0)
 deployment_two = Deployment(False, 2)
@@ -23,6 +23,22 @@ def test_one_outage_two_patches():
     assert results == [(deployment_zero, patch_two)]
 
 
+def test_deployments_with_equal_time_are_told_apart():
+    patch_at_zero = Deployment(True, 0)
+    deployment_at_zero = Deployment(False, 0)
+    results = find_outages([patch_at_zero, deployment_at_zero, Deployment(True, 0)])
+    assert len(results) == 1
+    assert results[0][0] is deployment_at_zero
+
+
+def test_iter_outages_streams_long_histories():
+    deployments = (Deployment(i % 4 != 0, i) for i in range(400000))
+    outages = iter_outages(deployments)
+    start, end = next(outages)
+    assert (start.time, end.time) == (0, 3)
+    assert sum(end.time - start.time for start, end in outages) == 3 * 99999
+
+
 def test_split_sequence():
     results = split_sequence([deployment_zero, patch_one, deployment_two, patch_three, patch_four])
     assert list(results) == [[patch_one], [patch_three, patch_four]]
@@ -4,6 +4,9 @@ from contextlib import contextmanager
 from git_metrics_release_lead_time import parse_tags_with_date
 from git_metrics_release_lead_time import tags_with_author_date
 from git_metrics_release_lead_time import fetch_tags_and_sha
+from git_metrics_release_lead_time import plot_release_lead_time_metrics
+from git_metrics_release_lead_time import commit_author_time_tag_author_time_and_from_to_tag_name
+from git_backend import TAGS_WITH_AUTHOR_DATE_AND_COMMIT_SHA_CMD
 import git_metrics_release_lead_time
 
 
@@ -36,4 +39,33 @@ def test_fetch_tags_and_sha():
     ]), lambda _: True)
     assert list(result) == [
         ("annotated-tag", "sha")
-    ]
\ No newline at end of file
+    ]
+
+def test_release_commits_go_to_first_tag_containing_them(fake_run):
+    outputs = {
+        tuple(TAGS_WITH_AUTHOR_DATE_AND_COMMIT_SHA_CMD): [
+            "D-1 100 a",
+            "D-2 200 c",
+            "D-3 300 e",
+        ],
+        ("git", "log", "--topo-order", "--format=%H %at %P", "--stdin"): [
+            "e 50 d c",
+            "d 40 b",
+            "c 30 b",
+        ],
+    }
+    result = commit_author_time_tag_author_time_and_from_to_tag_name(
+        fake_run(outputs),
+        lambda tag: True,
+    )
+    assert list(result) == [
+        (30, 200, "D-1", "D-2"),
+        (40, 300, "D-2", "D-3"),
+    ]
+
+
+def test_plot_release_lead_time_to_file(tmp_path):
+    output = tmp_path / "release-lead-time.svg"
+    data = [(t, 86400 * (t // 1000 + 1), "D-0", f"D-{t // 1000 + 1}", "repo") for t in range(0, 5000, 10)]
+    plot_release_lead_time_metrics(data, str(output), max_points=100)
+    assert output.read_text().startswith("<?xml")
@@ -0,0 +1,86 @@
+import os
+import random
+import subprocess
+
+import pytest
+
+from git_metrics_release_lead_time import RepositorySnapshot, releases_from, reported_tags
+from process import mk_run
+from sampling import estimate, sample_releases
+from sketch import nearest_rank
+
+
+def releases_of(rng, count):
+    """Sorted lead times of `count` releases that differ in size and in how long their commits wait."""
+    releases = []
+    for _ in range(count):
+        wait = rng.randrange(600, 6000)
+        releases.append(sorted(rng.randrange(wait) for _ in range(rng.randrange(1, 60))))
+    return releases
+
+
+def test_every_release_read_gives_exact_estimates():
+    releases = [[60, 120], [240], [30, 90, 600]]
+    mean, p50, p90, p99 = estimate(releases, population=3)
+    assert mean.value == mean.low == mean.high == pytest.approx(1140 / 6)
+    assert (p50.value, p50.low, p50.high) == (90, 90, 90)
+    assert p99.value == 600
+
+
+def test_interval_unknown_from_a_single_release_of_many():
+    mean, *percentiles = estimate([[60, 120]], population=10)
+    assert mean.value == 90
+    assert mean.low == mean.high == "N/A"
+
+
+def test_no_estimates_without_commits():
+    assert estimate([[], []], population=5) == []
+
+
+def test_intervals_cover_the_exact_values_most_of_the_time():
+    rng = random.Random(7)
+    population = releases_of(rng, 300)
+    every_commit = sorted(lead_time for lead_times in population for lead_time in lead_times)
+    exact_mean = sum(every_commit) / len(every_commit)
+    exact_p90 = nearest_rank(every_commit, 0.9)
+    covered_mean = covered_p90 = 0
+    for _ in range(100):
+        mean, _p50, p90, _p99 = estimate(rng.sample(population, 40), len(population))
+        covered_mean += mean.low <= exact_mean <= mean.high
+        covered_p90 += p90.low <= exact_p90 <= p90.high
+    assert covered_mean >= 85
+    assert covered_p90 >= 85
+
+
+def test_releases_of_tags_off_the_line_of_history_match_the_walk_of_all_tags(tmp_path):
+    """D-2 is tagged on a branch that D-3 does not have, so D-4 has to leave out D-2 as well as D-3."""
+    repo_dir = str(tmp_path)
+    clock = iter(range(1100, 3000, 100))
+
+    def git(*args):
+        date = f"@{next(clock)} +0000"
+        env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com", GIT_COMMITTER_NAME="a",
+                   GIT_COMMITTER_EMAIL="a@example.com", GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+        subprocess.run(("git",) + args, cwd=repo_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    git("init", "-q", "-b", "master")
+    git("commit", "-q", "--allow-empty", "-m", "one")
+    git("tag", "-a", "D-1", "-m", "D-1")
+    git("checkout", "-q", "-b", "feature")
+    git("commit", "-q", "--allow-empty", "-m", "f1")
+    git("commit", "-q", "--allow-empty", "-m", "f2")
+    git("tag", "-a", "D-2", "-m", "D-2")
+    git("checkout", "-q", "master")
+    git("commit", "-q", "--allow-empty", "-m", "m1")
+    git("tag", "-a", "D-3", "-m", "D-3")
+    git("merge", "-q", "--no-ff", "-m", "merge", "feature")
+    git("commit", "-q", "--allow-empty", "-m", "m2")
+    git("tag", "-a", "D-4", "-m", "D-4")
+    run = mk_run(repo_dir)
+    tags, first = reported_tags(RepositorySnapshot(run), lambda tag: True, 0)
+    exact = [sorted(date - time for time in times) for _old_tag, _tag, date, times in releases_from(run, tags, first)]
+    indices = list(range(first, len(tags)))
+    order = random.Random(1).sample(indices, len(indices))
+    sampled = sample_releases(run, tags, indices, None, None, random.Random(1))
+    assert [exact[index - first] for index in order] == sampled
+    assert exact == [[100, 200], [100], [100]]
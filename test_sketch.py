@@ -0,0 +1,62 @@
+import json
+import random
+
+import pytest
+
+from sketch import QuantileSketch
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[max(0, int(q * len(values) + 0.5) - 1)]
+
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch()
+    assert sketch.mean() == "N/A"
+    assert sketch.quantile(0.5) == "N/A"
+
+
+def test_small_sketch_is_exact():
+    sketch = QuantileSketch()
+    sketch.extend([60, 240, 120])
+    assert sketch.mean() == 140
+    assert sketch.quantile(0.5) == 120
+    assert sketch.quantile(0) == 60
+    assert sketch.quantile(1) == 240
+
+
+def test_quantiles_within_rank_error_and_memory_bounded():
+    rng = random.Random(4)
+    values = [rng.randrange(0, 10**6) for _ in range(100000)]
+    sketch = QuantileSketch()
+    sketch.extend(values)
+    assert sketch.count == len(values)
+    assert sketch.mean() == sum(values) / len(values)
+    assert sum(len(samples) for samples in sketch.levels) < 1000
+    ordered = sorted(values)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        rank = ordered.index(sketch.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.02
+
+
+def test_merged_sketches_answer_like_one_sketch():
+    rng = random.Random(5)
+    first, second = [rng.randrange(0, 1000) for _ in range(20000)], [rng.randrange(500, 5000) for _ in range(30000)]
+    a, b = QuantileSketch(), QuantileSketch()
+    a.extend(first)
+    b.extend(second)
+    merged = QuantileSketch.from_dict(json.loads(json.dumps(a.to_dict()))).merge(b)
+    assert merged.count == 50000
+    assert merged.total == sum(first) + sum(second)
+    assert (merged.min, merged.max) == (min(first + second), max(first + second))
+    for q in (0.5, 0.9):
+        assert abs(merged.quantile(q) - exact_quantile(first + second, q)) < 0.02 * 5000
+
+
+def test_sketches_of_different_k_do_not_merge():
+    a, b = QuantileSketch(k=100), QuantileSketch(k=200)
+    b.extend(range(1000))
+    with pytest.raises(ValueError):
+        a.merge(b)
+    assert a.count == 0